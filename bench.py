@@ -0,0 +1,348 @@
+# ឯកសារ: bench.py
+# វាស់ល្បឿនរបស់មុខងារបំប្លែងនីមួយៗក្នុង main.py ដោយមិនចាំបាច់មាន Telegram Bot ពិតប្រាកដ
+#
+# ឧទាហរណ៍៖
+#   python bench.py                                  # គ្រប់ Scenario, 5 ដង, ម្ដងមួយៗ
+#   python bench.py --runs 20 --concurrency 4 --only pdf_to_img,merge_pdf
+#   python bench.py --compare bench-results/old.json
+import argparse
+import asyncio
+import itertools
+import json
+import os
+import platform
+import resource
+import shutil
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+import zipfile
+
+# ការវាស់ល្បឿនម៉ាស៊ីនបំប្លែង មិនមែនដែនកំណត់ល្បឿនផ្ញើរបស់ Telegram ទេ
+os.environ.setdefault("CHAT_SEND_INTERVAL", "0")
+os.environ.setdefault("GLOBAL_SENDS_PER_SECOND", "1000000")
+os.environ.setdefault("LOG_FORMAT", "text")
+os.environ.setdefault("METRICS_PORT", "0")
+
+import main  # noqa: E402
+from PIL import Image, ImageDraw  # noqa: E402
+
+# --- Bot ក្លែងក្លាយ (កត់ត្រាការហៅ ជំនួសឱ្យការផ្ញើទៅកាន់បណ្ដាញ) ---
+
+class FakeFile:
+    def __init__(self, file_id):
+        self.file_id = file_id
+
+class FakeMessage:
+    _ids = itertools.count(1)
+
+    def __init__(self, chat_id, kind=None):
+        self.message_id = next(self._ids)
+        self.chat_id = chat_id
+        self.photo = [FakeFile(f"photo{self.message_id}")] if kind == 'photo' else None
+        self.audio = FakeFile(f"audio{self.message_id}") if kind == 'audio' else None
+        self.video = FakeFile(f"video{self.message_id}") if kind == 'video' else None
+        self.document = FakeFile(f"document{self.message_id}") if kind == 'document' else None
+
+    async def edit_text(self, text, **kwargs):
+        return self
+
+    async def reply_text(self, text, **kwargs):
+        return FakeMessage(self.chat_id)
+
+def _payload_size(payload):
+    """ទំហំរបស់ឯកសារដែលនឹងត្រូវផ្ញើ (bytes, Path, file object ឬ InputMedia)"""
+    media = getattr(payload, 'media', payload)
+    if isinstance(media, (bytes, bytearray)):
+        return len(media)
+    if isinstance(media, os.PathLike):
+        return os.path.getsize(media)
+    if hasattr(media, 'read'):
+        data = media.read()
+        if hasattr(media, 'close'): media.close()
+        return len(data)
+    input_file = getattr(media, 'input_file_content', None)
+    return len(input_file) if input_file else 0
+
+class FakeBot:
+    """Bot ក្លែងក្លាយដែលកត់ត្រាការហៅ ហើយឆ្លើយប៊ូតុងជម្រើស (ask_choice/ask_selection) ដោយស្វ័យប្រវត្តិ"""
+
+    def __init__(self):
+        self.calls = []
+        self.bytes_sent = 0
+
+    def _record(self, method, chat_id, size=0):
+        self.calls.append(method)
+        self.bytes_sent += size
+
+    async def _send(self, method, kind, chat_id, payload):
+        self._record(method, chat_id, _payload_size(payload))
+        return FakeMessage(chat_id, kind)
+
+    async def send_document(self, chat_id, document, **kwargs):
+        return await self._send('send_document', 'document', chat_id, document)
+
+    async def send_photo(self, chat_id, photo, **kwargs):
+        return await self._send('send_photo', 'photo', chat_id, photo)
+
+    async def send_audio(self, chat_id, audio, **kwargs):
+        return await self._send('send_audio', 'audio', chat_id, audio)
+
+    async def send_video(self, chat_id, video, **kwargs):
+        return await self._send('send_video', 'video', chat_id, video)
+
+    async def send_media_group(self, chat_id, media, **kwargs):
+        self._record('send_media_group', chat_id, sum(_payload_size(item) for item in media))
+        kind = 'photo' if media and type(media[0]).__name__ == 'InputMediaPhoto' else 'document'
+        return [FakeMessage(chat_id, kind) for _ in media]
+
+    async def send_message(self, chat_id, text, reply_markup=None, **kwargs):
+        self._record('send_message', chat_id)
+        if reply_markup is not None:
+            asyncio.get_running_loop().call_soon(self._answer, reply_markup)
+        return FakeMessage(chat_id)
+
+    def _answer(self, reply_markup):
+        # ជ្រើសរើសជម្រើសដំបូងរបស់ ask_choice ឬ "ទាំងអស់" របស់ ask_selection
+        data = reply_markup.inline_keyboard[0][0].callback_data
+        kind, token, value = data.split('_', 2)
+        if kind == 'choice' and token in main._pending_choices:
+            future = main._pending_choices[token]
+        elif kind == 'pick' and token in main._pending_selections:
+            future = main._pending_selections[token]['future']
+            value = None
+        else:
+            return
+        if not future.done():
+            future.set_result(value)
+
+    async def edit_message_text(self, text, chat_id=None, message_id=None, **kwargs):
+        self._record('edit_message_text', chat_id)
+        return True
+
+    async def delete_message(self, chat_id, message_id, **kwargs):
+        self._record('delete_message', chat_id)
+        return True
+
+class FakeContext:
+    def __init__(self):
+        self.bot = FakeBot()
+        self.user_data = {}
+
+# --- ឯកសារសាកល្បង (Fixtures) ---
+
+def make_image(path, width, height, seed=0):
+    image = Image.new('RGB', (width, height), 'white')
+    draw = ImageDraw.Draw(image)
+    for i in range(0, height, max(20, height // 40)):
+        draw.text((20, i), f"Benchmark line {seed}-{i} ABCDEFGHIJKLMNOPQRSTUVWXYZ 0123456789", fill='black')
+    draw.rectangle((width // 4, height // 4, width // 2, height // 2), outline='blue', width=5)
+    image.save(path)
+    return path
+
+def make_pdf(path, pages, width=1240, height=1754):
+    images = []
+    for page in range(pages):
+        image = Image.new('RGB', (width, height), 'white')
+        draw = ImageDraw.Draw(image)
+        for y in range(60, height - 60, 40):
+            draw.text((60, y), f"Page {page + 1} - The quick brown fox jumps over the lazy dog {y}", fill='black')
+        images.append(image)
+    images[0].save(path, "PDF", resolution=150.0, save_all=True, append_images=images[1:])
+    return path
+
+def make_media(path, lavfi_args):
+    subprocess.run([main.FFMPEG_BIN, '-v', 'error', '-y', *lavfi_args, path], check=True)
+    return path
+
+def build_fixtures(root, pdf_pages):
+    """បង្កើតឯកសារសាកល្បងទាំងអស់ម្ដង ហើយត្រឡប់ dict ឈ្មោះ -> ផ្លូវ"""
+    fixtures = {
+        'pdf': make_pdf(os.path.join(root, "doc.pdf"), pdf_pages),
+        'pdf_small': make_pdf(os.path.join(root, "small.pdf"), 2),
+        'image_small': make_image(os.path.join(root, "small.jpg"), 640, 480),
+        'image_medium': make_image(os.path.join(root, "medium.jpg"), 1920, 1080, 1),
+        'image_large': make_image(os.path.join(root, "large.png"), 4000, 3000, 2),
+    }
+    text_paths = []
+    for i in range(20):
+        text_path = os.path.join(root, f"notes_{i}.txt")
+        with open(text_path, 'w') as f:
+            f.write(f"benchmark entry {i}\n" * 5000)
+        text_paths.append(text_path)
+    fixtures['text_files'] = text_paths
+    fixtures['archive'] = os.path.join(root, "bundle.zip")
+    with zipfile.ZipFile(fixtures['archive'], 'w', zipfile.ZIP_DEFLATED) as zipf:
+        for i, text_path in enumerate(text_paths):
+            zipf.write(text_path, f"folder{i % 3}/{os.path.basename(text_path)}")
+        zipf.write(fixtures['image_medium'], "images/medium.jpg")
+    if shutil.which(main.FFMPEG_BIN):
+        fixtures['audio'] = make_media(os.path.join(root, "tone.wav"), ['-f', 'lavfi', '-i', 'sine=frequency=440:duration=20'])
+        fixtures['video'] = make_media(os.path.join(root, "clip.mkv"), [
+            '-f', 'lavfi', '-i', 'testsrc=duration=10:size=1280x720:rate=30',
+            '-f', 'lavfi', '-i', 'sine=frequency=660:duration=10', '-shortest', '-c:v', 'libx264', '-preset', 'ultrafast'])
+    return fixtures
+
+# --- Scenario៖ (ឈ្មោះ) -> អនុគមន៍ដែលហៅ *_task ជាមួយឯកសារដែលបានចម្លងទៅក្នុងថតការងារថ្មី ---
+
+def _copy(workspace, *paths):
+    copies = []
+    for path in paths:
+        target = os.path.join(workspace, os.path.basename(path))
+        shutil.copyfile(path, target)
+        copies.append(target)
+    return copies
+
+def build_scenarios(fixtures):
+    scenarios = {
+        'pdf_to_img': lambda ws, chat, msg, ctx: main.pdf_to_img_task(chat, _copy(ws, fixtures['pdf'])[0], msg, ctx, fmt='jpeg'),
+        'merge_pdf': lambda ws, chat, msg, ctx: main.merge_pdf_task(chat, _copy(ws, fixtures['pdf'], fixtures['pdf_small']), msg, ctx),
+        'split_pdf': lambda ws, chat, msg, ctx: main.split_pdf_task(chat, _copy(ws, fixtures['pdf'])[0], "1-3,5", msg, ctx),
+        'compress_pdf': lambda ws, chat, msg, ctx: main.compress_pdf_task(chat, _copy(ws, fixtures['pdf'])[0], msg, ctx, level='medium'),
+        'img_to_pdf': lambda ws, chat, msg, ctx: main.img_to_pdf_task(
+            chat, _copy(ws, fixtures['image_small'], fixtures['image_medium'], fixtures['image_large']), msg, ctx, page_size='a4'),
+        'img_to_text': lambda ws, chat, msg, ctx: main.img_to_text_task(chat, _copy(ws, fixtures['image_medium'])[0], msg, ctx),
+        'ocr_document': lambda ws, chat, msg, ctx: main.ocr_document_task(chat, _copy(ws, fixtures['pdf_small']), msg, ctx),
+        'create_zip': lambda ws, chat, msg, ctx: main.create_zip_task(chat, _copy(ws, *fixtures['text_files']), msg, ctx),
+        'extract_archive': lambda ws, chat, msg, ctx: main.extract_archive_task(chat, _copy(ws, fixtures['archive'])[0], msg, ctx),
+    }
+    if 'audio' in fixtures:
+        scenarios['audio'] = lambda ws, chat, msg, ctx: main.media_conversion_task(chat, _copy(ws, fixtures['audio'])[0], 'mp3', msg, ctx, media_type='audio')
+        scenarios['video'] = lambda ws, chat, msg, ctx: main.media_conversion_task(chat, _copy(ws, fixtures['video'])[0], 'mp4', msg, ctx, media_type='video')
+    return scenarios
+
+def percentile(values, fraction):
+    ordered = sorted(values)
+    index = min(len(ordered) - 1, max(0, round(fraction * (len(ordered) - 1))))
+    return ordered[index]
+
+def peak_rss_kb():
+    """RSS អតិបរមា (KB) របស់ Process នេះ និង Process កូន (Process Pool, ffmpeg, tesseract)"""
+    return (resource.getrusage(resource.RUSAGE_SELF).ru_maxrss, resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss)
+
+async def run_scenario(name, scenario, runs, concurrency, root):
+    slots = asyncio.Semaphore(concurrency)
+    chat_ids = itertools.count(1)
+    latencies, errors, sent_bytes = [], 0, 0
+
+    async def one_run():
+        nonlocal errors, sent_bytes
+        async with slots:
+            chat_id = next(chat_ids)
+            workspace = tempfile.mkdtemp(prefix=f"{name}_", dir=root)
+            context = FakeContext()
+            scope = main.new_metric_scope(name, f"bench{chat_id}")
+            token = main._metric_scope.set(scope)
+            started = time.perf_counter()
+            try:
+                await scenario(workspace, chat_id, FakeMessage(chat_id), context)
+            except Exception:
+                scope['failed'] = True
+            finally:
+                latencies.append(time.perf_counter() - started)
+                main._metric_scope.reset(token)
+                shutil.rmtree(workspace, ignore_errors=True)
+            errors += scope['failed']
+            sent_bytes += context.bot.bytes_sent
+
+    started = time.perf_counter()
+    await asyncio.gather(*(one_run() for _ in range(runs)))
+    wall = time.perf_counter() - started
+    rss_self, rss_children = peak_rss_kb()
+    return {
+        'runs': runs,
+        'errors': errors,
+        'concurrency': concurrency,
+        'latency_seconds': {
+            'p50': percentile(latencies, 0.50),
+            'p90': percentile(latencies, 0.90),
+            'p99': percentile(latencies, 0.99),
+            'mean': statistics.fmean(latencies),
+            'max': max(latencies),
+        },
+        'throughput_per_second': runs / wall if wall else None,
+        'wall_seconds': wall,
+        'bytes_sent_per_run': sent_bytes / runs,
+        'peak_rss_kb': {'self': rss_self, 'children': rss_children},
+    }
+
+def git_revision():
+    try:
+        return subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], capture_output=True, text=True, check=True,
+                              cwd=os.path.dirname(os.path.abspath(__file__))).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+def compare(current, previous):
+    """បង្ហាញការប្រែប្រួលនៃ p50/p90 និង Throughput ធៀបនឹងលទ្ធផលមុន"""
+    print(f"\nធៀបនឹង {previous.get('revision')} ({previous.get('timestamp')}):")
+    for name, result in current['results'].items():
+        old = previous.get('results', {}).get(name)
+        if not old:
+            continue
+        changes = []
+        for key in ('p50', 'p90'):
+            before, after = old['latency_seconds'][key], result['latency_seconds'][key]
+            if before:
+                changes.append(f"{key} {(after - before) / before * 100:+.1f}%")
+        if old.get('throughput_per_second') and result.get('throughput_per_second'):
+            changes.append(f"throughput {(result['throughput_per_second'] - old['throughput_per_second']) / old['throughput_per_second'] * 100:+.1f}%")
+        print(f"  {name:16} " + ", ".join(changes))
+
+async def run(args):
+    root = tempfile.mkdtemp(prefix="docbot_bench_")
+    try:
+        fixtures = await main.run_io_bound(build_fixtures, root, args.pages)
+        scenarios = build_scenarios(fixtures)
+        selected = args.only.split(',') if args.only else list(scenarios)
+        results = {}
+        for name in selected:
+            if name not in scenarios:
+                print(f"!!! រំលង {name}: មិនមាន Scenario នេះ (ឬ ffmpeg មិនត្រូវបានដំឡើង)")
+                continue
+            # ដំណើរការម្ដងមុនដើម្បីឱ្យ Process Pool និង Library ត្រៀមរួចរាល់
+            await run_scenario(name, scenarios[name], 1, 1, root)
+            results[name] = await run_scenario(name, scenarios[name], args.runs, args.concurrency, root)
+            latency = results[name]['latency_seconds']
+            print(f"{name:16} p50={latency['p50']:.3f}s p90={latency['p90']:.3f}s p99={latency['p99']:.3f}s "
+                  f"throughput={results[name]['throughput_per_second']:.2f}/s errors={results[name]['errors']}")
+        return results
+    finally:
+        await main.shutdown_executors(None)
+        shutil.rmtree(root, ignore_errors=True)
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="វាស់ល្បឿនមុខងារបំប្លែងរបស់ Bot ដោយគ្មាន Telegram")
+    parser.add_argument('--runs', type=int, default=5, help="ចំនួនដងសម្រាប់ Scenario នីមួយៗ")
+    parser.add_argument('--concurrency', type=int, default=1, help="ចំនួនការងារដែលដំណើរការក្នុងពេលតែមួយ")
+    parser.add_argument('--pages', type=int, default=10, help="ចំនួនទំព័ររបស់ PDF សាកល្បង")
+    parser.add_argument('--only', help="Scenario ដែលត្រូវដំណើរការ (បំបែកដោយក្បៀស)")
+    parser.add_argument('--output', help="ឯកសារ JSON សម្រាប់រក្សាទុកលទ្ធផល (លំនាំដើម៖ bench-results/<ពេលវេលា>.json)")
+    parser.add_argument('--compare', help="ឯកសារ JSON ពីការវាស់មុន ដើម្បីធៀប")
+    return parser.parse_args(argv)
+
+def cli(argv=None):
+    args = parse_args(argv)
+    results = asyncio.run(run(args))
+    report = {
+        'revision': git_revision(),
+        'timestamp': time.strftime('%Y-%m-%dT%H:%M:%S'),
+        'python': platform.python_version(),
+        'cpu_count': os.cpu_count(),
+        'config': {'runs': args.runs, 'concurrency': args.concurrency, 'pages': args.pages,
+                   'cpu_workers': main.CPU_WORKERS, 'io_workers': main.IO_WORKERS},
+        'results': results,
+    }
+    output = args.output or os.path.join("bench-results", time.strftime('%Y%m%d-%H%M%S') + ".json")
+    os.makedirs(os.path.dirname(output) or ".", exist_ok=True)
+    with open(output, 'w', encoding='utf-8') as f:
+        json.dump(report, f, ensure_ascii=False, indent=2)
+    print(f"\nបានរក្សាទុកលទ្ធផលទៅកាន់ {output}")
+    if args.compare:
+        with open(args.compare, encoding='utf-8') as f:
+            compare(report, json.load(f))
+
+if __name__ == "__main__":
+    cli(sys.argv[1:])
@@ -0,0 +1,1378 @@
+# -*- coding: utf-8 -*-
+# ម៉ាស៊ីនបំប្លែងឯកសារ (Conversion Engine) ដែលមិនពឹងផ្អែកលើ Telegram
+#
+# អនុគមន៍ API (ផ្នែកខាងក្រោម) ទទួលផ្លូវឯកសារបញ្ចូល និង Parameter ហើយត្រឡប់ dict ដែលមាន 'outputs' (ផ្លូវឯកសារលទ្ធផល),
+# 'input_bytes', 'output_bytes', 'seconds' និងស្ថិតិផ្សេងៗតាមការងារ។ អនុគមន៍ទាំងអស់ជា blocking ហើយអាចដំណើរការក្នុង Process Pool។
+# Bot (main.py) គ្រាន់តែជាអ្នកទទួល/ផ្ញើឯកសារ ហើយហៅអនុគមន៍ទាំងនេះតាមរយៈ run_cpu_bound / run_io_bound។
+#
+# ការបំប្លែងថតទាំងមូលពី Command Line ដោយប្រើគ្រប់ស្នូល CPU៖
+#   python engine.py compress_pdf /data/archive -o /data/compressed --recursive --level high --skip-existing
+#   python engine.py pdf_to_img scans/ -o pages/ --fmt png --workers 8
+#   python engine.py merge_pdf a.pdf b.pdf c.pdf -o out/
+import argparse
+import hashlib
+import json
+import logging
+import os
+import re
+import sys
+import time
+import zlib
+import lzma
+import struct
+import subprocess
+import zipfile
+import tarfile
+import shutil
+import tempfile
+from io import BytesIO
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from typing import Final
+
+import ffmpeg
+import pytesseract
+from PIL import Image, ImageFilter, ImageOps
+from PyPDF2 import PdfReader, PdfWriter
+from PyPDF2.generic import ArrayObject, DictionaryObject, IndirectObject, NameObject, NullObject, NumberObject, StreamObject, TextStringObject
+from pdf2image import convert_from_path, pdfinfo_from_path
+
+# zstd ជាជម្រើស៖ ប្រសិនបើមិនបានដំឡើង zstandard ទេ ទ្រង់ទ្រាយ TAR.ZST នឹងមិនបង្ហាញ
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+# --- ការកំណត់ (អាចកំណត់តាម Environment Variable) ---
+
+# ឯកសារបញ្ចូលដែលមិនលើសពីនេះ (Byte) ត្រូវបានអានចូល Memory ម្ដង ហើយបិទឯកសារភ្លាម ជំនួសឱ្យការបើកវាទុករហូតដល់ចប់ការងារ
+IN_MEMORY_LIMIT: Final = int(os.environ.get("IN_MEMORY_LIMIT", str(8 * 1024 * 1024)))
+
+# ការបំប្លែង PDF ទៅជារូបភាពម្ដងមួយក្រុមតូចៗ ដើម្បីកុំឱ្យប្រើ RAM ច្រើន
+PDF_RENDER_DPI: Final = int(os.environ.get("PDF_RENDER_DPI", "200"))
+PDF_RENDER_WINDOW: Final = int(os.environ.get("PDF_RENDER_WINDOW", "4"))
+
+# OCR ឯកសារច្រើនទំព័រ៖ ភាសា, DPI ពេលបំប្លែង PDF និងចំនួនទំព័រក្នុង Process tesseract មួយ
+OCR_LANG: Final = os.environ.get("OCR_LANG", "khm+eng")
+OCR_DPI: Final = int(os.environ.get("OCR_DPI", "300"))
+OCR_BATCH_PAGES: Final = int(os.environ.get("OCR_BATCH_PAGES", "4"))
+# ការរៀបចំរូបភាពមុន OCR (បន្ថយទំហំ, ពណ៌ប្រផេះ, ខ្មៅ-ស, តម្រង់, កាត់យកតែផ្នែកអក្សរ)
+OCR_PREPROCESS: Final = os.environ.get("OCR_PREPROCESS", "1") == "1"
+OCR_MAX_SIDE: Final = int(os.environ.get("OCR_MAX_SIDE", "2400"))
+OCR_DEFAULT_PSM: Final = int(os.environ.get("OCR_DEFAULT_PSM", "3"))
+# វាស់ពេលវេលា OCR លើរូបភាពដើមផងដែរ ដើម្បីប្រៀបធៀប (សម្រាប់តែការវាស់វែងប៉ុណ្ណោះ)
+OCR_COMPARE_RAW: Final = os.environ.get("OCR_COMPARE_RAW", "0") == "1"
+
+# កម្រិតនៃការបន្ថយទំហំ PDF៖ DPI គោលដៅ និងគុណភាព JPEG សម្រាប់រូបភាពក្នុងឯកសារ
+COMPRESSION_LEVELS: Final = {
+    'low': {'dpi': 200, 'quality': 85, 'label': "🟢 តិច (គុណភាពខ្ពស់)"},
+    'medium': {'dpi': 150, 'quality': 70, 'label': "🟡 មធ្យម"},
+    'high': {'dpi': 100, 'quality': 50, 'label': "🔴 ខ្លាំង (ឯកសារតូចបំផុត)"},
+}
+QPDF_BIN: Final = os.environ.get("QPDF_BIN", "qpdf")
+QPDF_TIMEOUT: Final = float(os.environ.get("QPDF_TIMEOUT", "120"))
+
+# បំបែក PDF៖ ចំនួនឯកសារលទ្ធផលអតិបរមា និងប្រវែងអតិបរមានៃកន្សោមទំព័រ
+SPLIT_MAX_OUTPUTS: Final = int(os.environ.get("SPLIT_MAX_OUTPUTS", "200"))
+SPLIT_EXPRESSION_MAX: Final = 500
+
+# រូបភាពទៅជា PDF៖ ទំហំជ្រុងវែងបំផុតពេលជ្រើសរើស "បន្ថយទំហំ"
+IMG_TO_PDF_MAX_SIDE: Final = int(os.environ.get("IMG_TO_PDF_MAX_SIDE", "2000"))
+
+# ទ្រង់ទ្រាយ Archive៖ (ស្លាក, Codec, កន្ទុយឯកសារ)។ Codec None មានន័យថាមិនបង្រួម
+ARCHIVE_FORMATS = {
+    'zip': ("ZIP", 'deflate', '.zip'),
+    'zipstore': ("ZIP (Store)", None, '.zip'),
+    'targz': ("TAR.GZ", 'gzip', '.tar.gz'),
+    'tarxz': ("TAR.XZ", 'xz', '.tar.xz'),
+}
+if zstandard is not None:
+    ARCHIVE_FORMATS['tarzst'] = ("TAR.ZST", 'zstd', '.tar.zst')
+
+# កម្រិតបង្រួម៖ (ស្លាក, កម្រិតសម្រាប់ Codec នីមួយៗ)
+ARCHIVE_LEVELS = {
+    'fast': ("⚡ លឿន", {'deflate': 1, 'gzip': 1, 'xz': 1, 'zstd': 3}),
+    'normal': ("⚖️ ធម្មតា", {'deflate': 6, 'gzip': 6, 'xz': 6, 'zstd': 10}),
+    'max': ("🗜️ តូចបំផុត", {'deflate': 9, 'gzip': 9, 'xz': 9, 'zstd': 19}),
+}
+# កម្រិតលឿនបំផុតសម្រាប់ឯកសារដែលបានបង្រួមរួចហើយ ក្នុង TAR (ដែល Stream ទាំងមូលត្រូវតែបង្រួម)
+ARCHIVE_STORE_LEVELS = {'gzip': 0, 'xz': 0, 'zstd': 1}
+# ប្រភេទឯកសារដែលបានបង្រួមរួចហើយ មិនចាំបាច់បង្រួមម្ដងទៀតទេ
+STORED_EXTENSIONS = frozenset({
+    '.jpg', '.jpeg', '.png', '.gif', '.webp', '.heic', '.mp4', '.mkv', '.mov', '.webm', '.avi',
+    '.mp3', '.m4a', '.aac', '.ogg', '.opus', '.flac', '.zip', '.gz', '.tgz', '.xz', '.bz2', '.zst',
+    '.7z', '.rar', '.docx', '.xlsx', '.pptx', '.apk', '.epub',
+})
+
+# ដែនកំណត់សុវត្ថិភាពពេលពន្លា Archive (ការពារ Zip Bomb)
+ARCHIVE_MAX_ENTRIES: Final = int(os.environ.get("ARCHIVE_MAX_ENTRIES", "1000"))
+ARCHIVE_MAX_TOTAL_SIZE: Final = int(os.environ.get("ARCHIVE_MAX_TOTAL_SIZE", str(500 * 1024 * 1024)))
+ARCHIVE_MAX_RATIO: Final = float(os.environ.get("ARCHIVE_MAX_RATIO", "100"))
+
+# FFmpeg៖ កម្មវិធី និងកម្ពស់វីដេអូអតិបរមាពេលត្រូវបំប្លែងឡើងវិញ
+FFMPEG_BIN: Final = os.environ.get("FFMPEG_BIN", "ffmpeg")
+FFPROBE_BIN: Final = os.environ.get("FFPROBE_BIN", "ffprobe")
+MAX_VIDEO_HEIGHT: Final = int(os.environ.get("MAX_VIDEO_HEIGHT", "720"))
+MEDIA_ENCODER_PRESET: Final = os.environ.get("MEDIA_ENCODER_PRESET", "veryfast")
+
+# --- អនុគមន៍ធ្វើការងារធ្ងន់ៗ (Blocking Workers) ---
+# អនុគមន៍ទាំងនេះមិនមែនជា async ទេ (នៅក្នុង Bot ត្រូវហៅតាមរយៈ run_cpu_bound ឬ run_io_bound)
+
+def pdf_page_count(file_path):
+    return int(pdfinfo_from_path(file_path)["Pages"])
+
+def render_pdf_window(file_path, fmt, first_page, last_page, output_dir, dpi=PDF_RENDER_DPI, grayscale=False):
+    # pdftoppm សរសេររូបភាពទៅកាន់ Disk ដោយផ្ទាល់ ដូច្នេះគ្មានរូបភាពណាមួយត្រូវបានផ្ទុកក្នុង RAM ទេ
+    return convert_from_path(file_path, dpi=dpi, fmt=fmt, first_page=first_page, last_page=last_page, grayscale=grayscale,
+                             output_folder=output_dir, output_file=f"page{first_page:06d}", paths_only=True)
+
+def inspect_pdf(file_path):
+    """ពិនិត្យ PDF មួយ (អាន Page Tree) ហើយត្រឡប់ចំនួនទំព័រ"""
+    reader = PdfReader(file_path)
+    if reader.is_encrypted:
+        raise ValueError("ឯកសារ PDF នេះមានលេខសម្ងាត់")
+    return len(reader.pages)
+
+def _open_source(path):
+    """បើកឯកសារបញ្ចូលសម្រាប់ PdfReader៖ ឯកសារតូចៗជា BytesIO (អានម្ដង ហើយបិទ File Descriptor ភ្លាម)
+    ឯកសារធំៗជា File ដែលបើកទុក ដើម្បីឱ្យ PdfReader អានតែផ្នែកដែលត្រូវការ។ ត្រូវប្រើជាមួយ with។
+    """
+    if os.path.getsize(path) > IN_MEMORY_LIMIT:
+        return open(path, 'rb')
+    with open(path, 'rb') as f:
+        return BytesIO(f.read())
+
+def _merge_pdfs(file_paths, output_path, titles=None):
+    """បញ្ចូល PDF ច្រើនដោយសរសេរម្ដងមួយទំព័រ ហើយបង្កើត Bookmark មួយសម្រាប់ឯកសារប្រភពនីមួយៗ
+
+    មានតែ PDF មួយប៉ុណ្ណោះត្រូវបានបើកក្នុងពេលតែមួយ ហើយ Font/រូបភាពដូចគ្នាត្រូវបានសរសេរតែម្ដង។ ត្រឡប់ចំនួនទំព័រ។
+    titles=False មិនបង្កើត Bookmark ទេ (ឧ. ឯកសារបណ្ដោះអាសន្នរបស់ OCR)។
+    """
+    if titles is None:
+        titles = [os.path.splitext(os.path.basename(path))[0] for path in file_paths]
+    pages = 0
+    with StreamingPdfWriter(output_path) as writer:
+        for index, path in enumerate(file_paths):
+            with _open_source(path) as stream:
+                reader = PdfReader(stream)
+                if reader.is_encrypted and not reader.decrypt(''):
+                    raise ValueError(f"ឯកសារ {os.path.basename(path)} មានលេខសម្ងាត់")
+                pages += writer.add_pdf(reader, titles[index] if titles else None)
+    return pages
+
+# ពាក្យខ្មែរដែលអាចប្រើក្នុងកន្សោមទំព័រ
+_PAGE_KEYWORDS = {'សេស': 'odd', 'គូ': 'even', 'ចុងក្រោយ': 'last', 'រៀងរាល់': 'every', 'ទំព័រ': 'pages'}
+
+def _page_number(text):
+    number = int(text)
+    if number < 1:
+        raise ValueError("លេខទំព័រចាប់ផ្ដើមពី 1")
+    return number
+
+def parse_page_ranges(expression):
+    """ពិនិត្យ និងបំបែកកន្សោមទំព័រ (មិនទាន់ត្រូវការចំនួនទំព័រ)
+
+    ឯកសារលទ្ធផលនីមួយៗបំបែកដោយ ';' ឬបន្ទាត់ថ្មី ហើយផ្នែកក្នុងលទ្ធផលតែមួយបំបែកដោយ ','៖
+    2-5 | 1,3,8 | 10- | last 3 | odd | even | 1-5; 6-10 | every 10 pages (លទ្ធផលមួយរៀងរាល់ 10 ទំព័រ)
+    """
+    if len(expression) > SPLIT_EXPRESSION_MAX:
+        raise ValueError("កន្សោមទំព័រវែងពេក")
+    text = expression.lower()
+    for word, keyword in _PAGE_KEYWORDS.items():
+        text = text.replace(word, keyword)
+    specs = []
+    for output in re.split(r'[;\n]', text):
+        output = output.strip()
+        if not output:
+            continue
+        match = re.fullmatch(r'every\s*(\d+)(?:\s*pages?)?', output)
+        if match:
+            specs.append(('every', _page_number(match.group(1))))
+            continue
+        parts = []
+        for part in output.split(','):
+            part = part.strip()
+            match = re.fullmatch(r'(\d+)(?:\s*-\s*(\d*))?', part)
+            if match:
+                first = _page_number(match.group(1))
+                last = first if match.group(2) is None else (_page_number(match.group(2)) if match.group(2) else None)
+                if last is not None and last < first:
+                    raise ValueError(f"ចន្លោះទំព័រ '{part}' មិនត្រឹមត្រូវ")
+                parts.append(('range', first, last))
+            elif re.fullmatch(r'last\s*\d+', part):
+                parts.append(('last', _page_number(part[4:])))
+            elif part in ('odd', 'even'):
+                parts.append((part,))
+            else:
+                raise ValueError(f"មិនស្គាល់ '{part}'")
+        specs.append(('pages', parts))
+    if not specs:
+        raise ValueError("សូមបញ្ជាក់ទំព័រ")
+    return specs
+
+def compile_page_ranges(specs, total):
+    """បំប្លែងកន្សោមទំព័រទៅជាបញ្ជីលទ្ធផល ដែលនីមួយៗជាបញ្ជី range (Index ចាប់ពី 0)
+
+    range ត្រូវបានកាត់ត្រឹមចំនួនទំព័រពិតប្រាកដ ហើយមិនត្រូវបានពង្រីកជាលេខទំព័រនីមួយៗទេ
+    ដូច្នេះ '1-100000000' មិនចំណាយពេល ឬ Memory ឡើយ។
+    """
+    outputs = []
+    for spec in specs:
+        if spec[0] == 'every':
+            if len(outputs) + -(-total // spec[1]) > SPLIT_MAX_OUTPUTS:
+                raise ValueError(f"ឯកសារលទ្ធផលច្រើនពេក (អតិបរមា {SPLIT_MAX_OUTPUTS})")
+            outputs += [[range(first, min(first + spec[1], total))] for first in range(0, total, spec[1])]
+            continue
+        ranges = []
+        for part in spec[1]:
+            if part[0] == 'range':
+                ranges.append(range(part[1] - 1, total if part[2] is None else min(part[2], total)))
+            elif part[0] == 'last':
+                ranges.append(range(max(0, total - part[1]), total))
+            else:
+                ranges.append(range(0 if part[0] == 'odd' else 1, total, 2))
+        ranges = [page_range for page_range in ranges if page_range]
+        if not ranges:
+            raise ValueError(f"ទំព័រដែលបានជ្រើសរើសលើសពីចំនួនទំព័រ ({total})")
+        outputs.append(ranges)
+        if len(outputs) > SPLIT_MAX_OUTPUTS:
+            raise ValueError(f"ឯកសារលទ្ធផលច្រើនពេក (អតិបរមា {SPLIT_MAX_OUTPUTS})")
+    return outputs
+
+def _range_label(ranges):
+    labels = []
+    for page_range in ranges:
+        if page_range.step == 2:
+            labels.append('odd' if page_range.start % 2 == 0 else 'even')
+        elif len(page_range) == 1:
+            labels.append(str(page_range.start + 1))
+        else:
+            labels.append(f"{page_range.start + 1}-{page_range.stop}")
+    label = ','.join(labels)
+    return label if len(label) <= 40 else label[:37] + '...'
+
+def _split_pdf(file_path, page_range_str, output_dir):
+    """សរសេរលទ្ធផលនីមួយៗនៃកន្សោមទំព័រជា PDF ដាច់ដោយឡែក ដោយប្រើ PdfReader តែមួយ
+
+    PdfReader អានទំព័រតាមតម្រូវការពីឯកសារដែលបានបើក (ឯកសារធំមិនត្រូវបានផ្ទុកទាំងមូលក្នុង Memory ទេ)
+    ហើយ PdfWriter នីមួយៗត្រូវបានសរសេរទៅ Disk និងបោះចោល មុនពេលចាប់ផ្ដើមលទ្ធផលបន្ទាប់។
+    ត្រឡប់ (ចំនួនទំព័រ, បញ្ជីលទ្ធផល)។
+    """
+    specs = parse_page_ranges(page_range_str)
+    with _open_source(file_path) as stream:
+        reader = PdfReader(stream)
+        if reader.is_encrypted:
+            raise ValueError("ឯកសារ PDF នេះមានលេខសម្ងាត់")
+        total = len(reader.pages)
+        outputs = compile_page_ranges(specs, total)
+        width = len(str(len(outputs)))
+        parts = []
+        for number, ranges in enumerate(outputs, start=1):
+            writer = PdfWriter()
+            added = set()
+            for page_range in ranges:
+                for index in page_range:
+                    if index not in added:
+                        added.add(index)
+                        writer.add_page(reader.pages[index])
+            output_path = os.path.join(output_dir, f"split_{number:0{width}d}.pdf")
+            with open(output_path, 'wb') as f:
+                writer.write(f)
+            del writer
+            parts.append({'path': output_path, 'label': _range_label(ranges), 'pages': len(added)})
+    return total, parts
+
+_PDF_COLOR_MODES = {'/DeviceRGB': 'RGB', '/DeviceGray': 'L', '/DeviceCMYK': 'CMYK'}
+
+def _image_mode(obj):
+    color_space = obj.get('/ColorSpace')
+    if isinstance(color_space, IndirectObject):
+        color_space = color_space.get_object()
+    if isinstance(color_space, ArrayObject) and color_space and color_space[0] == '/ICCBased':
+        components = color_space[1].get_object().get('/N')
+        return {1: 'L', 3: 'RGB', 4: 'CMYK'}.get(components)
+    return _PDF_COLOR_MODES.get(color_space)
+
+def _recompress_image(obj, max_size, quality):
+    """បង្រួមរូបភាព XObject មួយទៅជា JPEG តាម DPI និងគុណភាពគោលដៅ។ ត្រឡប់ True ប្រសិនបើបានផ្លាស់ប្ដូរ"""
+    if any(key in obj for key in ('/SMask', '/Mask', '/ImageMask', '/Decode')) or obj.get('/BitsPerComponent', 8) != 8:
+        return False
+    mode = _image_mode(obj)
+    filters = obj.get('/Filter', [])
+    filters = [filters] if isinstance(filters, str) else list(filters)
+    if mode is None:
+        return False
+    if filters == ['/DCTDecode']:
+        image = Image.open(BytesIO(obj._data))
+    elif filters in ([], ['/FlateDecode']):
+        image = Image.frombytes(mode, (int(obj['/Width']), int(obj['/Height'])), obj.get_data())
+    else:
+        return False
+    original_length = len(obj._data)
+    resized = False
+    scale = min(1.0, max_size[0] / image.width, max_size[1] / image.height)
+    if scale < 0.95:
+        image = image.resize((max(1, int(image.width * scale)), max(1, int(image.height * scale))), Image.LANCZOS)
+        resized = True
+    if image.mode not in ('RGB', 'L'):
+        image = image.convert('RGB')
+    buffer = BytesIO()
+    image.save(buffer, 'JPEG', quality=quality, optimize=True)
+    data = buffer.getvalue()
+    if len(data) >= original_length and not resized:
+        return False
+    obj._data = data
+    obj.decoded_self = None
+    obj[NameObject('/Filter')] = NameObject('/DCTDecode')
+    obj[NameObject('/Width')] = NumberObject(image.width)
+    obj[NameObject('/Height')] = NumberObject(image.height)
+    obj[NameObject('/ColorSpace')] = NameObject('/DeviceRGB' if image.mode == 'RGB' else '/DeviceGray')
+    obj[NameObject('/BitsPerComponent')] = NumberObject(8)
+    if '/DecodeParms' in obj:
+        del obj['/DecodeParms']
+    return True
+
+def _fingerprint(obj):
+    """Hash នៃខ្លឹមសាររបស់ Object (មិនរាប់ /Length) សម្រាប់ស្វែងរក Object ដែលដូចគ្នាបេះបិទ"""
+    digest = hashlib.sha256(repr(sorted((key, repr(value)) for key, value in obj.items() if key != '/Length')).encode())
+    if isinstance(obj, StreamObject):
+        digest.update(obj._data)
+    return digest.hexdigest()
+
+def _dedupe_refs(container, keys, seen):
+    """ជំនួស Reference ទៅកាន់ Object ដែលដូចគ្នាដោយ Reference តែមួយ។ ត្រឡប់ចំនួនដែលបានជំនួស"""
+    replaced = 0
+    for key in keys:
+        ref = container.get(key)
+        if not isinstance(ref, IndirectObject):
+            continue
+        canonical = seen.setdefault(_fingerprint(ref.get_object()), ref)
+        if canonical.idnum != ref.idnum:
+            container[NameObject(key)] = canonical
+            replaced += 1
+    return replaced
+
+def _compress_resources(resources, max_size, quality, stats, seen, visited):
+    resources = resources.get_object() if resources is not None else None
+    if not isinstance(resources, DictionaryObject):
+        return
+    xobjects = resources.get('/XObject')
+    xobjects = xobjects.get_object() if xobjects is not None else None
+    if isinstance(xobjects, DictionaryObject):
+        for name in list(xobjects.keys()):
+            obj = xobjects[name].get_object()
+            if id(obj) in visited:
+                continue
+            visited.add(id(obj))
+            if obj.get('/Subtype') == '/Image':
+                try:
+                    if _recompress_image(obj, max_size, quality):
+                        stats['images'] += 1
+                except Exception:
+                    logging.debug("Skipping image XObject that could not be recompressed", exc_info=True)
+            elif obj.get('/Subtype') == '/Form':
+                _compress_resources(obj.get('/Resources'), max_size, quality, stats, seen, visited)
+        stats['deduplicated'] += _dedupe_refs(xobjects, list(xobjects.keys()), seen)
+    fonts = resources.get('/Font')
+    fonts = fonts.get_object() if fonts is not None else None
+    if isinstance(fonts, DictionaryObject):
+        for name in list(fonts.keys()):
+            font = fonts[name].get_object()
+            descriptor = font.get('/FontDescriptor')
+            if descriptor is not None:
+                descriptor = descriptor.get_object()
+                stats['deduplicated'] += _dedupe_refs(descriptor, ('/FontFile', '/FontFile2', '/FontFile3'), seen)
+                stats['deduplicated'] += _dedupe_refs(font, ('/FontDescriptor',), seen)
+        stats['deduplicated'] += _dedupe_refs(fonts, list(fonts.keys()), seen)
+
+def _compress_pdf(file_path, output_path, level='medium'):
+    """បន្ថយទំហំ PDF៖ បង្រួមរូបភាពតាម DPI/គុណភាពគោលដៅ លុប Object ស្ទួន និង Metadata
+
+    Object ដែលលែងប្រើត្រូវបានទុកចោល ព្រោះ PdfWriter ចម្លងតែ Object ដែលទំព័រយោងទៅដល់ប៉ុណ្ណោះ។
+    ប្រសិនបើមាន qpdf នោះលទ្ធផលត្រូវបានសរសេរឡើងវិញជាមួយ Object Streams ដែលបានបង្រួម។
+    """
+    settings = COMPRESSION_LEVELS[level]
+    stats = {'images': 0, 'deduplicated': 0, 'object_streams': False}
+    reader = PdfReader(file_path)
+    writer = PdfWriter()
+    seen, visited = {}, set()
+    for page in reader.pages:
+        box = page.mediabox
+        max_size = (float(box.width) / 72 * settings['dpi'], float(box.height) / 72 * settings['dpi'])
+        _compress_resources(page.get('/Resources'), max_size, settings['quality'], stats, seen, visited)
+        for key in ('/Metadata', '/PieceInfo', '/Thumb'):
+            if key in page:
+                del page[key]
+        page.compress_content_streams()
+        writer.add_page(page)
+    if not shutil.which(QPDF_BIN):
+        with open(output_path, "wb") as f: writer.write(f)
+        return stats
+    intermediate = output_path + ".tmp"
+    with open(intermediate, "wb") as f: writer.write(f)
+    try:
+        result = subprocess.run([QPDF_BIN, '--object-streams=generate', '--compress-streams=y', '--recompress-flate',
+                                 '--compression-level=9', intermediate, output_path],
+                                check=False, capture_output=True, timeout=QPDF_TIMEOUT)
+        # 0 = ជោគជ័យ, 3 = ជោគជ័យជាមួយការព្រមាន។ លទ្ធផលផ្សេងទៀតអាចជាឯកសារដែលមិនពេញលេញ
+        stats['object_streams'] = result.returncode in (0, 3) and os.path.exists(output_path)
+        if not stats['object_streams']:
+            logging.warning("qpdf failed (exit %s): %s", result.returncode, result.stderr.decode(errors='ignore').strip())
+    except subprocess.TimeoutExpired:
+        logging.warning("qpdf timed out after %ss", QPDF_TIMEOUT)
+    finally:
+        if stats['object_streams']:
+            os.remove(intermediate)
+        else:
+            if os.path.exists(output_path): os.remove(output_path)
+            os.replace(intermediate, output_path)
+    return stats
+
+A4_PAGE: Final = (595.28, 841.89)
+
+class StreamingPdfWriter:
+    """សរសេរ PDF ម្ដងមួយទំព័រដោយផ្ទាល់ទៅកាន់ឯកសារ ដូច្នេះមានតែរូបភាព ឬទំព័រមួយប៉ុណ្ណោះនៅក្នុង RAM
+
+    Object 1 គឺ Catalog និង Object 2 គឺ Pages ដែលត្រូវសរសេរនៅពេល close() ជាមួយ Bookmark (Outlines)។
+    """
+
+    def __init__(self, path):
+        self._file = open(path, 'wb')
+        self._offsets = {}
+        self._next_id = 3
+        self._page_ids = []
+        self._outline = []
+        # Stream (Font, រូបភាព) ដែលបានសរសេររួច តាម Hash នៃខ្លឹមសារ ដើម្បីចែករំលែកវារវាងឯកសារប្រភព
+        self._shared = {}
+        self._ids = {}
+        self._file.write(b"%PDF-1.4\n%\xe2\xe3\xcf\xd3\n")
+
+    def _reserve(self):
+        obj_id = self._next_id
+        self._next_id += 1
+        return obj_id
+
+    def _write_object(self, obj_id, body, stream=None):
+        self._offsets[obj_id] = self._file.tell()
+        self._file.write(f"{obj_id} 0 obj\n".encode())
+        self._file.write(body)
+        if stream is not None:
+            self._file.write(b"\nstream\n")
+            self._file.write(stream)
+            self._file.write(b"\nendstream")
+        self._file.write(b"\nendobj\n")
+
+    def add_image_page(self, info, data, page_size='original'):
+        """បន្ថែមទំព័រមួយដែលមានរូបភាព (info មកពី _prepare_pdf_image) ពេញទំព័រ"""
+        (page_w, page_h), (draw_w, draw_h, x, y) = _page_layout(info['width'], info['height'], page_size)
+        image_id, content_id, page_id = self._reserve(), self._reserve(), self._reserve()
+        self._write_object(image_id, (
+            f"<< /Type /XObject /Subtype /Image /Width {info['width']} /Height {info['height']} "
+            f"/ColorSpace {info['color_space']} /BitsPerComponent 8 /Filter {info['filter']} {info.get('extra', '')}"
+            f"/Length {len(data)} >>").encode(), data)
+        content = f"q {draw_w:.2f} 0 0 {draw_h:.2f} {x:.2f} {y:.2f} cm /Im0 Do Q".encode()
+        self._write_object(content_id, f"<< /Length {len(content)} >>".encode(), content)
+        self._write_object(page_id, (
+            f"<< /Type /Page /Parent 2 0 R /MediaBox [0 0 {page_w:.2f} {page_h:.2f}] "
+            f"/Resources << /XObject << /Im0 {image_id} 0 R >> >> /Contents {content_id} 0 R >>").encode())
+        self._page_ids.append(page_id)
+
+    @staticmethod
+    def _direct(obj):
+        buffer = BytesIO()
+        obj.write_to_stream(buffer, None)
+        return buffer.getvalue()
+
+    def _serialize(self, obj, pending):
+        """Serialize Object ពី PDF ប្រភព ដោយប្ដូរលេខ Object ដែលយោងទៅជាលេខក្នុងឯកសារលទ្ធផល"""
+        if isinstance(obj, IndirectObject):
+            return f"{self._map(obj, pending)} 0 R".encode()
+        if isinstance(obj, DictionaryObject):
+            return self._serialize_dict(obj, pending)
+        if isinstance(obj, ArrayObject):
+            return b"[" + b" ".join(self._serialize(item, pending) for item in obj) + b"]"
+        return self._direct(obj)
+
+    def _serialize_dict(self, obj, pending, skip=(), extra=b""):
+        items = [self._direct(key) + b" " + self._serialize(value, pending)
+                 for key, value in obj.items() if key not in skip]
+        return b"<<" + b" ".join(items + ([extra] if extra else [])) + b">>"
+
+    @staticmethod
+    def _has_reference(obj):
+        if isinstance(obj, IndirectObject):
+            return True
+        if isinstance(obj, DictionaryObject):
+            return any(StreamingPdfWriter._has_reference(value) for key, value in obj.items() if key != '/Length')
+        if isinstance(obj, ArrayObject):
+            return any(StreamingPdfWriter._has_reference(item) for item in obj)
+        return False
+
+    def _share_key(self, obj):
+        """Hash សម្រាប់ Stream ដែលមិនយោងទៅ Object ផ្សេង (Font Program, រូបភាពភាគច្រើន) ឬ None"""
+        if not isinstance(obj, StreamObject) or self._has_reference(obj):
+            return None
+        digest = hashlib.sha1(self._serialize_dict(obj, None, skip=('/Length',)))
+        digest.update(obj._data)
+        return digest.digest()
+
+    def _map(self, ref, pending):
+        new_id = self._ids.get(ref.idnum)
+        if new_id is None:
+            obj = ref.get_object()
+            if obj is None:
+                # Reference ដែលគ្មាន Object (PDF ខូចបន្តិច) ក្លាយជា null ដូច PdfMerger ធ្លាប់ធ្វើ
+                obj = NullObject()
+            key = self._share_key(obj)
+            new_id = self._shared.get(key) if key else None
+            if new_id is None:
+                new_id = self._reserve()
+                pending.append((new_id, obj))
+                if key: self._shared[key] = new_id
+            self._ids[ref.idnum] = new_id
+        return new_id
+
+    def add_pdf(self, reader, title=None):
+        """ចម្លងទំព័រទាំងអស់របស់ PDF មួយ ម្ដងមួយទំព័រ។ ត្រឡប់ចំនួនទំព័រ
+
+        Object ដែលទំព័រនីមួយៗយោងទៅត្រូវបានសរសេរភ្លាម ហើយ Cache របស់ reader ត្រូវបានសម្អាតបន្ទាប់ពីទំព័រនីមួយៗ។
+        """
+        self._ids = {}
+        pages = reader.pages
+        # លេខ Object របស់ទំព័រត្រូវបានកំណត់ជាមុន ដើម្បីឱ្យ Link និង Annotation ដែលយោងទៅទំព័រផ្សេងនៅតែត្រឹមត្រូវ
+        page_ids = []
+        for page in pages:
+            page_ids.append(self._reserve())
+            self._ids[page.indirect_reference.idnum] = page_ids[-1]
+        for page, page_id in zip(pages, page_ids):
+            pending = []
+            # /Parent របស់ទំព័រត្រូវបានជំនួស ព្រោះវានឹងទាញ Page Tree ទាំងមូលរបស់ឯកសារប្រភពមកជាមួយ
+            # (/Parent ផ្សេងទៀត ឧ. ឋានានុក្រមរបស់ Form Field ត្រូវបានរក្សាទុក)
+            self._write_object(page_id, self._serialize_dict(page, pending, skip=('/Parent',), extra=b"/Parent 2 0 R"))
+            while pending:
+                new_id, obj = pending.pop()
+                if isinstance(obj, StreamObject):
+                    self._write_object(new_id, self._serialize_dict(obj, pending, skip=('/Length',), extra=f"/Length {len(obj._data)}".encode()), obj._data)
+                else:
+                    self._write_object(new_id, self._serialize(obj, pending))
+            self._page_ids.append(page_id)
+            reader.resolved_objects.clear()
+        if title and page_ids:
+            self._outline.append((title, page_ids[0]))
+        return len(page_ids)
+
+    def _write_outline(self):
+        root_id = self._reserve()
+        item_ids = [self._reserve() for _ in self._outline]
+        for index, ((title, page_id), item_id) in enumerate(zip(self._outline, item_ids)):
+            links = f"/Parent {root_id} 0 R"
+            if index > 0: links += f" /Prev {item_ids[index - 1]} 0 R"
+            if index + 1 < len(item_ids): links += f" /Next {item_ids[index + 1]} 0 R"
+            self._write_object(item_id, b"<< /Title " + self._direct(TextStringObject(title)) + f" {links} /Dest [{page_id} 0 R /Fit] >>".encode())
+        self._write_object(root_id, f"<< /Type /Outlines /First {item_ids[0]} 0 R /Last {item_ids[-1]} 0 R /Count {len(item_ids)} >>".encode())
+        return root_id
+
+    def close(self):
+        kids = " ".join(f"{page_id} 0 R" for page_id in self._page_ids)
+        self._write_object(2, f"<< /Type /Pages /Kids [{kids}] /Count {len(self._page_ids)} >>".encode())
+        catalog = b"<< /Type /Catalog /Pages 2 0 R >>"
+        if self._outline:
+            outline_id = self._write_outline()
+            catalog = f"<< /Type /Catalog /Pages 2 0 R /Outlines {outline_id} 0 R /PageMode /UseOutlines >>".encode()
+        self._write_object(1, catalog)
+        xref_offset = self._file.tell()
+        self._file.write(f"xref\n0 {self._next_id}\n0000000000 65535 f \n".encode())
+        for obj_id in range(1, self._next_id):
+            self._file.write(f"{self._offsets[obj_id]:010d} 00000 n \n".encode())
+        self._file.write(f"trailer\n<< /Size {self._next_id} /Root 1 0 R >>\nstartxref\n{xref_offset}\n%%EOF\n".encode())
+        self._file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        if exc_type is None:
+            self.close()
+        else:
+            self._file.close()
+
+def _page_layout(width, height, page_size, dpi=100.0):
+    """គណនាទំហំទំព័រ និងទីតាំងរូបភាព (គិតជា point)"""
+    if page_size == 'a4':
+        page_w, page_h = A4_PAGE if height >= width else (A4_PAGE[1], A4_PAGE[0])
+        margin = 18
+        scale = min((page_w - 2 * margin) / width, (page_h - 2 * margin) / height)
+        draw_w, draw_h = width * scale, height * scale
+        return (page_w, page_h), (draw_w, draw_h, (page_w - draw_w) / 2, (page_h - draw_h) / 2)
+    page_w, page_h = width * 72 / dpi, height * 72 / dpi
+    return (page_w, page_h), (page_w, page_h, 0, 0)
+
+_JPEG_COLOR_SPACES = {'L': '/DeviceGray', 'RGB': '/DeviceRGB', 'CMYK': '/DeviceCMYK'}
+
+def _prepare_pdf_image(path, max_side=0):
+    """រៀបចំរូបភាពមួយសម្រាប់ដាក់ក្នុង PDF។ ត្រឡប់ (info, data)
+
+    JPEG ដែលមិនចាំបាច់បង្វិល ឬបន្ថយទំហំ ត្រូវបានបញ្ចូលដោយផ្ទាល់ (DCTDecode) ដោយមិនបំប្លែងឡើងវិញ។
+    """
+    with Image.open(path) as image:
+        orientation = image.getexif().get(0x0112, 1)
+        needs_resize = bool(max_side) and max(image.size) > max_side
+        if image.format == 'JPEG' and image.mode in _JPEG_COLOR_SPACES and orientation == 1 and not needs_resize:
+            info = {'width': image.width, 'height': image.height, 'color_space': _JPEG_COLOR_SPACES[image.mode], 'filter': '/DCTDecode'}
+            if image.mode == 'CMYK' and 'adobe' in image.info:
+                info['extra'] = '/Decode [1 0 1 0 1 0 1 0] '
+            with open(path, 'rb') as f:
+                return info, f.read()
+        was_jpeg = image.format == 'JPEG'
+        image = ImageOps.exif_transpose(image)
+        if needs_resize:
+            image.thumbnail((max_side, max_side), Image.LANCZOS)
+        if image.mode in ('RGBA', 'LA') or (image.mode == 'P' and 'transparency' in image.info):
+            rgba = image.convert('RGBA')
+            image = Image.new('RGB', rgba.size, 'white')
+            image.paste(rgba, mask=rgba.getchannel('A'))
+        elif image.mode not in ('L', 'RGB'):
+            image = image.convert('RGB')
+        info = {'width': image.width, 'height': image.height, 'color_space': _JPEG_COLOR_SPACES[image.mode]}
+        if was_jpeg:
+            buffer = BytesIO()
+            image.save(buffer, 'JPEG', quality=90)
+            info['filter'] = '/DCTDecode'
+            return info, buffer.getvalue()
+        # រូបភាពដែលមិនមែនជា JPEG (ឧ. PNG) ត្រូវបានរក្សាទុកដោយមិនបាត់បង់គុណភាព
+        info['filter'] = '/FlateDecode'
+        return info, zlib.compress(image.tobytes(), 6)
+
+def prepare_pdf_fragment(path, max_side=0):
+    """រៀបចំរូបភាពទុកជាមុនក្នុងឯកសារ .part ដើម្បីឱ្យ images_to_pdf គ្រាន់តែភ្ជាប់វាចូលគ្នា"""
+    info, data = _prepare_pdf_image(path, max_side)
+    with open(path + '.part', 'wb') as f:
+        f.write(data)
+    return max_side, info
+
+def _images_to_pdf(file_paths, output_path, page_size='original', downscale=False, prepared=None):
+    max_side = IMG_TO_PDF_MAX_SIDE if downscale else 0
+    prepared = prepared or {}
+    with StreamingPdfWriter(output_path) as writer:
+        for path in file_paths:
+            fragment = prepared.get(path)
+            if fragment and fragment[0] == max_side and os.path.exists(path + '.part'):
+                with open(path + '.part', 'rb') as f:
+                    info, data = fragment[1], f.read()
+            else:
+                info, data = _prepare_pdf_image(path, max_side)
+            writer.add_image_page(info, data, page_size)
+            del data
+
+def _otsu_threshold(gray):
+    histogram = gray.histogram()
+    total = sum(histogram)
+    sum_all = sum(i * count for i, count in enumerate(histogram))
+    sum_bg, weight_bg, best, threshold = 0.0, 0, 0.0, 127
+    for i, count in enumerate(histogram):
+        weight_bg += count
+        if weight_bg == 0:
+            continue
+        weight_fg = total - weight_bg
+        if weight_fg == 0:
+            break
+        sum_bg += i * count
+        mean_bg = sum_bg / weight_bg
+        mean_fg = (sum_all - sum_bg) / weight_fg
+        between = weight_bg * weight_fg * (mean_bg - mean_fg) ** 2
+        if between > best:
+            best, threshold = between, i
+    return threshold
+
+def _estimate_skew(binary, max_angle=5.0, step=0.5):
+    """ប៉ាន់ស្មានមុំទ្រេតដោយស្វែងរកមុំដែលធ្វើឱ្យជួរអក្សរដាច់ពីគ្នាច្បាស់បំផុត (projection profile)"""
+    thumb = ImageOps.invert(binary)
+    thumb.thumbnail((800, 800))
+    best_angle, best_score = 0.0, -1.0
+    angle = -max_angle
+    while angle <= max_angle:
+        rotated = thumb.rotate(angle, resample=Image.NEAREST, fillcolor=0)
+        rows = list(rotated.resize((1, rotated.height), Image.BOX).getdata())
+        mean = sum(rows) / len(rows)
+        score = sum((value - mean) ** 2 for value in rows)
+        if score > best_score:
+            best_angle, best_score = angle, score
+        angle += step
+    return best_angle
+
+def _preprocess_for_ocr(image):
+    image = ImageOps.exif_transpose(image)
+    gray = image.convert('L')
+    if max(gray.size) > OCR_MAX_SIDE:
+        gray.thumbnail((OCR_MAX_SIDE, OCR_MAX_SIDE), Image.LANCZOS)
+    gray = ImageOps.autocontrast(gray, cutoff=1)
+    threshold = _otsu_threshold(gray)
+    binary = gray.point(lambda value: 255 if value > threshold else 0, mode='L')
+    angle = _estimate_skew(binary)
+    if angle:
+        binary = binary.rotate(angle, resample=Image.BICUBIC, expand=True, fillcolor=255)
+    # កាត់យកតែផ្នែកដែលមានអក្សរ (បន្ទាប់ពីលុបចំណុចតូចៗចេញ)
+    bbox = ImageOps.invert(binary.filter(ImageFilter.MedianFilter(3))).getbbox()
+    if bbox:
+        margin = 20
+        binary = binary.crop((max(bbox[0] - margin, 0), max(bbox[1] - margin, 0),
+                              min(bbox[2] + margin, binary.width), min(bbox[3] + margin, binary.height)))
+    return binary, angle
+
+def _image_to_string(image, lang, config):
+    """OCR រូបភាពក្នុង Memory ដោយបញ្ជូនវាទៅ tesseract តាម stdin/stdout
+
+    pytesseract.image_to_string សរសេររូបភាព និងលទ្ធផលទៅឯកសារបណ្ដោះអាសន្ននៅលើ Disk រាល់ពេលហៅ។
+    ទ្រង់ទ្រាយ PNM មិនត្រូវការការបង្រួម ដូច្នេះការអ៊ិនកូដស្ទើរតែគ្មានតម្លៃ។
+    """
+    if image.mode not in ('1', 'L', 'RGB'):
+        image = image.convert('RGB')
+    buffer = BytesIO()
+    image.save(buffer, 'PPM')
+    result = subprocess.run([pytesseract.pytesseract.tesseract_cmd, 'stdin', 'stdout', '-l', lang, *config.split()],
+                            input=buffer.getvalue(), capture_output=True)
+    if result.returncode != 0:
+        raise pytesseract.TesseractError(result.returncode, result.stderr.decode('utf-8', 'replace').strip())
+    return result.stdout.decode('utf-8')
+
+def _ocr_image(file_path, lang, psm=OCR_DEFAULT_PSM, preprocess=OCR_PREPROCESS):
+    """OCR រូបភាពមួយ។ ត្រឡប់ (អក្សរ, ស្ថិតិពេលវេលា) ដើម្បីអាចវាស់ប្រសិទ្ធភាពនៃការរៀបចំរូបភាព"""
+    config = f"--psm {psm}"
+    stats = {}
+    with Image.open(file_path) as image:
+        stats['original_size'] = image.size
+        if OCR_COMPARE_RAW:
+            started = time.perf_counter()
+            _image_to_string(image, lang, config)
+            stats['raw_ocr_seconds'] = time.perf_counter() - started
+        started = time.perf_counter()
+        if preprocess:
+            image, stats['deskew_angle'] = _preprocess_for_ocr(image)
+        stats['preprocess_seconds'] = time.perf_counter() - started
+        stats['processed_size'] = image.size
+        started = time.perf_counter()
+        text = _image_to_string(image, lang, config)
+        stats['ocr_seconds'] = time.perf_counter() - started
+        if preprocess and not text.strip():
+            # ការធ្វើខ្មៅ-សអាចលុបអក្សរស្រាលៗចោល៖ សាកល្បងម្ដងទៀតលើរូបភាពពណ៌ប្រផេះ
+            with Image.open(file_path) as original:
+                text = _image_to_string(ImageOps.exif_transpose(original).convert('L'), lang, config)
+            stats['fallback'] = True
+    return text, stats
+
+def ocr_batch(image_paths, lang, output, out_base, dpi=None):
+    """OCR រូបភាពច្រើនដោយ Process tesseract តែមួយ (ផ្ទុក traineddata តែម្ដងសម្រាប់ក្រុមទាំងមូល)
+
+    ត្រឡប់បញ្ជីអក្សរតាមទំព័រសម្រាប់ output='txt' ឬផ្លូវទៅកាន់ PDF ដែលអាចស្វែងរកបានសម្រាប់ output='pdf'។
+    """
+    list_path = out_base + ".list"
+    with open(list_path, 'w', encoding='utf-8') as f:
+        f.write("\n".join(os.path.abspath(path) for path in image_paths) + "\n")
+    args = [pytesseract.pytesseract.tesseract_cmd, list_path, out_base, '-l', lang]
+    if dpi:
+        args += ['--dpi', str(dpi)]
+    # ការងារនីមួយៗប្រើស្នូលតែមួយ ព្រោះយើងដំណើរការក្រុមច្រើនស្របគ្នារួចហើយ
+    env = dict(os.environ, OMP_THREAD_LIMIT='1')
+    try:
+        subprocess.run(args + [output], check=True, capture_output=True, env=env)
+    finally:
+        os.remove(list_path)
+    if output == 'pdf':
+        return out_base + '.pdf'
+    with open(out_base + '.txt', encoding='utf-8') as f:
+        pages = f.read().split('\f')
+    os.remove(out_base + '.txt')
+    return (pages + [''] * len(image_paths))[:len(image_paths)]
+
+_ZIP_LIMIT = 0xFFFFFFFF
+
+_CHUNK_SIZE = 1024 * 1024
+
+def _stream_compressor(codec, level):
+    if codec == 'deflate':
+        return zlib.compressobj(level, zlib.DEFLATED, -15)
+    if codec == 'gzip':
+        return zlib.compressobj(level, zlib.DEFLATED, 31)
+    if codec == 'xz':
+        return lzma.LZMACompressor(lzma.FORMAT_XZ, preset=level)
+    if codec == 'zstd':
+        return zstandard.ZstdCompressor(level=level).compressobj()
+    raise ValueError(f"Codec មិនស្គាល់: {codec}")
+
+def _zip_entry(file_path, level=None):
+    """បង្រួមឯកសារមួយជា Raw Deflate ទៅកាន់ file_path + '.part' ហើយត្រឡប់ព័ត៌មានសម្រាប់ ZIP
+
+    level None ឬការបង្រួមដែលមិនធ្វើឱ្យតូចជាងមុន៖ គ្មានឯកសារ .part ទេ ហើយឯកសារដើមត្រូវបានរក្សាទុកជា Stored។
+    """
+    part_path = file_path + '.part'
+    crc, size = 0, 0
+    if level is None:
+        with open(file_path, 'rb') as src:
+            while chunk := src.read(_CHUNK_SIZE):
+                crc = zlib.crc32(chunk, crc)
+                size += len(chunk)
+        return {'method': zipfile.ZIP_STORED, 'crc': crc, 'size': size, 'compressed_size': size}
+    compressor = _stream_compressor('deflate', level)
+    try:
+        with open(file_path, 'rb') as src, open(part_path, 'wb') as dst:
+            while chunk := src.read(_CHUNK_SIZE):
+                crc = zlib.crc32(chunk, crc)
+                size += len(chunk)
+                dst.write(compressor.compress(chunk))
+            dst.write(compressor.flush())
+            compressed_size = dst.tell()
+    except BaseException:
+        if os.path.exists(part_path): os.remove(part_path)
+        raise
+    if compressed_size >= size:
+        os.remove(part_path)
+        return {'method': zipfile.ZIP_STORED, 'crc': crc, 'size': size, 'compressed_size': size}
+    return {'method': zipfile.ZIP_DEFLATED, 'crc': crc, 'size': size, 'compressed_size': compressed_size}
+
+def _tar_entry(file_path, codec, level):
+    """សរសេរ Header + ទិន្នន័យ TAR របស់ឯកសារមួយជា Stream បង្រួមដាច់ដោយឡែក (gzip/xz/zstd member) ទៅកាន់ .part
+
+    Member ទាំងនេះអាចភ្ជាប់បន្តគ្នាដោយផ្ទាល់ ហើយនៅតែជា .tar.gz/.tar.xz/.tar.zst ត្រឹមត្រូវ។
+    """
+    part_path = file_path + '.part'
+    info = tarfile.TarInfo(os.path.basename(file_path))
+    info.size = os.path.getsize(file_path)
+    info.mtime = int(os.path.getmtime(file_path))
+    info.mode = 0o644
+    compressor = _stream_compressor(codec, level)
+    try:
+        with open(file_path, 'rb') as src, open(part_path, 'wb') as dst:
+            dst.write(compressor.compress(info.tobuf(tarfile.PAX_FORMAT, 'utf-8')))
+            while chunk := src.read(_CHUNK_SIZE):
+                dst.write(compressor.compress(chunk))
+            dst.write(compressor.compress(b'\0' * (-info.size % tarfile.BLOCKSIZE)))
+            dst.write(compressor.flush())
+            compressed_size = dst.tell()
+    except BaseException:
+        if os.path.exists(part_path): os.remove(part_path)
+        raise
+    return {'size': info.size, 'compressed_size': compressed_size}
+
+def archive_entry(file_path, fmt, level):
+    """រៀបចំ Entry មួយសម្រាប់ Archive តាមទ្រង់ទ្រាយ និងកម្រិតបង្រួមដែលបានជ្រើសរើស (ដំណើរការក្នុង Process Pool)"""
+    codec = ARCHIVE_FORMATS[fmt][1]
+    already_compressed = os.path.splitext(file_path)[1].lower() in STORED_EXTENSIONS
+    if codec is None or codec == 'deflate':
+        entry = _zip_entry(file_path, None if codec is None or already_compressed else ARCHIVE_LEVELS[level][1][codec])
+    else:
+        entry = _tar_entry(file_path, codec, ARCHIVE_STORE_LEVELS[codec] if already_compressed else ARCHIVE_LEVELS[level][1][codec])
+    entry.update(fmt=fmt, level=level)
+    return entry
+
+def archive_entry_ready(entry, file_path, fmt, level):
+    """ពិនិត្យថា Entry ដែលបានរៀបចំជាមុនអាចប្រើសម្រាប់ទ្រង់ទ្រាយ/កម្រិតនេះបាន"""
+    if not entry or entry['fmt'] != fmt or entry['level'] != level:
+        return False
+    return entry.get('method') == zipfile.ZIP_STORED or os.path.exists(file_path + '.part')
+
+def _dos_datetime(path):
+    t = time.localtime(os.path.getmtime(path))
+    year = min(max(t.tm_year, 1980), 2107)
+    return (t.tm_hour << 11) | (t.tm_min << 5) | (t.tm_sec // 2), ((year - 1980) << 9) | (t.tm_mon << 5) | t.tm_mday
+
+def _create_zip(file_paths, output_path, fmt, level, prepared):
+    if len(file_paths) >= 0xFFFF or sum(os.path.getsize(path) for path in file_paths) >= _ZIP_LIMIT:
+        # ធំពេកសម្រាប់ ZIP ធម្មតា ប្រើ zipfile ជាមួយ ZIP64 ជំនួសវិញ
+        method = zipfile.ZIP_STORED if ARCHIVE_FORMATS[fmt][1] is None else zipfile.ZIP_DEFLATED
+        with zipfile.ZipFile(output_path, 'w', method, allowZip64=True, compresslevel=ARCHIVE_LEVELS[level][1]['deflate']) as zipf:
+            for file_path in file_paths:
+                zipf.write(file_path, os.path.basename(file_path))
+        return
+    central = []
+    with open(output_path, 'wb') as out:
+        for file_path in file_paths:
+            entry = prepared.get(file_path)
+            if not archive_entry_ready(entry, file_path, fmt, level):
+                entry = archive_entry(file_path, fmt, level)
+            name = os.path.basename(file_path).encode('utf-8')
+            dos_time, dos_date = _dos_datetime(file_path)
+            offset = out.tell()
+            out.write(struct.pack('<4s5H3L2H', b'PK\x03\x04', 20, 0x800, entry['method'], dos_time, dos_date,
+                                  entry['crc'], entry['compressed_size'], entry['size'], len(name), 0))
+            out.write(name)
+            source = file_path + '.part' if entry['method'] == zipfile.ZIP_DEFLATED else file_path
+            with open(source, 'rb') as src:
+                shutil.copyfileobj(src, out, _CHUNK_SIZE)
+            central.append(struct.pack('<4s6H3L5H2L', b'PK\x01\x02', 20, 20, 0x800, entry['method'], dos_time, dos_date,
+                                       entry['crc'], entry['compressed_size'], entry['size'], len(name), 0, 0, 0, 0,
+                                       0o100644 << 16, offset) + name)
+        central_offset = out.tell()
+        for record in central:
+            out.write(record)
+        out.write(struct.pack('<4s4H2LH', b'PK\x05\x06', 0, 0, len(central), len(central),
+                              out.tell() - central_offset, central_offset, 0))
+
+def _create_tar(file_paths, output_path, fmt, level, prepared):
+    codec = ARCHIVE_FORMATS[fmt][1]
+    with open(output_path, 'wb') as out:
+        for file_path in file_paths:
+            if not archive_entry_ready(prepared.get(file_path), file_path, fmt, level):
+                archive_entry(file_path, fmt, level)
+            with open(file_path + '.part', 'rb') as src:
+                shutil.copyfileobj(src, out, _CHUNK_SIZE)
+        # ចុងបញ្ចប់របស់ TAR (Block ទទេពីរ) ជា Member ចុងក្រោយ
+        compressor = _stream_compressor(codec, ARCHIVE_LEVELS[level][1][codec])
+        out.write(compressor.compress(b'\0' * tarfile.BLOCKSIZE * 2))
+        out.write(compressor.flush())
+
+def _create_archive(file_paths, output_path, fmt='zip', level='normal', prepared=None):
+    """ភ្ជាប់ Entry ដែលបានរៀបចំរួចជាមុន (archive_entry) ទៅជា Archive តែមួយ ហើយត្រឡប់ (ទំហំដើម, ទំហំ Archive)"""
+    builder = _create_zip if ARCHIVE_FORMATS[fmt][2] == '.zip' else _create_tar
+    builder(file_paths, output_path, fmt, level, prepared or {})
+    return sum(os.path.getsize(path) for path in file_paths), os.path.getsize(output_path)
+
+def _safe_entry_name(name):
+    """ត្រឡប់ឈ្មោះ Entry ដែលមានសុវត្ថិភាព ឬ None ប្រសិនបើវាព្យាយាមចេញក្រៅថត (Path Traversal)"""
+    name = name.replace('\\', '/')
+    parts = [part for part in name.split('/') if part not in ('', '.')]
+    if not parts or name.startswith('/') or '..' in parts or ':' in parts[0] or '\0' in name:
+        return None
+    return '/'.join(parts)
+
+class SafeArchive:
+    """អាន ZIP/TAR តាមរយៈ Central Directory ឬ TAR Header តែប៉ុណ្ណោះ ហើយពន្លាម្ដងមួយ Entry
+
+    ដែនកំណត់ (ចំនួន Entry, ទំហំសរុប, អត្រាបង្រួម) ត្រូវបានពិនិត្យមុនពេលពន្លាអ្វីទាំងអស់។
+    Entry ដែលមិនមែនជាឯកសារធម្មតា (Symlink, Device, ...) ឬមានឈ្មោះគ្រោះថ្នាក់ ត្រូវបានរំលង។
+    """
+
+    def __init__(self, path, max_entry_size=None):
+        self.max_entry_size = max_entry_size
+        self.entries = []
+        self.skipped = 0
+        self.total_size = 0
+        self._declared_size = 0
+        archive_size = max(os.path.getsize(path), 1)
+        if zipfile.is_zipfile(path):
+            self._zip, self._tar = zipfile.ZipFile(path), None
+            members = self._zip.infolist()
+        elif tarfile.is_tarfile(path):
+            # 'r:*' ស្គាល់ .tar, .tar.gz, .tar.bz2 និង .tar.xz ដោយស្វ័យប្រវត្តិ
+            self._zip, self._tar = None, tarfile.open(path, 'r:*')
+            members = self._tar
+        else:
+            raise ValueError("មិនគាំទ្រទ្រង់ទ្រាយឯកសារនេះទេ។ សូមផ្ញើតែ ZIP ឬ TAR (.tar, .tar.gz, .tar.bz2, .tar.xz)")
+        try:
+            for count, member in enumerate(members, 1):
+                if count > ARCHIVE_MAX_ENTRIES:
+                    raise ValueError(f"Archive មាន Entry ច្រើនពេក (លើស {ARCHIVE_MAX_ENTRIES})")
+                self._add(member)
+                # ពិនិត្យទំហំដែលបានប្រកាស (រួមទាំង Entry ដែលត្រូវរំលង) ក្នុងរង្វិលជុំ ព្រោះការអាន TAR Header
+                # បន្ទាប់តម្រូវឱ្យពន្លា Entry មុនទាំងស្រុង
+                if self._declared_size > ARCHIVE_MAX_TOTAL_SIZE:
+                    raise ValueError(f"ទំហំសរុបក្រោយពន្លាធំពេក (លើស {ARCHIVE_MAX_TOTAL_SIZE // 1024 // 1024}MB)")
+                if self._declared_size > 1024 * 1024 and self._declared_size / archive_size > ARCHIVE_MAX_RATIO:
+                    raise ValueError("អត្រាបង្រួមខ្ពស់មិនធម្មតា (អាចជា Zip Bomb)")
+        except BaseException:
+            self.close()
+            raise
+
+    def _add(self, member):
+        if self._zip is not None:
+            is_file = not member.is_dir() and (member.external_attr >> 16) & 0o170000 in (0, 0o100000)
+            name, size = member.filename, member.file_size
+            if member.flag_bits & 0x1:
+                is_file = False  # Entry ដែលមានលេខសម្ងាត់
+        else:
+            is_file = member.isreg()
+            name, size = member.name, member.size
+        name = _safe_entry_name(name)
+        if is_file: self._declared_size += size
+        # Entry ដែលធំជាង max_entry_size (ឧ. ដែន Upload របស់ Telegram) ត្រូវបានរំលង
+        if not is_file or name is None or (self.max_entry_size is not None and size > self.max_entry_size):
+            self.skipped += 1
+            return
+        self.total_size += size
+        self.entries.append({'name': name, 'size': size, 'member': member})
+
+    def extract(self, index, output_path, chunk_size=1024 * 1024):
+        """ពន្លា Entry មួយទៅកាន់ output_path (Stream) ដោយមិនឱ្យលើសទំហំដែលបានប្រកាសក្នុង Header"""
+        entry = self.entries[index]
+        source = self._zip.open(entry['member']) if self._zip is not None else self._tar.extractfile(entry['member'])
+        written = 0
+        with source, open(output_path, 'wb') as out:
+            while chunk := source.read(chunk_size):
+                written += len(chunk)
+                if written > entry['size']:
+                    raise ValueError(f"Entry {entry['name']} ធំជាងទំហំដែលបានប្រកាស")
+                out.write(chunk)
+        return output_path
+
+    def close(self):
+        if self._zip is not None: self._zip.close()
+        if self._tar is not None: self._tar.close()
+
+# --- ផែនការបំប្លែងសម្លេង/វីដេអូ (FFmpeg) ---
+
+def media_duration(probe):
+    try:
+        return float(probe.get('format', {}).get('duration') or 0) or None
+    except ValueError:
+        return None
+
+# ទ្រង់ទ្រាយលទ្ធផលនីមួយៗ៖ muxer របស់ FFmpeg, codec ដែលអាចចម្លងដោយផ្ទាល់ (None = ទាំងអស់) និង encoder លំនាំដើម
+MEDIA_CONTAINERS = {
+    # វីដេអូ
+    'mp4': {'format': 'mp4', 'video': {'h264', 'hevc', 'mpeg4', 'av1'}, 'audio': {'aac', 'mp3', 'alac', 'opus'}, 'vcodec': 'libx264', 'acodec': 'aac'},
+    'mov': {'format': 'mov', 'video': {'h264', 'hevc', 'mpeg4', 'prores', 'mjpeg'}, 'audio': {'aac', 'mp3', 'alac', 'pcm_s16le'}, 'vcodec': 'libx264', 'acodec': 'aac'},
+    'mkv': {'format': 'matroska', 'video': None, 'audio': None, 'vcodec': 'libx264', 'acodec': 'aac'},
+    'webm': {'format': 'webm', 'video': {'vp8', 'vp9', 'av1'}, 'audio': {'vorbis', 'opus'}, 'vcodec': 'libvpx-vp9', 'acodec': 'libopus'},
+    'avi': {'format': 'avi', 'video': {'mpeg4', 'h264', 'mjpeg', 'msmpeg4v3'}, 'audio': {'mp3', 'ac3', 'pcm_s16le'}, 'vcodec': 'mpeg4', 'acodec': 'libmp3lame'},
+    'flv': {'format': 'flv', 'video': {'h264', 'flv1'}, 'audio': {'aac', 'mp3'}, 'vcodec': 'libx264', 'acodec': 'aac'},
+    '3gp': {'format': '3gp', 'video': {'h263', 'h264', 'mpeg4'}, 'audio': {'aac', 'amr_nb', 'amr_wb'}, 'vcodec': 'libx264', 'acodec': 'aac'},
+    '3g2': {'format': '3g2', 'video': {'h263', 'h264', 'mpeg4'}, 'audio': {'aac', 'amr_nb', 'amr_wb'}, 'vcodec': 'libx264', 'acodec': 'aac'},
+    'mpg': {'format': 'mpeg', 'video': {'mpeg1video', 'mpeg2video'}, 'audio': {'mp2', 'mp3', 'ac3'}, 'vcodec': 'mpeg2video', 'acodec': 'mp2'},
+    'ogv': {'format': 'ogg', 'video': {'theora'}, 'audio': {'vorbis', 'opus', 'flac'}, 'vcodec': 'libtheora', 'acodec': 'libvorbis'},
+    'wmv': {'format': 'asf', 'video': {'wmv1', 'wmv2'}, 'audio': {'wmav1', 'wmav2'}, 'vcodec': 'wmv2', 'acodec': 'wmav2'},
+    # សម្លេង
+    'mp3': {'format': 'mp3', 'audio': {'mp3'}, 'acodec': 'libmp3lame'},
+    'aac': {'format': 'adts', 'audio': {'aac'}, 'acodec': 'aac'},
+    'm4a': {'format': 'ipod', 'audio': {'aac', 'alac'}, 'acodec': 'aac'},
+    'm4r': {'format': 'ipod', 'audio': {'aac'}, 'acodec': 'aac'},
+    'flac': {'format': 'flac', 'audio': {'flac'}, 'acodec': 'flac'},
+    'wav': {'format': 'wav', 'audio': {'pcm_s16le', 'pcm_s24le', 'pcm_u8'}, 'acodec': 'pcm_s16le'},
+    'aiff': {'format': 'aiff', 'audio': {'pcm_s16be', 'pcm_s24be'}, 'acodec': 'pcm_s16be'},
+    'ogg': {'format': 'ogg', 'audio': {'vorbis', 'opus', 'flac'}, 'acodec': 'libvorbis'},
+    'opus': {'format': 'opus', 'audio': {'opus'}, 'acodec': 'libopus'},
+    'wma': {'format': 'asf', 'audio': {'wmav1', 'wmav2'}, 'acodec': 'wmav2'},
+    'mmf': {'format': 'mmf', 'audio': {'adpcm_yamaha'}, 'acodec': 'adpcm_yamaha', 'extra': {'ar': 22050, 'ac': 1}},
+}
+LOSSLESS_AUDIO_ENCODERS = {'flac', 'pcm_s16le', 'pcm_s16be', 'adpcm_yamaha'}
+AUDIO_BITRATE_KBPS = 128
+
+def build_media_plan(probe, output_format, media_type, input_size=0, size_limit=None, threads=0):
+    """ជ្រើសរើសការចម្លង Stream (remux) ឬការបំប្លែងឡើងវិញសម្រាប់ Track នីមួយៗ
+
+    size_limit (bytes)៖ ទំហំលទ្ធផលអតិបរមា (ឧ. ដែន Upload របស់ Telegram)។ threads 0 = ឱ្យ FFmpeg ជ្រើសរើស។
+    ត្រឡប់ (kwargs សម្រាប់ ffmpeg.output, បញ្ជីពិពណ៌នាផែនការ)។
+    """
+    container = MEDIA_CONTAINERS.get(output_format)
+    if container is None:
+        return {}, []
+    streams = probe.get('streams', [])
+    video = next((st for st in streams if st.get('codec_type') == 'video' and not st.get('disposition', {}).get('attached_pic')), None)
+    audio = next((st for st in streams if st.get('codec_type') == 'audio'), None)
+    duration = media_duration(probe)
+    kwargs = {'format': container['format'], 'threads': threads, 'sn': None}
+    kwargs.update(container.get('extra', {}))
+    plan = []
+
+    if media_type == 'video' and video is not None and 'vcodec' in container:
+        allowed = container['video']
+        height = int(video.get('height') or 0)
+        too_tall = height > MAX_VIDEO_HEIGHT
+        fits = size_limit is None or (input_size and input_size <= size_limit)
+        if (allowed is None or video.get('codec_name') in allowed) and not too_tall and fits:
+            kwargs['c:v'] = 'copy'
+            plan.append(f"video: copy ({video.get('codec_name')})")
+        else:
+            vcodec = container['vcodec']
+            kwargs['c:v'] = vcodec
+            if too_tall:
+                kwargs['vf'] = f"scale=-2:{MAX_VIDEO_HEIGHT}"
+            # កំណត់ Bitrate ឱ្យលទ្ធផលមិនលើស size_limit
+            max_kbps = None
+            if duration and size_limit:
+                max_kbps = max(150, int(size_limit * 8 * 0.9 / duration / 1000) - AUDIO_BITRATE_KBPS)
+            if vcodec in ('libx264', 'libx265'):
+                kwargs.update({'preset': MEDIA_ENCODER_PRESET, 'crf': 23, 'pix_fmt': 'yuv420p'})
+                if max_kbps:
+                    kwargs.update({'maxrate': f"{max_kbps}k", 'bufsize': f"{max_kbps * 2}k"})
+            elif vcodec == 'libvpx-vp9':
+                kwargs.update({'deadline': 'realtime', 'cpu-used': 8, 'row-mt': 1, 'crf': 33, 'b:v': f"{max_kbps or 0}k"})
+            elif max_kbps:
+                kwargs['b:v'] = f"{min(max_kbps, 4000)}k"
+            plan.append(f"video: {video.get('codec_name')} → {vcodec}" + (f" ≤{MAX_VIDEO_HEIGHT}p" if too_tall else ""))
+        if output_format in ('mp4', 'mov'):
+            kwargs['movflags'] = '+faststart'
+    else:
+        kwargs['vn'] = None
+
+    if audio is not None:
+        allowed = container['audio']
+        if allowed is None or audio.get('codec_name') in allowed:
+            kwargs['c:a'] = 'copy'
+            plan.append(f"audio: copy ({audio.get('codec_name')})")
+        else:
+            acodec = container['acodec']
+            kwargs['c:a'] = acodec
+            if acodec not in LOSSLESS_AUDIO_ENCODERS:
+                kwargs['b:a'] = f"{AUDIO_BITRATE_KBPS}k"
+            plan.append(f"audio: {audio.get('codec_name')} → {acodec}")
+    return kwargs, plan
+
+def probe_media(file_path):
+    """អានព័ត៌មាន Stream និង Format របស់ឯកសារដោយ ffprobe (ត្រឡប់ dict ទទេ ប្រសិនបើបរាជ័យ)"""
+    proc = subprocess.run([FFPROBE_BIN, '-v', 'error', '-show_format', '-show_streams', '-of', 'json', file_path],
+                          stdout=subprocess.PIPE, stderr=subprocess.DEVNULL)
+    if proc.returncode != 0:
+        return {}
+    try:
+        return json.loads(proc.stdout.decode() or "{}")
+    except ValueError:
+        return {}
+
+# --- API៖ ឯកសារបញ្ចូល + Parameter → ឯកសារលទ្ធផល + ស្ថិតិ ---
+
+def _result(inputs, outputs, started, **stats):
+    """លទ្ធផលរួមរបស់អនុគមន៍ API នីមួយៗ"""
+    stats.update(outputs=outputs, seconds=time.perf_counter() - started,
+                 input_bytes=sum(os.path.getsize(path) for path in inputs if os.path.exists(path)),
+                 output_bytes=sum(os.path.getsize(path) for path in outputs if os.path.exists(path)))
+    return stats
+
+def pdf_to_images(file_path, output_dir, fmt='jpeg', dpi=PDF_RENDER_DPI, window=PDF_RENDER_WINDOW):
+    """បំប្លែងទំព័រនីមួយៗរបស់ PDF ទៅជារូបភាពក្នុង output_dir (ម្ដងមួយក្រុមតូចៗ)"""
+    started = time.perf_counter()
+    total = pdf_page_count(file_path)
+    if not total: raise ValueError("ឯកសារ PDF នេះគ្មានទំព័រទេ")
+    os.makedirs(output_dir, exist_ok=True)
+    outputs = []
+    for first in range(1, total + 1, window):
+        outputs += render_pdf_window(file_path, fmt, first, min(first + window - 1, total), output_dir, dpi)
+    return _result([file_path], outputs, started, pages=total)
+
+def merge_pdfs(file_paths, output_path, titles=None):
+    """បញ្ចូល PDF ច្រើនជាមួយ Bookmark តាមឯកសារ (titles លំនាំដើម៖ ឈ្មោះឯកសារ, False៖ គ្មាន Bookmark)"""
+    started = time.perf_counter()
+    pages = _merge_pdfs(file_paths, output_path, titles)
+    return _result(file_paths, [output_path], started, files=len(file_paths), pages=pages)
+
+def split_pdf(file_path, page_range_str, output_dir):
+    """បំបែក PDF តាមកន្សោមទំព័រ (មើល parse_page_ranges) ទៅជាឯកសារមួយ ឬច្រើនក្នុង output_dir"""
+    started = time.perf_counter()
+    os.makedirs(output_dir, exist_ok=True)
+    total, parts = _split_pdf(file_path, page_range_str, output_dir)
+    return _result([file_path], [part['path'] for part in parts], started, pages=total, parts=parts)
+
+def compress_pdf(file_path, output_path, level='medium'):
+    started = time.perf_counter()
+    stats = _compress_pdf(file_path, output_path, level)
+    return _result([file_path], [output_path], started, level=level, **stats)
+
+def images_to_pdf(file_paths, output_path, page_size='original', downscale=False, prepared=None):
+    started = time.perf_counter()
+    _images_to_pdf(file_paths, output_path, page_size, downscale, prepared)
+    return _result(file_paths, [output_path], started, pages=len(file_paths))
+
+def ocr_image(file_path, lang=OCR_LANG, psm=OCR_DEFAULT_PSM):
+    """OCR រូបភាពមួយ។ អក្សរនៅក្នុង 'text' (គ្មានឯកសារលទ្ធផលទេ)"""
+    started = time.perf_counter()
+    text, stats = _ocr_image(file_path, lang, psm)
+    return _result([file_path], [], started, text=text, **stats)
+
+def ocr_text_body(texts):
+    """ភ្ជាប់អក្សរតាមទំព័រទៅជាឯកសារ TXT តែមួយ"""
+    return "".join(f"--- ទំព័រ {number} ---\n{text.strip()}\n\n" for number, text in enumerate(texts, start=1))
+
+def ocr_document(file_paths, output_path, output='txt', lang=OCR_LANG, dpi=OCR_DPI, batch_pages=OCR_BATCH_PAGES):
+    """OCR PDF និងរូបភាពច្រើន ទៅជាឯកសារ TXT ឬ PDF ដែលអាចស្វែងរកបានតែមួយ (ក្នុង Process តែមួយ)"""
+    started = time.perf_counter()
+    work_dir = tempfile.mkdtemp(prefix="ocr_", dir=os.path.dirname(os.path.abspath(output_path)))
+    try:
+        results, pages = [], 0
+        for path in file_paths:
+            if not path.lower().endswith('.pdf'):
+                results.append(ocr_batch([path], lang, output, os.path.join(work_dir, f"batch{len(results):05d}")))
+                pages += 1
+                continue
+            total = pdf_page_count(path)
+            for first in range(1, total + 1, batch_pages):
+                rendered = render_pdf_window(path, 'png', first, min(first + batch_pages - 1, total), work_dir, dpi, True)
+                results.append(ocr_batch(rendered, lang, output, os.path.join(work_dir, f"batch{len(results):05d}"), dpi))
+                for image_path in rendered:
+                    os.remove(image_path)
+            pages += total
+        if output == 'pdf':
+            _merge_pdfs(results, output_path, titles=False)
+        else:
+            with open(output_path, 'w', encoding='utf-8') as f:
+                f.write(ocr_text_body([text for batch in results for text in batch]))
+    finally:
+        shutil.rmtree(work_dir, ignore_errors=True)
+    return _result(file_paths, [output_path], started, pages=pages)
+
+def convert_media(file_path, output_path, output_format, media_type='audio', size_limit=None, threads=0):
+    """បំប្លែងសម្លេង/វីដេអូដោយ FFmpeg តាមផែនការដូចគ្នានឹង Bot (ចម្លង Stream នៅពេលអាចធ្វើបាន)"""
+    started = time.perf_counter()
+    probe = probe_media(file_path)
+    kwargs, plan = build_media_plan(probe, output_format, media_type, os.path.getsize(file_path), size_limit, threads)
+    ffmpeg.input(file_path).output(output_path, **kwargs).overwrite_output().run(cmd=FFMPEG_BIN, quiet=True)
+    return _result([file_path], [output_path], started, plan=plan, duration=media_duration(probe))
+
+def create_archive(file_paths, output_path, fmt='zip', level='normal', prepared=None):
+    started = time.perf_counter()
+    try:
+        _create_archive(file_paths, output_path, fmt, level, prepared)
+    finally:
+        for path in file_paths:
+            if os.path.exists(path + '.part'): os.remove(path + '.part')
+    return _result(file_paths, [output_path], started, files=len(file_paths), format=fmt, level=level)
+
+def extract_archive(file_path, output_dir, max_entry_size=None):
+    """ពន្លា Entry ទាំងអស់ដែលមានសុវត្ថិភាពទៅកាន់ output_dir (រក្សារចនាសម្ព័ន្ធថត)"""
+    started = time.perf_counter()
+    archive = SafeArchive(file_path, max_entry_size)
+    outputs = []
+    try:
+        for index, entry in enumerate(archive.entries):
+            output_path = os.path.join(output_dir, entry['name'])
+            os.makedirs(os.path.dirname(output_path), exist_ok=True)
+            outputs.append(archive.extract(index, output_path))
+    finally:
+        archive.close()
+    return _result([file_path], outputs, started, skipped=archive.skipped)
+
+# --- Command Line៖ បំប្លែងឯកសារ ឬថតទាំងមូលស្របគ្នាតាមស្នូល CPU ---
+
+PDF_EXTENSIONS = ('.pdf',)
+IMAGE_EXTENSIONS = ('.jpg', '.jpeg', '.png', '.webp', '.bmp', '.tif', '.tiff', '.gif')
+MEDIA_EXTENSIONS = ('.mp3', '.wav', '.m4a', '.aac', '.flac', '.ogg', '.opus', '.wma', '.mp4', '.mkv', '.mov', '.webm', '.avi', '.flv', '.3gp', '.mpg', '.wmv')
+ARCHIVE_EXTENSIONS = ('.zip', '.tar', '.tar.gz', '.tgz', '.tar.bz2', '.tar.xz')
+
+# ការងារ៖ (ប្រភេទឯកសារបញ្ចូល (None = ទាំងអស់), True ប្រសិនបើឯកសារទាំងអស់បញ្ចូលគ្នាជាលទ្ធផលតែមួយ)
+CLI_OPERATIONS = {
+    'pdf_to_img': (PDF_EXTENSIONS, False),
+    'compress_pdf': (PDF_EXTENSIONS, False),
+    'split_pdf': (PDF_EXTENSIONS, False),
+    'ocr_image': (IMAGE_EXTENSIONS, False),
+    'ocr_document': (PDF_EXTENSIONS + IMAGE_EXTENSIONS, False),
+    'media': (MEDIA_EXTENSIONS, False),
+    'extract_archive': (ARCHIVE_EXTENSIONS, False),
+    'merge_pdf': (PDF_EXTENSIONS, True),
+    'img_to_pdf': (IMAGE_EXTENSIONS, True),
+    'create_archive': (None, True),
+}
+
+def _stem(path):
+    name = os.path.basename(path)
+    for ext in ARCHIVE_EXTENSIONS:
+        if name.lower().endswith(ext):
+            return name[:-len(ext)]
+    return os.path.splitext(name)[0]
+
+def cli_output_path(op, input_path, output_dir, options):
+    """ផ្លូវលទ្ធផលសម្រាប់ឯកសារបញ្ចូលមួយ (ឬសម្រាប់ការងារដែលបញ្ចូលឯកសារទាំងអស់គ្នា)"""
+    stem = _stem(input_path) if input_path else None
+    if op in ('pdf_to_img', 'split_pdf', 'extract_archive'):
+        return os.path.join(output_dir, stem)
+    if op == 'compress_pdf':
+        return os.path.join(output_dir, f"{stem}.pdf")
+    if op == 'ocr_image':
+        return os.path.join(output_dir, f"{stem}.txt")
+    if op == 'ocr_document':
+        return os.path.join(output_dir, f"{stem}.{options['ocr_output']}")
+    if op == 'media':
+        return os.path.join(output_dir, f"{stem}.{options['format']}")
+    if op == 'merge_pdf':
+        return os.path.join(output_dir, "merged.pdf")
+    if op == 'img_to_pdf':
+        return os.path.join(output_dir, "images.pdf")
+    return os.path.join(output_dir, "archive" + ARCHIVE_FORMATS[options['archive_format']][2])
+
+def run_operation(op, inputs, output_path, options):
+    """ដំណើរការការងារ CLI មួយ (ក្នុង Process កូន)"""
+    os.makedirs(os.path.dirname(output_path) or ".", exist_ok=True)
+    if op == 'pdf_to_img':
+        return pdf_to_images(inputs[0], output_path, options['fmt'])
+    if op == 'compress_pdf':
+        return compress_pdf(inputs[0], output_path, options['level'])
+    if op == 'split_pdf':
+        return split_pdf(inputs[0], options['pages'], output_path)
+    if op == 'ocr_image':
+        result = ocr_image(inputs[0], options['lang'], options['psm'])
+        with open(output_path, 'w', encoding='utf-8') as f:
+            f.write(result.pop('text'))
+        result['outputs'] = [output_path]
+        return result
+    if op == 'ocr_document':
+        return ocr_document(inputs, output_path, options['ocr_output'], options['lang'])
+    if op == 'media':
+        media_type = 'audio' if options['format'] in MEDIA_CONTAINERS and 'vcodec' not in MEDIA_CONTAINERS[options['format']] else 'video'
+        return convert_media(inputs[0], output_path, options['format'], media_type)
+    if op == 'extract_archive':
+        return extract_archive(inputs[0], output_path)
+    if op == 'merge_pdf':
+        return merge_pdfs(inputs, output_path)
+    if op == 'img_to_pdf':
+        return images_to_pdf(inputs, output_path, options['page_size'], options['downscale'])
+    return create_archive(inputs, output_path, options['archive_format'], options['archive_level'])
+
+def collect_inputs(paths, extensions, recursive):
+    """ពង្រីកថតទៅជាបញ្ជីឯកសារ។ ត្រឡប់ [(ផ្លូវឯកសារ, ថតរងដែលទាក់ទងនឹងថតបញ្ចូល)]"""
+    found = []
+    for path in paths:
+        if os.path.isfile(path):
+            found.append((path, ""))
+            continue
+        for dirpath, dirnames, filenames in os.walk(path):
+            dirnames.sort()
+            if not recursive:
+                dirnames.clear()
+            for name in sorted(filenames):
+                if extensions is None or name.lower().endswith(extensions):
+                    found.append((os.path.join(dirpath, name), os.path.relpath(dirpath, path)))
+    return found
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="បំប្លែងឯកសារដោយ Engine ដូចគ្នានឹង Bot (គ្មាន Telegram)")
+    parser.add_argument('op', choices=sorted(CLI_OPERATIONS), help="ការងារដែលត្រូវធ្វើ")
+    parser.add_argument('inputs', nargs='+', help="ឯកសារ ឬថត")
+    parser.add_argument('-o', '--output-dir', required=True, help="ថតសម្រាប់លទ្ធផល")
+    parser.add_argument('-r', '--recursive', action='store_true', help="ស្វែងរកឯកសារក្នុងថតរងផងដែរ (រក្សារចនាសម្ព័ន្ធថត)")
+    parser.add_argument('-j', '--workers', type=int, default=os.cpu_count() or 1, help="ចំនួន Process ស្របគ្នា")
+    parser.add_argument('--skip-existing', action='store_true', help="រំលងឯកសារដែលមានលទ្ធផលរួចហើយ")
+    parser.add_argument('--fmt', choices=('jpeg', 'png'), default='jpeg', help="pdf_to_img៖ ទ្រង់ទ្រាយរូបភាព")
+    parser.add_argument('--level', choices=sorted(COMPRESSION_LEVELS), default='medium', help="compress_pdf៖ កម្រិតបង្រួម")
+    parser.add_argument('--pages', help="split_pdf៖ ទំព័រ (ឧ. 2-5, 1,3,8, '1-5;6-10', 'every 10', odd, 'last 3')")
+    parser.add_argument('--lang', default=OCR_LANG, help="OCR៖ ភាសា tesseract")
+    parser.add_argument('--psm', type=int, default=OCR_DEFAULT_PSM, help="ocr_image៖ Page Segmentation Mode")
+    parser.add_argument('--ocr-output', choices=('txt', 'pdf'), default='txt', help="ocr_document៖ ទ្រង់ទ្រាយលទ្ធផល")
+    parser.add_argument('--format', choices=sorted(MEDIA_CONTAINERS), default='mp3', help="media៖ ទ្រង់ទ្រាយលទ្ធផល")
+    parser.add_argument('--page-size', choices=('original', 'a4'), default='original', help="img_to_pdf៖ ទំហំទំព័រ")
+    parser.add_argument('--downscale', action='store_true', help=f"img_to_pdf៖ បន្ថយរូបភាពមកត្រឹម {IMG_TO_PDF_MAX_SIDE}px")
+    parser.add_argument('--archive-format', choices=sorted(ARCHIVE_FORMATS), default='zip', help="create_archive៖ ទ្រង់ទ្រាយ")
+    parser.add_argument('--archive-level', choices=sorted(ARCHIVE_LEVELS), default='normal', help="create_archive៖ កម្រិតបង្រួម")
+    args = parser.parse_args(argv)
+    if args.op == 'split_pdf' and not args.pages:
+        parser.error("split_pdf ត្រូវការ --pages")
+    return args
+
+def cli(argv=None):
+    args = parse_args(argv)
+    options = vars(args)
+    extensions, combine = CLI_OPERATIONS[args.op]
+    inputs = collect_inputs(args.inputs, extensions, args.recursive)
+    if not inputs:
+        print("!!! រកមិនឃើញឯកសារបញ្ចូលទេ", file=sys.stderr)
+        return 2
+    if combine:
+        jobs = [([path for path, _ in inputs], cli_output_path(args.op, None, args.output_dir, options))]
+    else:
+        jobs = [([path], cli_output_path(args.op, path, os.path.normpath(os.path.join(args.output_dir, rel)), options)) for path, rel in inputs]
+    if args.skip_existing:
+        jobs = [job for job in jobs if not os.path.exists(job[1])]
+    failed = 0
+    started = time.perf_counter()
+    # លទ្ធផលនីមួយៗត្រូវបានបោះពុម្ពជា JSON មួយបន្ទាត់ ដើម្បីងាយស្រួលប្រមូលស្ថិតិ
+    with ProcessPoolExecutor(max_workers=max(1, min(args.workers, len(jobs) or 1))) as executor:
+        futures = {executor.submit(run_operation, args.op, paths, output_path, options): paths for paths, output_path in jobs}
+        for future in as_completed(futures):
+            record = {'inputs': futures[future]}
+            try:
+                result = future.result()
+                result.pop('text', None)
+                record.update(result, status='ok')
+            except Exception as e:
+                failed += 1
+                record.update(status='error', error=f"{type(e).__name__}: {e}")
+            print(json.dumps(record, ensure_ascii=False, default=str), flush=True)
+    print(f">>> {len(jobs) - failed}/{len(jobs)} ជោគជ័យ ក្នុងរយៈពេល {time.perf_counter() - started:.1f} វិនាទី", file=sys.stderr)
+    return 1 if failed else 0
+
+if __name__ == "__main__":
+    sys.exit(cli(sys.argv[1:]))
@@ -3,28 +3,55 @@ import logging
 import os
 import sys
 import asyncio
+import multiprocessing
+import heapq
+import itertools
+import time
+import uuid
+import functools
+import contextvars
+import datetime
+import hashlib
+import hmac
+import json
+import sqlite3
+import threading
+import resource
+import signal
 import ffmpeg
 import zipfile
-import tarfile
 import shutil
-from telegram import InlineKeyboardButton, InlineKeyboardMarkup, Update
+import tempfile
+import tornado.web
+from pathlib import Path
+from collections import defaultdict
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from telegram import Chat, InlineKeyboardButton, InlineKeyboardMarkup, InputMediaDocument, InputMediaPhoto, Message, Update
+from telegram.error import BadRequest, NetworkError, RetryAfter, TimedOut
+from telegram.request import HTTPXRequest
 from telegram.ext import (
     Application,
+    BasePersistence,
+    BaseUpdateProcessor,
     CommandHandler,
     CallbackQueryHandler,
     ContextTypes,
     ConversationHandler,
+    ExtBot,
     MessageHandler,
+    PersistenceInput,
     filters,
 )
-from PIL import Image
-import pytesseract
 from typing import Final
 
 # ពិនិត្យ Library
 try:
-    from PyPDF2 import PdfReader, PdfWriter, PdfMerger
-    from pdf2image import convert_from_path
+    # ការបំប្លែងទាំងអស់ស្ថិតនៅក្នុង engine.py (អាចប្រើដោយគ្មាន Telegram ផងដែរ)
+    import engine
+    from engine import (
+        ARCHIVE_FORMATS, ARCHIVE_LEVELS, COMPRESSION_LEVELS, FFMPEG_BIN, IMG_TO_PDF_MAX_SIDE,
+        OCR_BATCH_PAGES, OCR_DEFAULT_PSM, OCR_DPI, OCR_LANG, OCR_PREPROCESS, PDF_RENDER_DPI, PDF_RENDER_WINDOW,
+    )
 except ImportError:
     # ក្នុង Render buildCommand នឹងដំឡើង Library ទាំងអស់
     # នេះគ្រាន់តែជាការពិនិត្យក្នុងតំបន់ប៉ុណ្ណោះ
@@ -34,12 +61,107 @@ except ImportError:
 # --- ការកំណត់តម្លៃសំខាន់ៗសម្រាប់ Render Deployment ---
 # BOT_TOKEN ត្រូវបានយកពី Environment Variable (ដូចដែលបានកំណត់ក្នុង render.yaml)
 BOT_TOKEN: Final = os.environ.get("BOT_TOKEN", "") 
-MAX_FILE_SIZE: Final = 50 * 1024 * 1024 # កំណត់ទំហំ File អតិបរមា 50 MB
+# ម៉ាស៊ីន Bot API ក្នុងតំបន់ (telegram-bot-api --local) ឧ. http://localhost:8081៖ ឯកសាររហូតដល់ 2GB
+# ហើយឯកសារត្រូវបានយកពី Disk របស់ Server ដោយផ្ទាល់ (Hard Link) និងផ្ញើជា file:// ដោយមិនចម្លង
+LOCAL_BOT_API_URL: Final = os.environ.get("LOCAL_BOT_API_URL", "").rstrip('/')
+TELEGRAM_FILE_LIMIT: Final = (2000 if LOCAL_BOT_API_URL else 50) * 1024 * 1024
+MAX_FILE_SIZE: Final = int(os.environ.get("MAX_FILE_SIZE", str(TELEGRAM_FILE_LIMIT))) # កំណត់ទំហំ File អតិបរមា (50 MB ឬ 2 GB)
 
 # ទទួលបាន URL និង PORT ពី Render Environment
 # RENDER_EXTERNAL_URL គឺជា URL HTTPS ពេញលេញរបស់ Render Service
 WEBHOOK_URL: Final = os.environ.get("RENDER_EXTERNAL_URL", "") 
 PORT: Final = int(os.environ.get("PORT", "8000")) 
+# Telegram ផ្ញើ Secret នេះក្នុង Header X-Telegram-Bot-Api-Secret-Token (អក្សរ A-Z a-z 0-9 _ - តែប៉ុណ្ណោះ; លំនាំដើម៖ Hash នៃ BOT_TOKEN)
+WEBHOOK_SECRET: Final = os.environ.get("WEBHOOK_SECRET") or hashlib.sha256(f"webhook:{BOT_TOKEN}".encode()).hexdigest()
+WEBHOOK_DROP_PENDING: Final = os.environ.get("WEBHOOK_DROP_PENDING", "0") == "1"
+
+# ចំនួន Worker សម្រាប់ការងារធ្ងន់ៗ (CPU) និងការងារ I/O
+CPU_WORKERS: Final = int(os.environ.get("CPU_WORKERS", str(os.cpu_count() or 1)))
+IO_WORKERS: Final = int(os.environ.get("IO_WORKERS", "4"))
+# ចំនួន Update អតិបរមាដែលដំណើរការស្របគ្នា (Update របស់ Chat តែមួយនៅតែដំណើរការតាមលំដាប់)
+CONCURRENT_UPDATES: Final = int(os.environ.get("CONCURRENT_UPDATES", "64"))
+
+# រយៈពេលអប្បបរមា (វិនាទី) រវាងការកែសារស្ថានភាពពីរដង ដើម្បីកុំឱ្យលើសដែនកំណត់របស់ Telegram
+PROGRESS_EDIT_INTERVAL: Final = float(os.environ.get("PROGRESS_EDIT_INTERVAL", "3"))
+
+# ការផ្ញើលទ្ធផលជាក្រុម (Media Group) ព្រមទាំងការគោរពដែនកំណត់ល្បឿនរបស់ Telegram
+MEDIA_GROUP_SIZE: Final = 10
+UPLOAD_CONCURRENCY: Final = int(os.environ.get("UPLOAD_CONCURRENCY", "3"))
+SEND_RETRIES: Final = int(os.environ.get("SEND_RETRIES", "5"))
+CHAT_SEND_INTERVAL: Final = float(os.environ.get("CHAT_SEND_INTERVAL", "1.0"))
+GLOBAL_SENDS_PER_SECOND: Final = float(os.environ.get("GLOBAL_SENDS_PER_SECOND", "25"))
+# ចំនួនទំព័រដែលលើសពីនេះ Bot នឹងស្នើផ្ញើជាឯកសារ ZIP តែមួយ
+ZIP_OFFER_THRESHOLD: Final = int(os.environ.get("ZIP_OFFER_THRESHOLD", "30"))
+CHOICE_TIMEOUT: Final = float(os.environ.get("CHOICE_TIMEOUT", "60"))
+
+# ឃ្លាំងលទ្ធផល (Result Cache)៖ ផ្ញើលទ្ធផលចាស់ឡើងវិញតាម file_id ពេលអ្នកប្រើផ្ញើឯកសារដដែល
+CACHE_DB_PATH: Final = os.environ.get("CACHE_DB_PATH", "result_cache.sqlite3")
+CACHE_TTL: Final = int(os.environ.get("CACHE_TTL", str(7 * 24 * 3600)))
+CACHE_MAX_ENTRIES: Final = int(os.environ.get("CACHE_MAX_ENTRIES", "5000"))
+
+# ស្ថានភាព Conversation និងកំណត់ត្រាការងារ (Job Journal)៖ មិនបាត់បង់ការងារពេល Bot ចាប់ផ្ដើមឡើងវិញ
+STATE_DB_PATH: Final = os.environ.get("STATE_DB_PATH", "bot_state.sqlite3")
+STATE_FLUSH_INTERVAL: Final = float(os.environ.get("STATE_FLUSH_INTERVAL", "10"))
+# ចំនួនដងអតិបរមាដែលការងារមួយអាចចាប់ផ្ដើម (ការងារដែលធ្វើឱ្យ Bot គាំងម្ដងហើយម្ដងទៀតនឹងមិនត្រូវបន្តទេ)
+JOB_RESUME_ATTEMPTS: Final = int(os.environ.get("JOB_RESUME_ATTEMPTS", "2"))
+
+# FFmpeg៖ ពេលវេលាអតិបរមា (វិនាទី) និងពេលវេលា CPU អតិបរមាសម្រាប់ការបំប្លែងមួយ
+MEDIA_JOB_TIMEOUT: Final = float(os.environ.get("MEDIA_JOB_TIMEOUT", "900"))
+MEDIA_CPU_LIMIT: Final = int(os.environ.get("MEDIA_CPU_LIMIT", "1800"))
+# ទំហំអតិបរមាដែល Bot អាចផ្ញើទៅ Telegram
+TELEGRAM_UPLOAD_LIMIT: Final = int(os.environ.get("TELEGRAM_UPLOAD_LIMIT", str(TELEGRAM_FILE_LIMIT)))
+
+# ចំនួនឯកសារអតិបរមាដែលត្រូវរៀបចំនៅផ្ទៃខាងក្រោយក្នុងពេលតែមួយ ពេលអ្នកប្រើកំពុងផ្ញើឯកសារ (merge, img_to_pdf, zip)
+PIPELINE_WORKERS: Final = int(os.environ.get("PIPELINE_WORKERS", str(max(1, CPU_WORKERS // 2))))
+# ចំនួនឯកសារដែលអ្នកប្រើម្នាក់អាចទាញយកស្របគ្នា ពេលកំពុងប្រមូលឯកសារសម្រាប់បញ្ចូលគ្នា
+DOWNLOAD_CONCURRENCY: Final = int(os.environ.get("DOWNLOAD_CONCURRENCY", "4"))
+
+# រយៈពេលរង់ចាំអ្នកប្រើប្រាស់ជ្រើសរើសឯកសារដែលត្រូវពន្លា (វិនាទី)
+ARCHIVE_SELECT_TIMEOUT: Final = float(os.environ.get("ARCHIVE_SELECT_TIMEOUT", "120"))
+
+# ថតការងារ (Workspace)៖ ការងារនីមួយៗមានថតផ្ទាល់ខ្លួន ហើយការងារតូចៗប្រើ tmpfs (/dev/shm)
+WORKSPACE_ROOT: Final = os.environ.get("WORKSPACE_ROOT", os.path.abspath("workspaces"))
+WORKSPACE_TMPFS_ROOT: Final = os.environ.get("WORKSPACE_TMPFS_ROOT", "/dev/shm/doc_converter" if os.path.isdir("/dev/shm") else "")
+WORKSPACE_TMPFS_FILE_LIMIT: Final = int(os.environ.get("WORKSPACE_TMPFS_FILE_LIMIT", str(10 * 1024 * 1024)))
+WORKSPACE_TMPFS_QUOTA: Final = int(os.environ.get("WORKSPACE_TMPFS_QUOTA", str(256 * 1024 * 1024)))
+# កូតា (គិតជា Byte)៖ ឯកសារនីមួយៗត្រូវបានបម្រុងទុក WORKSPACE_SIZE_FACTOR ដងនៃទំហំរបស់វា សម្រាប់លទ្ធផល
+WORKSPACE_USER_QUOTA: Final = int(os.environ.get("WORKSPACE_USER_QUOTA", str(300 * 1024 * 1024)))
+WORKSPACE_GLOBAL_QUOTA: Final = int(os.environ.get("WORKSPACE_GLOBAL_QUOTA", str(2 * 1024 * 1024 * 1024)))
+WORKSPACE_MIN_FREE: Final = int(os.environ.get("WORKSPACE_MIN_FREE", str(200 * 1024 * 1024)))
+WORKSPACE_SIZE_FACTOR: Final = float(os.environ.get("WORKSPACE_SIZE_FACTOR", "3"))
+# ថតការងាររបស់ Conversation ដែលគ្មានសកម្មភាពលើសពីនេះ (វិនាទី) ត្រូវបានលុបចោល
+WORKSPACE_TTL: Final = float(os.environ.get("WORKSPACE_TTL", "3600"))
+WORKSPACE_SWEEP_INTERVAL: Final = float(os.environ.get("WORKSPACE_SWEEP_INTERVAL", "300"))
+
+# Metrics ជាទ្រង់ទ្រាយ Prometheus៖ Bot បង្ហាញវានៅលើ /metrics របស់ Webhook Server (PORT) ដែល Render បញ្ជូនមក
+# ប៉ុន្តែតែនៅពេលកំណត់ METRICS_TOKEN ប៉ុណ្ណោះ ព្រោះ Port នោះជាសាធារណៈ (Prometheus ផ្ញើ "Authorization: Bearer <token>")
+# METRICS_PORT (0 = បិទ) គឺជា Server ដាច់ដោយឡែកនៅលើ http://METRICS_HOST:METRICS_PORT/metrics សម្រាប់ worker.py
+METRICS_TOKEN: Final = os.environ.get("METRICS_TOKEN", "")
+METRICS_HOST: Final = os.environ.get("METRICS_HOST", "0.0.0.0")
+METRICS_PORT: Final = int(os.environ.get("METRICS_PORT", "0"))
+# ទ្រង់ទ្រាយ Log៖ "json" (មាន job_id និង op) ឬ "text"
+LOG_FORMAT: Final = os.environ.get("LOG_FORMAT", "json")
+
+# ការកំណត់សម្រាប់ជួរការងារ (Job Queue)
+MAX_QUEUED_JOBS: Final = int(os.environ.get("MAX_QUEUED_JOBS", "30"))
+MAX_RUNNING_JOBS: Final = int(os.environ.get("MAX_RUNNING_JOBS", "4"))
+MAX_JOBS_PER_CHAT: Final = int(os.environ.get("MAX_JOBS_PER_CHAT", "1"))
+# ផ្លូវការងារ (Lanes)៖ ការងារលឿនៗ មិនត្រូវរង់ចាំនៅពីក្រោយការបំប្លែងវីដេអូទេ
+LANE_LIMITS: Final = {
+    'fast': int(os.environ.get("FAST_LANE_JOBS", "2")),
+    'document': int(os.environ.get("DOCUMENT_LANE_JOBS", "2")),
+    'media': int(os.environ.get("MEDIA_LANE_JOBS", "1")),
+}
+
+# Job Broker៖ "" = ដំណើរការការងារក្នុង Process របស់ Bot, "sqlite" = Bot គ្រាន់តែបញ្ចូលការងារទៅក្នុងជួរ ហើយ worker.py ដំណើរការវា
+JOB_BROKER: Final = os.environ.get("JOB_BROKER", "")
+BROKER_DB_PATH: Final = os.environ.get("BROKER_DB_PATH", "job_queue.sqlite3")
+BROKER_POLL_INTERVAL: Final = float(os.environ.get("BROKER_POLL_INTERVAL", "1"))
+# ការងាររបស់ Worker ដែលមិនបានធ្វើ Heartbeat យូរជាងនេះ (វិនាទី) ត្រូវបានចាត់ទុកថា Worker បានគាំង ហើយដាក់ចូលជួរវិញ
+BROKER_LEASE: Final = float(os.environ.get("BROKER_LEASE", "60"))
+# ការចុចប៊ូតុងសម្រាប់សំណួររបស់ Worker (ask_choice / ask_selection) ឆ្លងកាត់តារាង SQLite ដោយ Worker ពិនិត្យរៀងរាល់ BROKER_ANSWER_INTERVAL វិនាទី
+BROKER_ANSWER_INTERVAL: Final = float(os.environ.get("BROKER_ANSWER_INTERVAL", "0.5"))
+ANSWER_TTL: Final = 2 * max(CHOICE_TIMEOUT, ARCHIVE_SELECT_TIMEOUT)
 
 # កំណត់ 'ស្ថានភាព' (States)
 (SELECT_ACTION,
@@ -50,8 +172,9 @@ PORT: Final = int(os.environ.get("PORT", "8000"))
  WAITING_FOR_IMG_TO_TEXT_FILE,
  SELECT_AUDIO_OUTPUT_FORMAT, WAITING_FOR_AUDIO_FILE,
  SELECT_VIDEO_OUTPUT_FORMAT, WAITING_FOR_VIDEO_FILE,
- SELECT_ARCHIVE_ACTION, WAITING_FOR_FILES_TO_ZIP, WAITING_FOR_ARCHIVE_TO_EXTRACT
-) = range(16)
+ SELECT_ARCHIVE_ACTION, WAITING_FOR_FILES_TO_ZIP, WAITING_FOR_ARCHIVE_TO_EXTRACT,
+ WAITING_FOR_OCR_FILES
+) = range(17)
 
 logging.basicConfig(format="%(asctime)s - %(name)s - %(levelname)s - %(message)s", level=logging.INFO)
 
@@ -59,88 +182,1967 @@ logging.basicConfig(format="%(asctime)s - %(name)s - %(levelname)s - %(message)s
 def is_ffmpeg_installed():
     return True 
 
+# --- ស្រទាប់ប្រតិបត្តិការ (Execution Layer) ---
+# ការងារដែលប្រើ CPU ច្រើនដំណើរការក្នុង Process Pool ហើយការងារ I/O ដំណើរការក្នុង Thread Pool
+# ដើម្បីកុំឱ្យ Event Loop ត្រូវបានរាំងស្ទះ ហើយ Bot នៅតែអាចឆ្លើយតបអ្នកប្រើប្រាស់ផ្សេងទៀតបាន
+
+_cpu_executor = None
+_io_executor = None
+
+def get_cpu_executor():
+    global _cpu_executor
+    if _cpu_executor is None:
+        _cpu_executor = ProcessPoolExecutor(max_workers=CPU_WORKERS, mp_context=multiprocessing.get_context("forkserver"))
+    return _cpu_executor
+
+def get_io_executor():
+    global _io_executor
+    if _io_executor is None:
+        _io_executor = ThreadPoolExecutor(max_workers=IO_WORKERS, thread_name_prefix="io-worker")
+    return _io_executor
+
+async def run_cpu_bound(func, *args):
+    """ដំណើរការអនុគមន៍ដែលប្រើ CPU ច្រើនក្នុង Process Pool ហើយរង់ចាំលទ្ធផល"""
+    return await asyncio.get_running_loop().run_in_executor(get_cpu_executor(), func, *args)
+
+async def run_io_bound(func, *args):
+    """ដំណើរការអនុគមន៍ I/O ក្នុង Thread Pool ហើយរង់ចាំលទ្ធផល"""
+    return await asyncio.get_running_loop().run_in_executor(get_io_executor(), func, *args)
+
+async def start_background_services(application: Application) -> None:
+    workspaces.start()
+    await resume_jobs(application)
+    await start_metrics_server()
+
+async def stop_background_services(application: Application) -> None:
+    await job_scheduler.suspend()
+    stop_metrics_server()
+    workspaces.stop()
+    await shutdown_executors(application)
+
+async def shutdown_executors(application: Application) -> None:
+    global _cpu_executor, _io_executor
+    if _cpu_executor is not None:
+        _cpu_executor.shutdown(wait=False, cancel_futures=True)
+        _cpu_executor = None
+    if _io_executor is not None:
+        _io_executor.shutdown(wait=False, cancel_futures=True)
+        _io_executor = None
+
+class PerChatUpdateProcessor(BaseUpdateProcessor):
+    """ដំណើរការ Update ស្របគ្នា ប៉ុន្តែ Update របស់ Chat តែមួយតាមលំដាប់ដែលវាមកដល់
+
+    ដូច្នេះការទាញយកឯកសារធំរបស់អ្នកប្រើម្នាក់មិនរាំងស្ទះអ្នកប្រើផ្សេងទៀត ហើយ /done មិនអាចដំណើរការមុន
+    ឯកសារដែលអ្នកប្រើដដែលបានផ្ញើមុននោះទេ (ConversationHandler ត្រូវការលំដាប់នេះ)។
+    Update ដែលកំពុងរង់ចាំវេនក្នុង Chat របស់វា មិនកាន់កន្លែងក្នុង max_concurrent_updates ទេ។
+    """
+
+    def __init__(self, max_concurrent_updates):
+        super().__init__(max_concurrent_updates)
+        self._chat_locks = {}
+        self._chat_waiting = defaultdict(int)
+
+    async def process_update(self, update, coroutine):
+        chat = update.effective_chat if isinstance(update, Update) else None
+        if chat is None:
+            await super().process_update(update, coroutine)
+            return
+        lock = self._chat_locks.setdefault(chat.id, asyncio.Lock())
+        self._chat_waiting[chat.id] += 1
+        try:
+            async with lock:
+                await super().process_update(update, coroutine)
+        finally:
+            self._chat_waiting[chat.id] -= 1
+            if not self._chat_waiting[chat.id]:
+                del self._chat_waiting[chat.id]
+                self._chat_locks.pop(chat.id, None)
+
+    async def do_process_update(self, update, coroutine):
+        await coroutine
+
+    async def initialize(self):
+        pass
+
+    async def shutdown(self):
+        pass
+
+# --- ការវាស់វែង (Metrics) និង Log ជា JSON ---
+# រយៈពេលនៃដំណាក់កាលនីមួយៗ (download, queue_wait, compute, upload, wait) ទំហំទិន្នន័យ ចំនួនទំព័រ/Frame
+# និងកំហុសតាមប្រតិបត្តិការ ត្រូវបានប្រមូល ហើយបង្ហាញជាទ្រង់ទ្រាយ Prometheus
+
+METRICS = []
+# ប្រតិបត្តិការ (op) និងការងារ (job_id) បច្ចុប្បន្ន សម្រាប់ Label របស់ Metric និង Log
+_metric_scope = contextvars.ContextVar('metric_scope', default=None)
+
+def _label_value(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+class Metric:
+    kind = 'untyped'
+
+    def __init__(self, name, help_text, labels=()):
+        self.name = name
+        self.help_text = help_text
+        self.labels = tuple(labels)
+        self._values = defaultdict(float)
+        METRICS.append(self)
+
+    def _key(self, labels):
+        return tuple(str(labels.get(label, '')) for label in self.labels)
+
+    def _series(self, key, suffix='', extra=()):
+        pairs = list(zip(self.labels, key)) + list(extra)
+        labels = '{' + ','.join(f'{name}="{_label_value(value)}"' for name, value in pairs) + '}' if pairs else ''
+        return f"{self.name}{suffix}{labels}"
+
+    def samples(self):
+        for key, value in sorted(self._values.items()):
+            yield self._series(key), value
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.help_text}", f"# TYPE {self.name} {self.kind}"]
+        lines.extend(f"{series} {value:g}" for series, value in self.samples())
+        return "\n".join(lines)
+
+class Counter(Metric):
+    kind = 'counter'
+
+    def inc(self, amount=1, **labels):
+        self._values[self._key(labels)] += amount
+
+class Gauge(Metric):
+    """Gauge ដែលតម្លៃត្រូវបានកំណត់ដោយផ្ទាល់ ឬអានពី collect() ពេលបង្ហាញ"""
+    kind = 'gauge'
+
+    def __init__(self, name, help_text, labels=(), collect=None):
+        super().__init__(name, help_text, labels)
+        self.collect = collect
+
+    def set(self, value, **labels):
+        self._values[self._key(labels)] = value
+
+    def samples(self):
+        if self.collect is not None:
+            self._values = defaultdict(float, {self._key(labels): value for labels, value in self.collect()})
+        yield from super().samples()
+
+class Histogram(Metric):
+    kind = 'histogram'
+    DEFAULT_BUCKETS = (0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120, 300, 600)
+
+    def __init__(self, name, help_text, labels=(), buckets=DEFAULT_BUCKETS):
+        super().__init__(name, help_text, labels)
+        self.buckets = tuple(buckets)
+        self._counts = defaultdict(lambda: [0] * len(self.buckets))
+        self._sum = defaultdict(float)
+        self._total = defaultdict(int)
+
+    def observe(self, value, **labels):
+        key = self._key(labels)
+        counts = self._counts[key]
+        for i, bound in enumerate(self.buckets):
+            if value <= bound:
+                counts[i] += 1
+        self._sum[key] += value
+        self._total[key] += 1
+
+    def samples(self):
+        for key in sorted(self._total):
+            for bound, count in zip(self.buckets, self._counts[key]):
+                yield self._series(key, '_bucket', [('le', f"{bound:g}")]), count
+            yield self._series(key, '_bucket', [('le', '+Inf')]), self._total[key]
+            yield self._series(key, '_sum'), self._sum[key]
+            yield self._series(key, '_count'), self._total[key]
+
+STAGE_SECONDS = Histogram("docbot_stage_seconds", "Duration of each processing stage", ("op", "stage"))
+TRANSFER_BYTES = Counter("docbot_transfer_bytes_total", "Bytes downloaded from (in) and uploaded to (out) Telegram", ("op", "direction"))
+UNITS_PROCESSED = Counter("docbot_units_processed_total", "Pages, frames and files processed", ("op", "unit"))
+ERRORS = Counter("docbot_errors_total", "Failures by operation and error type", ("op", "error"))
+JOBS_FINISHED = Counter("docbot_jobs_total", "Finished jobs by operation and status", ("op", "status"))
+QUEUE_DEPTH = Gauge("docbot_queue_depth", "Jobs waiting in the queue by lane", ("lane",),
+                    collect=lambda: [({'lane': lane}, depth) for lane, depth in queue_depths().items()])
+ACTIVE_JOBS = Gauge("docbot_active_jobs", "Jobs currently running by lane", ("lane",),
+                    collect=lambda: [({'lane': lane}, job_scheduler._running_per_lane[lane]) for lane in LANE_PRIORITY])
+WORKSPACE_BYTES = Gauge("docbot_workspace_bytes", "Bytes reserved in job workspaces", ("storage",),
+                        collect=lambda: [({'storage': 'tmpfs'}, workspaces._used(tmpfs=True)), ({'storage': 'disk'}, workspaces._used(tmpfs=False))])
+
+def new_metric_scope(op, job_id=None):
+    return {'op': op, 'job_id': job_id, 'upload': 0.0, 'wait': 0.0, 'failed': False}
+
+def current_op():
+    scope = _metric_scope.get()
+    return scope['op'] if scope else 'none'
+
+def record_units(unit, count):
+    if count:
+        UNITS_PROCESSED.inc(count, op=current_op(), unit=unit)
+
+def record_failure(error):
+    """រាប់កំហុសរបស់ការងារបច្ចុប្បន្ន (ហៅពីក្នុង except របស់ *_task ដែលចាប់កំហុសដោយខ្លួនឯង)"""
+    scope = _metric_scope.get()
+    if scope is not None:
+        scope['failed'] = True
+    ERRORS.inc(op=current_op(), error=type(error).__name__)
+    logging.warning("Operation failed: %r", error)
+
+def record_wait(seconds):
+    """រយៈពេលរង់ចាំចម្លើយពីអ្នកប្រើប្រាស់ មិនត្រូវរាប់ជាពេលគណនាទេ"""
+    scope = _metric_scope.get()
+    if scope is not None:
+        scope['wait'] += seconds
+    STAGE_SECONDS.observe(seconds, op=current_op(), stage='wait')
+
+def instrument_handler(op):
+    """Decorator សម្រាប់ receive_* handler៖ កំណត់ op សម្រាប់ Metric/Log វាស់រយៈពេល និងរាប់កំហុស"""
+    def decorator(func):
+        @functools.wraps(func)
+        async def wrapper(update, context):
+            token = _metric_scope.set(new_metric_scope(op))
+            started = time.monotonic()
+            try:
+                return await func(update, context)
+            except Exception as e:
+                ERRORS.inc(op=op, error=type(e).__name__)
+                raise
+            finally:
+                STAGE_SECONDS.observe(time.monotonic() - started, op=op, stage='handler')
+                _metric_scope.reset(token)
+        return wrapper
+    return decorator
+
+_UPLOAD_METHODS = frozenset({'sendDocument', 'sendPhoto', 'sendAudio', 'sendVideo', 'sendMediaGroup'})
+
+class InstrumentedRequest(HTTPXRequest):
+    """HTTPXRequest ដែលវាស់រយៈពេល និងទំហំនៃការទាញយកឯកសារពី Telegram និងការផ្ញើឯកសារទៅ Telegram"""
+
+    async def do_request(self, url, method, request_data=None, **kwargs):
+        started = time.monotonic()
+        code, payload = await super().do_request(url, method, request_data, **kwargs)
+        elapsed = time.monotonic() - started
+        op = current_op()
+        if '/file/bot' in url:
+            STAGE_SECONDS.observe(elapsed, op=op, stage='download')
+            TRANSFER_BYTES.inc(len(payload), op=op, direction='in')
+        elif url.rsplit('/', 1)[-1] in _UPLOAD_METHODS:
+            files = request_data.multipart_data if request_data is not None else None
+            TRANSFER_BYTES.inc(sum(len(field[1]) for field in (files or {}).values()), op=op, direction='out')
+            STAGE_SECONDS.observe(elapsed, op=op, stage='upload')
+            scope = _metric_scope.get()
+            if scope is not None:
+                scope['upload'] += elapsed
+        return code, payload
+
+def render_metrics():
+    return "\n".join(metric.render() for metric in METRICS) + "\n"
+
+class HttpApp(tornado.web.Application):
+    """Tornado Application សម្រាប់ Webhook និង /metrics (ផ្លូវផ្សេងទៀតទទួលបាន 404)"""
+
+    def log_request(self, handler):
+        # URL របស់ Webhook មាន BOT_TOKEN ដូច្នេះមិនត្រូវសរសេរវាទៅក្នុង Access Log ទេ
+        pass
+
+class MetricsHandler(tornado.web.RequestHandler):
+    """/metrics សម្រាប់ទាំង Bot (លើ PORT) និង Worker (លើ METRICS_PORT)"""
+
+    def get(self):
+        if METRICS_TOKEN and not hmac.compare_digest(self.request.headers.get("Authorization", ""), f"Bearer {METRICS_TOKEN}"):
+            raise tornado.web.HTTPError(401)
+        self.set_header("Content-Type", "text/plain; version=0.0.4; charset=utf-8")
+        self.write(render_metrics())
+
+class WebhookHandler(tornado.web.RequestHandler):
+    """ទទួល Update ពី Telegram (ដូច TelegramHandler របស់ PTB) ហើយបញ្ចូលវាទៅក្នុង update_queue"""
+
+    def initialize(self, bot_application, secret_token):
+        self.bot_application = bot_application
+        self.secret_token = secret_token
+
+    async def post(self):
+        token = self.request.headers.get("X-Telegram-Bot-Api-Secret-Token", "")
+        if not hmac.compare_digest(token, self.secret_token):
+            raise tornado.web.HTTPError(403)
+        try:
+            update = Update.de_json(json.loads(self.request.body), self.bot_application.bot)
+        except (ValueError, TypeError, KeyError):
+            raise tornado.web.HTTPError(400)
+        if isinstance(self.bot_application.bot, ExtBot):
+            self.bot_application.bot.insert_callback_data(update)
+        await self.bot_application.update_queue.put(update)
+
+_metrics_server = None
+
+async def start_metrics_server():
+    """បើក /metrics លើ METRICS_PORT ដាច់ដោយឡែក (Worker ឬ Port ខាងក្នុងរបស់ Bot)"""
+    global _metrics_server
+    if METRICS_PORT:
+        _metrics_server = HttpApp([(r"/metrics", MetricsHandler)]).listen(METRICS_PORT, address=METRICS_HOST)
+        logging.info("Metrics available on http://%s:%s/metrics", METRICS_HOST, METRICS_PORT)
+
+def stop_metrics_server():
+    global _metrics_server
+    if _metrics_server is not None:
+        _metrics_server.stop()
+        _metrics_server = None
+
+class JsonLogFormatter(logging.Formatter):
+    """Log មួយបន្ទាត់ជា JSON ដែលមាន op និង job_id របស់ការងារបច្ចុប្បន្ន"""
+
+    def format(self, record):
+        entry = {'ts': self.formatTime(record), 'level': record.levelname, 'logger': record.name, 'msg': record.getMessage()}
+        scope = _metric_scope.get()
+        if scope is not None:
+            entry['op'] = scope['op']
+            if scope['job_id']:
+                entry['job_id'] = scope['job_id']
+        entry.update(getattr(record, 'fields', {}))
+        if record.exc_info:
+            entry['exc'] = self.formatException(record.exc_info)
+        return json.dumps(entry, ensure_ascii=False, default=str)
+
+if LOG_FORMAT == 'json':
+    for _handler in logging.getLogger().handlers:
+        _handler.setFormatter(JsonLogFormatter())
+
+# --- អនុគមន៍ I/O តូចៗ (ការបំប្លែងទាំងអស់ស្ថិតនៅក្នុង engine.py) ---
+# អនុគមន៍ទាំងនេះមិនមែនជា async ទេ ហើយត្រូវហៅតាមរយៈ run_io_bound ប៉ុណ្ណោះ
+
+def _write_text(path, text):
+    with open(path, 'w', encoding='utf-8') as f:
+        f.write(text)
+
+def _append_to_zip(zip_path, file_path, arcname):
+    with zipfile.ZipFile(zip_path, 'a') as zipf:
+        zipf.write(file_path, arcname)
+
+def _read_bytes(path):
+    with open(path, 'rb') as f:
+        return f.read()
+
+def _link_or_copy(source, target):
+    """Hard Link (គ្មានការចម្លង) ប្រសិនបើនៅលើ File System ដូចគ្នា និងមានសិទ្ធិ បើមិនដូច្នោះទេចម្លង (ជំនួស target ដែលមានស្រាប់)"""
+    try:
+        os.link(source, target + '.link')
+        os.replace(target + '.link', target)
+    except OSError:
+        shutil.copyfile(source, target)
+
+async def upload_file(path):
+    """ឯកសារសម្រាប់ផ្ញើទៅ Telegram
+
+    ក្នុង Local Bot API Mode ជា Path ដែល python-telegram-bot ផ្ញើជា file:// ហើយ Server អានវាពី Disk ដោយផ្ទាល់។
+    បើមិនដូច្នោះទេ ជា bytes ដែលអានក្នុង Thread Pool (អាចប្រើឡើងវិញបានពេល send_with_retry ព្យាយាមម្ដងទៀត)។
+    """
+    if LOCAL_BOT_API_URL:
+        return Path(os.path.abspath(path))
+    return await run_io_bound(_read_bytes, path)
+
+async def fetch_file(file, file_path):
+    """ទាញយកឯកសារពី Telegram ទៅ file_path
+
+    ក្នុង Local Bot API Mode get_file ត្រឡប់ផ្លូវឯកសារនៅលើ Disk របស់ Server ដូច្នេះគ្រាន់តែបង្កើត Hard Link
+    ជំនួសឱ្យការទាញយកតាម HTTP ឬការចម្លងឯកសារទាំងមូល។
+    """
+    if LOCAL_BOT_API_URL and file.file_path and os.path.isfile(file.file_path):
+        await run_io_bound(_link_or_copy, file.file_path, file_path)
+    else:
+        await file.download_to_drive(file_path)
+
+# --- ថតការងារ និងកូតាទំហំ Disk (Workspaces) ---
+
+class QuotaExceeded(Exception):
+    pass
+
+def _dir_size(path):
+    total = 0
+    for dirpath, _, filenames in os.walk(path):
+        for name in filenames:
+            try: total += os.path.getsize(os.path.join(dirpath, name))
+            except OSError: pass
+    return total
+
+class WorkspaceManager:
+    """ផ្ដល់ថតការងារដាច់ដោយឡែកសម្រាប់ការងារនីមួយៗ ហើយរាប់ទំហំដែលប្រើតាមអ្នកប្រើប្រាស់ និងសរុប
+
+    កូតាត្រូវបានពិនិត្យមុនពេលទាញយកឯកសារ។ ថតដែលគ្មានម្ចាស់ (Conversation ដែលបោះបង់ចោល ឬនៅសល់ពីការចាប់ផ្ដើមមុន)
+    ត្រូវបានលុបដោយ Sweeper។ ថតដែលកំពុងប្រើដោយការងារ (busy) មិនត្រូវបានលុបទេ។
+    """
+
+    def __init__(self, root, tmpfs_root, user_quota, global_quota, min_free, ttl):
+        self.root = root
+        self.tmpfs_root = tmpfs_root
+        self.user_quota = user_quota
+        self.global_quota = global_quota
+        self.min_free = min_free
+        self.ttl = ttl
+        self._spaces = {}
+        self._sweeper = None
+
+    def _used(self, user_id=None, tmpfs=None):
+        return sum(space['reserved'] for space in self._spaces.values()
+                   if (user_id is None or space['user_id'] == user_id) and (tmpfs is None or space['tmpfs'] == tmpfs))
+
+    def _check(self, user_id, need, root):
+        if self._used(user_id) + need > self.user_quota:
+            raise QuotaExceeded("អ្នកមានឯកសារកំពុងរង់ចាំដំណើរការច្រើនពេក។ សូមរង់ចាំការងារមុនៗបញ្ចប់សិន។")
+        if self._used() + need > self.global_quota or shutil.disk_usage(root).free - need < self.min_free:
+            raise QuotaExceeded("ម៉ាស៊ីនកំពុងរវល់ខ្លាំង ហើយទំហំផ្ទុកបណ្ដោះអាសន្នពេញហើយ។ សូមព្យាយាមម្ដងទៀតក្នុងពេលបន្តិចទៀត។")
+
+    def create(self, user_id, size):
+        """បង្កើតថតការងារថ្មីសម្រាប់ឯកសារទំហំ size។ បោះ QuotaExceeded ប្រសិនបើលើសកូតា"""
+        need = int(size * WORKSPACE_SIZE_FACTOR)
+        tmpfs = bool(self.tmpfs_root) and size <= WORKSPACE_TMPFS_FILE_LIMIT and self._used(tmpfs=True) + need <= WORKSPACE_TMPFS_QUOTA
+        root = self.tmpfs_root if tmpfs else self.root
+        os.makedirs(root, exist_ok=True)
+        self._check(user_id, need, root)
+        path = tempfile.mkdtemp(prefix=f"ws_{user_id}_", dir=root)
+        self._spaces[path] = {'user_id': user_id, 'reserved': need, 'tmpfs': tmpfs, 'busy': False, 'last_used': time.time()}
+        return path
+
+    def reserve(self, path, size):
+        """បម្រុងទុកកន្លែងសម្រាប់ឯកសារបន្ថែមក្នុងថតការងារដែលមានស្រាប់"""
+        space = self._spaces[path]
+        need = int(size * WORKSPACE_SIZE_FACTOR)
+        self._check(space['user_id'], need, os.path.dirname(path))
+        space['reserved'] += need
+        space['last_used'] = time.time()
+
+    def exists(self, path):
+        return path in self._spaces and os.path.isdir(path)
+
+    def owner_of(self, file_path):
+        """ត្រឡប់ថតការងារដែលមានឯកសារនេះ (ឬ None)"""
+        directory = os.path.dirname(os.path.abspath(file_path))
+        return directory if directory in self._spaces else None
+
+    def claim(self, path):
+        """សម្គាល់ថាថតនេះកំពុងប្រើដោយការងារ ដូច្នេះ Sweeper មិនលុបវាទេ"""
+        if path in self._spaces:
+            self._spaces[path]['busy'] = True
+
+    def release(self, path):
+        if not path:
+            return
+        self._spaces.pop(path, None)
+        shutil.rmtree(path, ignore_errors=True)
+
+    def adopt_existing(self):
+        """ចុះឈ្មោះថតដែលនៅសល់ពីការដំណើរការមុន ដើម្បីឱ្យ Sweeper លុបវានៅពេលក្រោយ"""
+        for root, tmpfs in ((self.root, False), (self.tmpfs_root, True)):
+            if not root or not os.path.isdir(root):
+                continue
+            for name in os.listdir(root):
+                path = os.path.join(root, name)
+                if name.startswith("ws_") and os.path.isdir(path) and path not in self._spaces:
+                    self._spaces[path] = {'user_id': None, 'reserved': _dir_size(path), 'tmpfs': tmpfs, 'busy': False,
+                                          'last_used': os.path.getmtime(path)}
+
+    async def sweep(self):
+        """លុបថតដែលគ្មានសកម្មភាពយូរពេក ហើយធ្វើបច្ចុប្បន្នភាពទំហំពិតប្រាកដរបស់ថតដែលកំពុងប្រើ"""
+        now = time.time()
+        # ថតដែលត្រូវបានលុបដោយ Process ផ្សេង (ឧ. Worker របស់ Job Broker) លែងត្រូវរាប់ក្នុងកូតាទៀតហើយ
+        for path in [path for path in self._spaces if not os.path.isdir(path)]:
+            self._spaces.pop(path, None)
+        expired = [path for path, space in self._spaces.items() if not space['busy'] and now - space['last_used'] > self.ttl]
+        for path in expired:
+            logging.info("Sweeping abandoned workspace %s", path)
+            self._spaces.pop(path, None)
+            await run_io_bound(shutil.rmtree, path, True)
+        paths = list(self._spaces)
+        sizes = await run_io_bound(lambda: [_dir_size(path) for path in paths])
+        for path, size in zip(paths, sizes):
+            if path in self._spaces:
+                self._spaces[path]['reserved'] = max(self._spaces[path]['reserved'], size)
+
+    async def _sweep_forever(self, interval):
+        while True:
+            await asyncio.sleep(interval)
+            try:
+                await self.sweep()
+            except Exception:
+                logging.exception("Workspace sweep failed")
+
+    def start(self, interval=WORKSPACE_SWEEP_INTERVAL):
+        self.adopt_existing()
+        self._sweeper = asyncio.create_task(self._sweep_forever(interval))
+
+    def stop(self):
+        if self._sweeper is not None:
+            self._sweeper.cancel()
+            self._sweeper = None
+
+workspaces = WorkspaceManager(WORKSPACE_ROOT, WORKSPACE_TMPFS_ROOT, WORKSPACE_USER_QUOTA, WORKSPACE_GLOBAL_QUOTA, WORKSPACE_MIN_FREE, WORKSPACE_TTL)
+
+def job_inputs(params):
+    """ឯកសារបញ្ចូលរបស់ការងារមួយ"""
+    return [path for path in list(params.get('file_paths', [])) + [params.get('file_path')] if path]
+
+def job_workspace(params):
+    """ថតការងាររបស់ការងារមួយ (រកពីឯកសារបញ្ចូល)"""
+    for path in job_inputs(params):
+        return workspaces.owner_of(path)
+    return None
+
+def workspace_path(file_path, name):
+    """ផ្លូវសម្រាប់ឯកសារលទ្ធផល នៅក្នុងថតការងារតែមួយជាមួយឯកសារបញ្ចូល"""
+    return os.path.join(os.path.dirname(file_path), name)
+
+# ឯកសារដែលកំពុងទាញយកមានកន្ទុយនេះ រហូតដល់វាពេញលេញ
+DOWNLOAD_SUFFIX = '.download'
+
+async def reserve_workspace_file(update: Update, context: ContextTypes.DEFAULT_TYPE, file_obj, filename):
+    """ពិនិត្យកូតា ហើយបម្រុងផ្លូវឯកសារមួយក្នុងថតការងាររបស់ Conversation។ ត្រឡប់ None ប្រសិនបើលើសកូតា"""
+    size = file_obj.file_size or 0
+    workspace = context.user_data.get('workspace')
+    try:
+        if workspace and workspaces.exists(workspace):
+            workspaces.reserve(workspace, size)
+        else:
+            workspace = workspaces.create(update.effective_user.id, size)
+            context.user_data['workspace'] = workspace
+    except QuotaExceeded as e:
+        await update.message.reply_text(f"⚠️ {e}")
+        return None
+    name = os.path.basename(filename or '') or file_obj.file_unique_id
+    stem, ext = os.path.splitext(name)
+    file_path = os.path.join(workspace, name)
+    for n in itertools.count(1):
+        if not os.path.exists(file_path) and not os.path.exists(file_path + DOWNLOAD_SUFFIX): break
+        file_path = os.path.join(workspace, f"{stem}_{n}{ext}")
+    # ឯកសារទទេនេះបម្រុងឈ្មោះ ខណៈពេលការទាញយកនៅផ្ទៃខាងក្រោយមិនទាន់បញ្ចប់
+    open(file_path + DOWNLOAD_SUFFIX, 'wb').close()
+    return file_path
+
+async def fetch_to_workspace(file_obj, file_path):
+    """ទាញយកទៅ file_path + DOWNLOAD_SUFFIX ហើយប្ដូរឈ្មោះពេលរួចរាល់ ដូច្នេះឯកសារដែលមិនពេញលេញមិនដែលមានឈ្មោះពិតទេ"""
+    part = file_path + DOWNLOAD_SUFFIX
+    try:
+        file = await file_obj.get_file()
+        await fetch_file(file, part)
+        os.replace(part, file_path)
+    except BaseException:
+        if os.path.exists(part): os.remove(part)
+        raise
+
+async def download_to_workspace(update: Update, context: ContextTypes.DEFAULT_TYPE, file_obj, filename):
+    """ទាញយកឯកសារទៅក្នុងថតការងាររបស់ Conversation បន្ទាប់ពីពិនិត្យកូតា។ ត្រឡប់ None ប្រសិនបើលើសកូតា"""
+    file_path = await reserve_workspace_file(update, context, file_obj, filename)
+    if file_path is None:
+        return None
+    await fetch_to_workspace(file_obj, file_path)
+    return file_path
+
+# --- ការរក្សាទុកស្ថានភាព (Persistence) និងកំណត់ត្រាការងារ (Job Journal) ---
+
+# Key ក្នុង user_data ដែលផ្ទុកផ្លូវឯកសារដែលបានទាញយករួច
+USER_FILE_KEYS = ('merge_files', 'img_to_pdf_files', 'ocr_files', 'zip_files')
+JOURNAL_SUFFIX = '.journal'
+
+def _drop_missing_files(data):
+    """ដកផ្លូវឯកសារដែលលែងមាន (ឧ. ថតការងារនៅលើ tmpfs) ចេញពី user_data ដែលបានផ្ទុកឡើងវិញ"""
+    if data.get('workspace') and not os.path.isdir(data['workspace']):
+        data.pop('workspace')
+    for key in USER_FILE_KEYS:
+        if key in data:
+            data[key] = [path for path in data[key] if os.path.exists(path)]
+    if data.get('split_file_path') and not os.path.exists(data['split_file_path']):
+        data.pop('split_file_path')
+    return data
+
+class SqlitePersistence(BasePersistence):
+    """រក្សាទុក user_data, chat_data, bot_data និងស្ថានភាព Conversation ក្នុង SQLite (ជា JSON)
+
+    PTB ហៅ update_* រៀងរាល់ update_interval វិនាទី និងម្ដងទៀតពេល Bot បិទ។ ការអាន/សរសេរដំណើរការក្នុង Thread Pool។
+    """
+
+    def __init__(self, path, update_interval=STATE_FLUSH_INTERVAL):
+        super().__init__(store_data=PersistenceInput(callback_data=False), update_interval=update_interval)
+        self.path = path
+        self._conn = None
+        self._lock = threading.Lock()
+
+    def _connection(self):
+        if self._conn is None:
+            self._conn = sqlite3.connect(self.path, check_same_thread=False)
+            self._conn.execute("PRAGMA journal_mode=WAL")
+            self._conn.execute("CREATE TABLE IF NOT EXISTS state (kind TEXT NOT NULL, key TEXT NOT NULL, value TEXT NOT NULL, PRIMARY KEY (kind, key))")
+        return self._conn
+
+    def _load(self, kind):
+        with self._lock:
+            rows = self._connection().execute("SELECT key, value FROM state WHERE kind = ?", (kind,)).fetchall()
+        return [(json.loads(key), json.loads(value)) for key, value in rows]
+
+    def _store(self, kind, key, value):
+        with self._lock:
+            conn = self._connection()
+            if value is None:
+                conn.execute("DELETE FROM state WHERE kind = ? AND key = ?", (kind, json.dumps(key)))
+            else:
+                conn.execute("INSERT OR REPLACE INTO state (kind, key, value) VALUES (?, ?, ?)", (kind, json.dumps(key), json.dumps(value)))
+            conn.commit()
+
+    async def get_user_data(self):
+        return {user_id: _drop_missing_files(data) for user_id, data in await run_io_bound(self._load, 'user')}
+
+    async def get_chat_data(self):
+        return dict(await run_io_bound(self._load, 'chat'))
+
+    async def get_bot_data(self):
+        return dict(await run_io_bound(self._load, 'bot')).get(0, {})
+
+    async def get_callback_data(self):
+        return None
+
+    async def get_conversations(self, name):
+        return {tuple(key): state for key, state in await run_io_bound(self._load, f'conv:{name}')}
+
+    async def update_conversation(self, name, key, new_state):
+        await run_io_bound(self._store, f'conv:{name}', list(key), new_state)
+
+    async def update_user_data(self, user_id, data):
+        await run_io_bound(self._store, 'user', user_id, data or None)
+
+    async def update_chat_data(self, chat_id, data):
+        await run_io_bound(self._store, 'chat', chat_id, data or None)
+
+    async def update_bot_data(self, data):
+        await run_io_bound(self._store, 'bot', 0, data or None)
+
+    async def update_callback_data(self, data):
+        pass
+
+    async def drop_user_data(self, user_id):
+        await run_io_bound(self._store, 'user', user_id, None)
+
+    async def drop_chat_data(self, chat_id):
+        await run_io_bound(self._store, 'chat', chat_id, None)
+
+    async def refresh_user_data(self, user_id, user_data):
+        pass
+
+    async def refresh_chat_data(self, chat_id, chat_data):
+        pass
+
+    async def refresh_bot_data(self, bot_data):
+        pass
+
+    async def flush(self):
+        with self._lock:
+            if self._conn is not None:
+                self._conn.close()
+                self._conn = None
+
+class JobJournal:
+    """កំណត់ត្រាការងារដែលកំពុងរង់ចាំ ឬកំពុងដំណើរការ ដើម្បីបន្តវាបន្ទាប់ពី Bot ចាប់ផ្ដើមឡើងវិញ
+
+    ការសរសេរនីមួយៗតូច (WAL, synchronous=NORMAL) ដូច្នេះ Scheduler ហៅវាដោយផ្ទាល់ពី Event Loop។
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self._conn = None
+        self._lock = threading.Lock()
+
+    def _connection(self):
+        if self._conn is None:
+            self._conn = sqlite3.connect(self.path, check_same_thread=False)
+            self._conn.execute("PRAGMA journal_mode=WAL")
+            self._conn.execute("PRAGMA synchronous=NORMAL")
+            self._conn.execute("CREATE TABLE IF NOT EXISTS jobs (id TEXT PRIMARY KEY, op TEXT NOT NULL, chat_id INTEGER NOT NULL, user_id INTEGER, "
+                               "params TEXT NOT NULL, status TEXT NOT NULL, attempts INTEGER NOT NULL, created REAL NOT NULL)")
+        return self._conn
+
+    def add(self, job):
+        with self._lock:
+            conn = self._connection()
+            conn.execute("INSERT OR REPLACE INTO jobs (id, op, chat_id, user_id, params, status, attempts, created) VALUES (?, ?, ?, ?, ?, 'queued', ?, ?)",
+                         (job.id, job.op, job.chat_id, job.user_id, json.dumps(job.params), job.attempts, time.time()))
+            conn.commit()
+
+    def mark_running(self, job):
+        with self._lock:
+            conn = self._connection()
+            conn.execute("UPDATE jobs SET status = 'running', attempts = ? WHERE id = ?", (job.attempts, job.id))
+            conn.commit()
+
+    def remove(self, job_id):
+        with self._lock:
+            conn = self._connection()
+            conn.execute("DELETE FROM jobs WHERE id = ?", (job_id,))
+            conn.commit()
+
+    def pending(self):
+        with self._lock:
+            rows = self._connection().execute("SELECT id, op, chat_id, user_id, params, status, attempts FROM jobs ORDER BY created").fetchall()
+        return [{'id': row[0], 'op': row[1], 'chat_id': row[2], 'user_id': row[3], 'params': json.loads(row[4]),
+                 'status': row[5], 'attempts': row[6]} for row in rows]
+
+job_journal = JobJournal(STATE_DB_PATH)
+
+def keep_job_inputs(params):
+    """បង្កើត Hard Link នៃឯកសារបញ្ចូល ព្រោះការងារលុបឯកសាររបស់វានៅក្នុង finally សូម្បីតែពេល Bot កំពុងបិទ"""
+    for path in job_inputs(params):
+        try: os.link(path, path + JOURNAL_SUFFIX)
+        except OSError: pass
+
+def restore_job_inputs(params):
+    """ស្ដារឯកសារបញ្ចូលពី Hard Link ហើយត្រឡប់ True ប្រសិនបើឯកសារបញ្ចូលទាំងអស់នៅមាន"""
+    paths = job_inputs(params)
+    for path in paths:
+        if os.path.exists(path + JOURNAL_SUFFIX):
+            os.replace(path + JOURNAL_SUFFIX, path)
+    return bool(paths) and all(os.path.exists(path) for path in paths)
+
+# --- កម្មវិធីគ្រប់គ្រងជួរការងារ (Job Scheduler) ---
+
+# អាទិភាព (លេខតូចជាងមុនគេ) និងរយៈពេលប៉ាន់ស្មានដំបូង (វិនាទី) សម្រាប់ផ្លូវការងារនីមួយៗ
+LANE_PRIORITY = {'fast': 0, 'document': 1, 'media': 2}
+LANE_DEFAULT_DURATION = {'fast': 10.0, 'document': 30.0, 'media': 120.0}
+
+def format_wait(seconds):
+    if seconds < 60:
+        return f"{int(seconds) + 1} វិនាទី"
+    return f"{int(seconds // 60) + 1} នាទី"
+
+class Job:
+    def __init__(self, op, lane, chat_id, msg, context, params, user_id=None, attempts=0):
+        self.id = uuid.uuid4().hex[:8]
+        self.op = op
+        self.lane = lane
+        self.chat_id = chat_id
+        self.user_id = user_id
+        self.attempts = attempts
+        self.msg = msg
+        self.context = context
+        self.params = params
+        self.enqueued_at = time.monotonic()
+        self.started_at = None
+        self.task = None
+        self.last_position = None
+
+class JobScheduler:
+    """ជួរការងារអាទិភាពមានដែនកំណត់ ជាមួយការកំណត់ចំនួនការងារសរុប តាម Chat និងតាមផ្លូវការងារ"""
+
+    def __init__(self, max_queued, max_running, max_per_chat, lane_limits):
+        self.max_queued = max_queued
+        self.max_running = max_running
+        self.max_per_chat = max_per_chat
+        self.lane_limits = dict(lane_limits)
+        self._queue = []
+        self._seq = itertools.count()
+        self._running = set()
+        self._running_per_lane = defaultdict(int)
+        self._running_per_chat = defaultdict(int)
+        self._avg_duration = dict(LANE_DEFAULT_DURATION)
+        self._background = set()
+        self._suspended = False
+
+    @property
+    def queued_count(self):
+        return len(self._queue)
+
+    @property
+    def running_count(self):
+        return len(self._running)
+
+    def submit(self, op, chat_id, msg, context, user_id=None, attempts=0, **params):
+        """បញ្ចូលការងារទៅក្នុងជួរ។ ត្រឡប់ None ប្រសិនបើជួរពេញ"""
+        if len(self._queue) >= self.max_queued:
+            return None
+        lane = JOB_LANES[op]
+        job = Job(op, lane, chat_id, msg, context, params, user_id, attempts)
+        heapq.heappush(self._queue, (LANE_PRIORITY[lane], next(self._seq), job))
+        job_journal.add(job)
+        self._dispatch()
+        return job
+
+    def _can_start(self, job):
+        return (len(self._running) < self.max_running
+                and self._running_per_lane[job.lane] < self.lane_limits[job.lane]
+                and self._running_per_chat[job.chat_id] < self.max_per_chat)
+
+    def _dispatch(self):
+        if self._suspended:
+            return
+        waiting = []
+        for item in sorted(self._queue):
+            job = item[2]
+            if self._can_start(job):
+                self._start(job)
+            else:
+                waiting.append(item)
+        heapq.heapify(waiting)
+        self._queue = waiting
+        if waiting:
+            task = asyncio.create_task(self._notify_positions())
+            self._background.add(task)
+            task.add_done_callback(self._background.discard)
+
+    def _start(self, job):
+        self._running.add(job)
+        self._running_per_lane[job.lane] += 1
+        self._running_per_chat[job.chat_id] += 1
+        job.started_at = time.monotonic()
+        job.attempts += 1
+        job_journal.mark_running(job)
+        keep_job_inputs(job.params)
+        STAGE_SECONDS.observe(job.started_at - job.enqueued_at, op=job.op, stage='queue_wait')
+        job.task = asyncio.create_task(self._run(job))
+
+    async def _run(self, job):
+        scope = new_metric_scope(job.op, job.id)
+        _metric_scope.set(scope)
+        status = 'ok'
+        try:
+            if job.last_position is not None:
+                try: await job.context.bot.edit_message_text("⚙️ ដល់វេនរបស់អ្នកហើយ! កំពុងដំណើរការ...", chat_id=job.chat_id, message_id=job.msg.message_id)
+                except Exception: pass
+            await JOB_TASKS[job.op](chat_id=job.chat_id, msg=job.msg, context=job.context, **job.params)
+            if scope['failed']: status = 'error'
+        except asyncio.CancelledError:
+            status = 'interrupted' if self._suspended else 'cancelled'
+            raise
+        except Exception as e:
+            status = 'error'
+            ERRORS.inc(op=job.op, error=type(e).__name__)
+            logging.exception("Job %s (%s) failed", job.id, job.op)
+        finally:
+            # ការងារដែលត្រូវបានរំខានដោយការបិទ Bot នៅតែមានក្នុង Journal ជាមួយថតការងាររបស់វា
+            if status != 'interrupted':
+                job_journal.remove(job.id)
+                workspaces.release(job_workspace(job.params))
+            elapsed = time.monotonic() - job.started_at
+            compute = max(0.0, elapsed - scope['upload'] - scope['wait'])
+            STAGE_SECONDS.observe(compute, op=job.op, stage='compute')
+            JOBS_FINISHED.inc(op=job.op, status=status)
+            logging.info("Job finished", extra={'fields': {
+                'status': status, 'total_seconds': round(elapsed, 3), 'compute_seconds': round(compute, 3),
+                'upload_seconds': round(scope['upload'], 3), 'wait_seconds': round(scope['wait'], 3),
+                'queue_wait_seconds': round(job.started_at - job.enqueued_at, 3)}})
+            self._avg_duration[job.lane] = 0.7 * self._avg_duration[job.lane] + 0.3 * elapsed
+            self._running.discard(job)
+            self._running_per_lane[job.lane] -= 1
+            self._running_per_chat[job.chat_id] -= 1
+            self._dispatch()
+
+    def cancel_chat(self, chat_id):
+        """បោះបង់ការងារទាំងអស់របស់ Chat មួយ (ទាំងកំពុងរង់ចាំ និងកំពុងដំណើរការ)។ ត្រឡប់ចំនួនការងារ"""
+        cancelled = [item[2] for item in self._queue if item[2].chat_id == chat_id]
+        self._queue = [item for item in self._queue if item[2].chat_id != chat_id]
+        heapq.heapify(self._queue)
+        for job in cancelled:
+            job_journal.remove(job.id)
+            remove_job_inputs(job.params)
+            task = asyncio.create_task(self._delete_status(job))
+            self._background.add(task)
+            task.add_done_callback(self._background.discard)
+        running = [job for job in self._running if job.chat_id == chat_id]
+        for job in running:
+            job.task.cancel()
+        return len(cancelled) + len(running)
+
+    async def suspend(self):
+        """ឈប់ចាប់ផ្ដើមការងារថ្មី ហើយបញ្ឈប់ការងារដែលកំពុងដំណើរការ ដោយទុកវានៅក្នុង Journal ដើម្បីបន្តពេលចាប់ផ្ដើមឡើងវិញ"""
+        self._suspended = True
+        tasks = [job.task for job in self._running]
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+
+    async def _delete_status(self, job):
+        try: await job.context.bot.delete_message(chat_id=job.chat_id, message_id=job.msg.message_id)
+        except Exception: pass
+
+    def position_of(self, job):
+        """លំដាប់របស់ការងារក្នុងចំណោមការងារដែលកំពុងរង់ចាំក្នុងផ្លូវការងារដូចគ្នា (ចាប់ពី 1)"""
+        ahead = [item[2] for item in sorted(self._queue) if item[2].lane == job.lane]
+        return ahead.index(job) + 1
+
+    def estimated_wait(self, job):
+        slots = max(1, self.lane_limits[job.lane])
+        rounds = (self.position_of(job) - 1) // slots + 1
+        return rounds * self._avg_duration[job.lane]
+
+    async def _notify_positions(self):
+        for _, _, job in sorted(self._queue):
+            if job.started_at is not None:
+                continue
+            position = self.position_of(job)
+            if position == job.last_position:
+                continue
+            job.last_position = position
+            try:
+                await job.context.bot.edit_message_text(
+                    f"⏳ ការងាររបស់អ្នកស្ថិតក្នុងជួរលំដាប់ទី {position}។\nរយៈពេលរង់ចាំប្រហែល {format_wait(self.estimated_wait(job))}។",
+                    chat_id=job.chat_id, message_id=job.msg.message_id)
+            except Exception:
+                pass
+
+job_scheduler = JobScheduler(MAX_QUEUED_JOBS, MAX_RUNNING_JOBS, MAX_JOBS_PER_CHAT, LANE_LIMITS)
+
+def remove_job_inputs(params):
+    discard_pipeline(params.get('pipeline_id'))
+    for path in job_inputs(params):
+        if os.path.exists(path): os.remove(path)
+    workspaces.release(job_workspace(params))
+
+async def enqueue_job(update: Update, context: ContextTypes.DEFAULT_TYPE, msg, op, **params):
+    """បញ្ជូនការងារទៅកាន់ Scheduler ហើយបដិសេធដោយស្អាតនៅពេលជួរពេញ"""
+    # ថតការងារលែងជាកម្មសិទ្ធិរបស់ Conversation ទៀតហើយ ប៉ុន្តែជារបស់ការងារនេះ
+    context.user_data.pop('workspace', None)
+    workspaces.claim(job_workspace(params))
+    if job_broker is not None:
+        return await submit_to_broker(update, msg, op, params)
+    job = job_scheduler.submit(op, update.effective_chat.id, msg, context, user_id=update.effective_user.id, **params)
+    if job is None:
+        JOBS_FINISHED.inc(op=op, status='rejected')
+        remove_job_inputs(params)
+        await msg.edit_text("⚠️ សូមអភ័យទោស! ម៉ាស៊ីនកំពុងរវល់ខ្លាំង ហើយជួរការងារពេញហើយ។ សូមព្យាយាមម្ដងទៀតក្នុងពេលបន្តិចទៀត។")
+    return job
+
+async def resume_jobs(application: Application) -> None:
+    """បន្តការងារដែលនៅសល់ក្នុង Journal ពីការដំណើរការមុន ឬប្រាប់អ្នកប្រើប្រាស់ថាការងាររបស់គេត្រូវបានរំខាន"""
+    for entry in await run_io_bound(job_journal.pending):
+        job_journal.remove(entry['id'])
+        chat_id, params = entry['chat_id'], entry['params']
+        # Pipeline នៅក្នុង Memory មិនមានទៀតទេ ការងារនឹងរៀបចំឯកសារដោយខ្លួនឯង
+        params.pop('pipeline_id', None)
+        job = None
+        if entry['attempts'] < JOB_RESUME_ATTEMPTS and await run_io_bound(restore_job_inputs, params):
+            try:
+                msg = await application.bot.send_message(chat_id=chat_id, text="🔄 Bot ទើបតែបានចាប់ផ្ដើមឡើងវិញ។ កំពុងបន្តការងាររបស់អ្នក...")
+                context = application.context_types.context(application, chat_id=chat_id, user_id=entry['user_id'])
+                workspaces.claim(job_workspace(params))
+                job = job_scheduler.submit(entry['op'], chat_id, msg, context, user_id=entry['user_id'], attempts=entry['attempts'], **params)
+            except Exception:
+                logging.exception("Failed to resume job %s (%s)", entry['id'], entry['op'])
+        if job is None:
+            JOBS_FINISHED.inc(op=entry['op'], status='interrupted')
+            remove_job_inputs(params)
+            try: await application.bot.send_message(chat_id=chat_id, text="⚠️ ការងាររបស់អ្នកត្រូវបានរំខាន ដោយសារ Bot ត្រូវបានចាប់ផ្ដើមឡើងវិញ។ សូមផ្ញើឯកសារម្ដងទៀត។")
+            except Exception: pass
+        else:
+            logging.info("Resumed job %s (%s) as %s", entry['id'], entry['op'], job.id)
+
+# --- ជួរការងាររួម (Job Broker) សម្រាប់ Worker Process ដាច់ដោយឡែក ---
+# នៅពេល JOB_BROKER=sqlite Bot គ្រាន់តែទទួលឯកសារ ហើយបញ្ចូលការងារទៅក្នុងតារាង SQLite។ Worker មួយ ឬច្រើន (worker.py)
+# យកការងារតាមផ្លូវការងាររបស់វា ដំណើរការ ហើយរាយការណ៍វឌ្ឍនភាព និងផ្ញើលទ្ធផលតាម Bot API ដោយផ្ទាល់។
+# Bot និង Worker ទាំងអស់ត្រូវមើលឃើញ WORKSPACE_ROOT ដូចគ្នា (ម៉ាស៊ីនតែមួយ ឬ Volume រួម)។
+
+class JobBroker:
+    """ជួរការងារក្នុង SQLite ដែលចែករំលែករវាង Bot និង Worker Process
+
+    ការយកការងារ (claim) ធ្វើក្នុង Transaction តែមួយ ដូច្នេះ Worker ពីរមិនអាចយកការងារដដែលបានទេ។
+    Worker ធ្វើ Heartbeat ជាប្រចាំ ហើយការងាររបស់ Worker ដែលបាត់ Heartbeat យូរជាង BROKER_LEASE ត្រូវបានដាក់ចូលជួរវិញ។
+    """
+
+    COLUMNS = "id, op, lane, chat_id, user_id, message_id, params, workspace, attempts, cancel, created"
+
+    def __init__(self, path, max_queued, max_per_chat):
+        self.path = path
+        self.max_queued = max_queued
+        self.max_per_chat = max_per_chat
+        self._conn = None
+        self._lock = threading.Lock()
+
+    def _connection(self):
+        if self._conn is None:
+            self._conn = sqlite3.connect(self.path, timeout=30, isolation_level=None, check_same_thread=False)
+            self._conn.execute("PRAGMA journal_mode=WAL")
+            self._conn.execute("PRAGMA synchronous=NORMAL")
+            self._conn.execute("CREATE TABLE IF NOT EXISTS broker_jobs (id TEXT PRIMARY KEY, op TEXT NOT NULL, lane TEXT NOT NULL, "
+                               "priority INTEGER NOT NULL, chat_id INTEGER NOT NULL, user_id INTEGER, message_id INTEGER NOT NULL, "
+                               "params TEXT NOT NULL, workspace TEXT, status TEXT NOT NULL, attempts INTEGER NOT NULL DEFAULT 0, "
+                               "worker TEXT, cancel INTEGER NOT NULL DEFAULT 0, created REAL NOT NULL, heartbeat REAL)")
+            self._conn.execute("CREATE INDEX IF NOT EXISTS broker_jobs_queue ON broker_jobs (status, priority, created)")
+            self._conn.execute("CREATE TABLE IF NOT EXISTS broker_answers (id INTEGER PRIMARY KEY AUTOINCREMENT, token TEXT NOT NULL, "
+                               "value TEXT NOT NULL, created REAL NOT NULL)")
+        return self._conn
+
+    def _transaction(self, func, *args):
+        with self._lock:
+            conn = self._connection()
+            conn.execute("BEGIN IMMEDIATE")
+            try:
+                result = func(conn, *args)
+            except BaseException:
+                conn.execute("ROLLBACK")
+                raise
+            conn.execute("COMMIT")
+            return result
+
+    def _execute(self, sql, args=()):
+        with self._lock:
+            return self._connection().execute(sql, args).fetchall()
+
+    @staticmethod
+    def _entry(row):
+        keys = [column.strip() for column in JobBroker.COLUMNS.split(',')]
+        entry = dict(zip(keys, row))
+        entry['params'] = json.loads(entry['params'])
+        return entry
+
+    def submit(self, op, chat_id, user_id, message_id, params, workspace):
+        """បញ្ចូលការងារទៅក្នុងជួរ។ ត្រឡប់លំដាប់របស់វាក្នុងផ្លូវការងារ ឬ None ប្រសិនបើជួរពេញ"""
+        lane = JOB_LANES[op]
+        def insert(conn):
+            if conn.execute("SELECT COUNT(*) FROM broker_jobs WHERE status = 'queued'").fetchone()[0] >= self.max_queued:
+                return None
+            conn.execute("INSERT INTO broker_jobs (id, op, lane, priority, chat_id, user_id, message_id, params, workspace, status, created) "
+                         "VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, 'queued', ?)",
+                         (uuid.uuid4().hex[:8], op, lane, LANE_PRIORITY[lane], chat_id, user_id, message_id, json.dumps(params), workspace, time.time()))
+            return conn.execute("SELECT COUNT(*) FROM broker_jobs WHERE status = 'queued' AND lane = ?", (lane,)).fetchone()[0]
+        return self._transaction(insert)
+
+    def claim(self, lanes, worker_id):
+        """យកការងារដែលមានអាទិភាពខ្ពស់បំផុតក្នុងផ្លូវការងារ lanes ដោយគោរព max_per_chat (ឬ None)"""
+        marks = ', '.join('?' * len(lanes))
+        def take(conn):
+            row = conn.execute(f"SELECT {self.COLUMNS} FROM broker_jobs WHERE status = 'queued' AND lane IN ({marks}) AND chat_id NOT IN "
+                               "(SELECT chat_id FROM broker_jobs WHERE status = 'running' GROUP BY chat_id HAVING COUNT(*) >= ?) "
+                               "ORDER BY priority, created LIMIT 1", (*lanes, self.max_per_chat)).fetchone()
+            if row is None:
+                return None
+            conn.execute("UPDATE broker_jobs SET status = 'running', worker = ?, attempts = attempts + 1, heartbeat = ? WHERE id = ?",
+                         (worker_id, time.time(), row[0]))
+            entry = self._entry(row)
+            entry['attempts'] += 1
+            return entry
+        return self._transaction(take)
+
+    def heartbeat(self, worker_id):
+        """បន្តអាយុការងាររបស់ Worker ហើយត្រឡប់ id នៃការងារដែលអ្នកប្រើប្រាស់បានបោះបង់"""
+        with self._lock:
+            conn = self._connection()
+            conn.execute("UPDATE broker_jobs SET heartbeat = ? WHERE worker = ? AND status = 'running'", (time.time(), worker_id))
+            rows = conn.execute("SELECT id FROM broker_jobs WHERE worker = ? AND status = 'running' AND cancel = 1", (worker_id,)).fetchall()
+        return {row[0] for row in rows}
+
+    def reclaim(self, lease):
+        """ដាក់ការងាររបស់ Worker ដែលបាត់ Heartbeat ចូលជួរវិញ។ ត្រឡប់ចំនួនការងារ"""
+        with self._lock:
+            conn = self._connection()
+            # ចម្លើយដែលគ្មាន Worker ណាមកយក (ឧ. ចុចប៊ូតុងបន្ទាប់ពីអស់ម៉ោង)
+            conn.execute("DELETE FROM broker_answers WHERE created < ?", (time.time() - ANSWER_TTL,))
+            cursor = conn.execute("UPDATE broker_jobs SET status = 'queued', worker = NULL "
+                                  "WHERE status = 'running' AND heartbeat < ?", (time.time() - lease,))
+            return cursor.rowcount
+
+    def requeue(self, job_id):
+        self._execute("UPDATE broker_jobs SET status = 'queued', worker = NULL WHERE id = ?", (job_id,))
+
+    def finish(self, job_id):
+        self._execute("DELETE FROM broker_jobs WHERE id = ?", (job_id,))
+
+    def cancel_chat(self, chat_id):
+        """លុបការងារដែលកំពុងរង់ចាំរបស់ Chat មួយ ហើយស្នើឱ្យ Worker បញ្ឈប់ការងារដែលកំពុងដំណើរការ
+
+        ត្រឡប់ (ការងារដែលបានលុបពីជួរ, ចំនួនការងារដែលកំពុងដំណើរការ)។
+        """
+        def cancel(conn):
+            queued = [self._entry(row) for row in conn.execute(
+                f"SELECT {self.COLUMNS} FROM broker_jobs WHERE chat_id = ? AND status = 'queued'", (chat_id,)).fetchall()]
+            conn.execute("DELETE FROM broker_jobs WHERE chat_id = ? AND status = 'queued'", (chat_id,))
+            running = conn.execute("UPDATE broker_jobs SET cancel = 1 WHERE chat_id = ? AND status = 'running'", (chat_id,)).rowcount
+            return queued, running
+        return self._transaction(cancel)
+
+    def post_answer(self, token, value):
+        """រក្សាទុកការចុចប៊ូតុងរបស់អ្នកប្រើប្រាស់ សម្រាប់សំណួរដែល Worker Process កំពុងរង់ចាំ"""
+        self._execute("INSERT INTO broker_answers (token, value, created) VALUES (?, ?, ?)", (token, value, time.time()))
+
+    def take_answers(self, tokens):
+        """យក ហើយលុបចម្លើយសម្រាប់ tokens តាមលំដាប់ដែលអ្នកប្រើប្រាស់បានចុច"""
+        marks = ', '.join('?' * len(tokens))
+        def take(conn):
+            rows = conn.execute(f"SELECT id, token, value FROM broker_answers WHERE token IN ({marks}) ORDER BY id", tuple(tokens)).fetchall()
+            if rows:
+                conn.execute(f"DELETE FROM broker_answers WHERE id IN ({', '.join('?' * len(rows))})", tuple(row[0] for row in rows))
+            return [(row[1], row[2]) for row in rows]
+        return self._transaction(take)
+
+    def queued_per_lane(self):
+        depths = dict.fromkeys(LANE_PRIORITY, 0)
+        depths.update(self._execute("SELECT lane, COUNT(*) FROM broker_jobs WHERE status = 'queued' GROUP BY lane"))
+        return depths
+
+job_broker = JobBroker(BROKER_DB_PATH, MAX_QUEUED_JOBS, MAX_JOBS_PER_CHAT) if JOB_BROKER == 'sqlite' else None
+
+def queue_depths():
+    """ចំនួនការងារដែលកំពុងរង់ចាំតាមផ្លូវការងារ (សម្រាប់ Metric)"""
+    if job_broker is not None:
+        return job_broker.queued_per_lane()
+    return {lane: sum(1 for item in job_scheduler._queue if item[2].lane == lane) for lane in LANE_PRIORITY}
+
+# ការងារដែលកំពុងរង់ចាំការទាញយកនៅផ្ទៃខាងក្រោយ មុនពេលបញ្ចូលទៅក្នុង Job Broker (តាម Chat)
+_pending_submissions = defaultdict(set)
+
+async def submit_to_broker(update: Update, msg, op, params):
+    """បញ្ចូលការងារទៅក្នុង Job Broker ជំនួសឱ្យការដំណើរការវាក្នុង Process នេះ"""
+    # Pipeline នៅក្នុង Memory របស់ Bot ដូច្នេះ Worker រៀបចំឯកសារដោយខ្លួនឯង
+    pipeline = take_pipeline(params.pop('pipeline_id', None))
+    if pipeline is not None and pipeline.downloads:
+        # Worker ត្រូវការឯកសារពេញលេញ ប៉ុន្តែ Handler មិនត្រូវរង់ចាំការទាញយក ខណៈវាកាន់ Lock របស់ Chat ទេ
+        chat_id = update.effective_chat.id
+        task = asyncio.create_task(_submit_after_downloads(update, msg, op, params, pipeline))
+        _pending_submissions[chat_id].add(task)
+        task.add_done_callback(_pending_submissions[chat_id].discard)
+        return None
+    if pipeline is not None:
+        pipeline.discard()
+    return await _submit(update, msg, op, params)
+
+async def _submit_after_downloads(update: Update, msg, op, params, pipeline):
+    try:
+        failed = set(await pipeline.wait_downloads())
+    except asyncio.CancelledError:
+        remove_job_inputs(params)
+        try: await msg.delete()
+        except Exception: pass
+        raise
+    finally:
+        pipeline.discard()
+    if failed:
+        params['file_paths'] = [path for path in params['file_paths'] if path not in failed]
+    await _submit(update, msg, op, params)
+
+async def _submit(update: Update, msg, op, params):
+    position = await run_io_bound(job_broker.submit, op, update.effective_chat.id, update.effective_user.id,
+                                  msg.message_id, params, job_workspace(params))
+    if position is None:
+        JOBS_FINISHED.inc(op=op, status='rejected')
+        remove_job_inputs(params)
+        await msg.edit_text("⚠️ សូមអភ័យទោស! ម៉ាស៊ីនកំពុងរវល់ខ្លាំង ហើយជួរការងារពេញហើយ។ សូមព្យាយាមម្ដងទៀតក្នុងពេលបន្តិចទៀត។")
+    elif position > 1:
+        try: await msg.edit_text(f"⏳ ការងាររបស់អ្នកស្ថិតក្នុងជួរលំដាប់ទី {position}។")
+        except Exception: pass
+    return position
+
+async def cancel_broker_jobs(context: ContextTypes.DEFAULT_TYPE, chat_id):
+    """បោះបង់ការងាររបស់ Chat មួយនៅក្នុង Job Broker។ ត្រឡប់ចំនួនការងារ"""
+    waiting = list(_pending_submissions.pop(chat_id, ()))
+    for task in waiting:
+        task.cancel()
+    await asyncio.gather(*waiting, return_exceptions=True)
+    queued, running = await run_io_bound(job_broker.cancel_chat, chat_id)
+    for entry in queued:
+        remove_job_inputs(entry['params'])
+        try: await context.bot.delete_message(chat_id=chat_id, message_id=entry['message_id'])
+        except Exception: pass
+    return len(waiting) + len(queued) + running
+
+class BrokerWorker:
+    """យកការងារពី JobBroker តាមផ្លូវការងារដែលបានកំណត់ ហើយដំណើរការវាដូច JobScheduler ដែរ"""
+
+    def __init__(self, broker, application, lanes, concurrency):
+        self.broker = broker
+        self.application = application
+        self.lanes = list(lanes)
+        self.concurrency = concurrency
+        self.id = f"{os.uname().nodename}-{os.getpid()}"
+        self._running = {}
+        self._stopping = False
+
+    def stop(self):
+        """ឈប់យកការងារថ្មី។ ការងារដែលកំពុងដំណើរការត្រូវបានបញ្ឈប់ ហើយដាក់ចូលជួរវិញសម្រាប់ Worker ផ្សេង"""
+        self._stopping = True
+
+    async def _poll_answers(self):
+        while True:
+            try:
+                await deliver_broker_answers(self.broker)
+            except sqlite3.Error:
+                logging.exception("Job broker unavailable")
+            await asyncio.sleep(BROKER_ANSWER_INTERVAL)
+
+    async def run(self):
+        logging.info("Worker %s consuming lanes %s", self.id, ','.join(self.lanes))
+        answers = asyncio.create_task(self._poll_answers())
+        last_reclaim = 0.0
+        while not self._stopping:
+            try:
+                for job_id in await run_io_bound(self.broker.heartbeat, self.id):
+                    if job_id in self._running:
+                        self._running[job_id].cancel()
+                if time.monotonic() - last_reclaim > BROKER_LEASE / 2:
+                    last_reclaim = time.monotonic()
+                    reclaimed = await run_io_bound(self.broker.reclaim, BROKER_LEASE)
+                    if reclaimed:
+                        logging.warning("Re-queued %s jobs from unresponsive workers", reclaimed)
+                while not self._stopping and len(self._running) < self.concurrency:
+                    entry = await run_io_bound(self.broker.claim, self.lanes, self.id)
+                    if entry is None:
+                        break
+                    self._running[entry['id']] = asyncio.create_task(self._run(entry))
+            except sqlite3.Error:
+                logging.exception("Job broker unavailable")
+            await asyncio.sleep(BROKER_POLL_INTERVAL)
+        answers.cancel()
+        tasks = list(self._running.values())
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+
+    async def _run(self, entry):
+        scope = new_metric_scope(entry['op'], entry['id'])
+        _metric_scope.set(scope)
+        chat_id, params = entry['chat_id'], entry['params']
+        context = self.application.context_types.context(self.application, chat_id=chat_id, user_id=entry['user_id'])
+        msg = Message(message_id=entry['message_id'], date=datetime.datetime.now(datetime.timezone.utc), chat=Chat(id=chat_id, type=Chat.PRIVATE))
+        msg.set_bot(self.application.bot)
+        started = time.monotonic()
+        STAGE_SECONDS.observe(max(0.0, time.time() - entry['created']), op=entry['op'], stage='queue_wait')
+        status = 'ok'
+        try:
+            if entry['cancel']:
+                status = 'cancelled'
+            elif entry['attempts'] > JOB_RESUME_ATTEMPTS or not await run_io_bound(restore_job_inputs, params):
+                status = 'abandoned'
+                try: await context.bot.send_message(chat_id=chat_id, text="⚠️ ការងាររបស់អ្នកត្រូវបានរំខាន។ សូមផ្ញើឯកសារម្ដងទៀត។")
+                except Exception: pass
+            else:
+                # Hard Link នៃឯកសារបញ្ចូល ដើម្បីឱ្យ Worker ផ្សេងអាចបន្តការងារ ប្រសិនបើ Worker នេះត្រូវបានបិទ
+                await run_io_bound(keep_job_inputs, params)
+                await JOB_TASKS[entry['op']](chat_id=chat_id, msg=msg, context=context, **params)
+                if scope['failed']: status = 'error'
+        except asyncio.CancelledError:
+            status = 'interrupted' if self._stopping else 'cancelled'
+            raise
+        except Exception as e:
+            status = 'error'
+            ERRORS.inc(op=entry['op'], error=type(e).__name__)
+            logging.exception("Job %s (%s) failed", entry['id'], entry['op'])
+        finally:
+            if status == 'interrupted':
+                self.broker.requeue(entry['id'])
+            else:
+                self.broker.finish(entry['id'])
+                if entry['workspace']:
+                    shutil.rmtree(entry['workspace'], ignore_errors=True)
+            elapsed = time.monotonic() - started
+            compute = max(0.0, elapsed - scope['upload'] - scope['wait'])
+            STAGE_SECONDS.observe(compute, op=entry['op'], stage='compute')
+            JOBS_FINISHED.inc(op=entry['op'], status=status)
+            logging.info("Job finished", extra={'fields': {
+                'status': status, 'worker': self.id, 'attempts': entry['attempts'], 'total_seconds': round(elapsed, 3),
+                'compute_seconds': round(compute, 3), 'upload_seconds': round(scope['upload'], 3), 'wait_seconds': round(scope['wait'], 3)}})
+            self._running.pop(entry['id'], None)
+
+def application_builder():
+    """ApplicationBuilder ដែលបានកំណត់ Token, Request និង Local Bot API Mode (សម្រាប់ Bot និង Worker)"""
+    builder = Application.builder().token(BOT_TOKEN).request(InstrumentedRequest(connection_pool_size=256, read_timeout=30))
+    if LOCAL_BOT_API_URL:
+        builder = builder.base_url(f"{LOCAL_BOT_API_URL}/bot").base_file_url(f"{LOCAL_BOT_API_URL}/file/bot").local_mode(True)
+    return builder
+
+async def run_worker(lanes, concurrency):
+    """ដំណើរការ Worker Process រហូតដល់ទទួលបាន SIGINT/SIGTERM (ហៅពី worker.py)"""
+    application = application_builder().build()
+    worker = BrokerWorker(job_broker or JobBroker(BROKER_DB_PATH, MAX_QUEUED_JOBS, MAX_JOBS_PER_CHAT), application, lanes, concurrency)
+    loop = asyncio.get_running_loop()
+    for sig in (signal.SIGINT, signal.SIGTERM):
+        loop.add_signal_handler(sig, worker.stop)
+    await application.initialize()
+    await start_metrics_server()
+    try:
+        await worker.run()
+    finally:
+        stop_metrics_server()
+        await application.shutdown()
+        await shutdown_executors(application)
+
+# --- ការរៀបចំឯកសារជាមុន ពេលកំពុងប្រមូល (Collection Pipeline) ---
+
+class CollectionPipeline:
+    """រៀបចំឯកសារនីមួយៗនៅផ្ទៃខាងក្រោយភ្លាមៗពេលវាមកដល់ ដើម្បីឱ្យ /done គ្រាន់តែភ្ជាប់លទ្ធផលចូលគ្នា
+
+    មានតែលេខសម្គាល់ (id) ប៉ុណ្ណោះដែលត្រូវរក្សាទុកក្នុង user_data និង Parameter របស់ការងារ។
+    ប្រសិនបើ Pipeline មិនមាន (ឧ. បន្ទាប់ពីចាប់ផ្ដើមឡើងវិញ) ការងារនឹងរៀបចំឯកសារទាំងអស់ដោយខ្លួនឯង។
+    """
+
+    _slots = None
+
+    def __init__(self, worker):
+        self.id = uuid.uuid4().hex
+        self.worker = worker
+        self.tasks = {}
+        self.downloads = {}
+        self._download_slots = asyncio.Semaphore(DOWNLOAD_CONCURRENCY)
+
+    def submit(self, file_path, message, *args, download=None):
+        """រៀបចំឯកសារនៅផ្ទៃខាងក្រោយ (បន្ទាប់ពី download បញ្ចប់ ប្រសិនបើមាន)"""
+        self.tasks[file_path] = asyncio.ensure_future(self._run(file_path, message, len(self.tasks) + 1, download, *args))
+
+    def download(self, file_path, file_obj):
+        """ទាញយកឯកសារនៅផ្ទៃខាងក្រោយ ស្របគ្នារហូតដល់ DOWNLOAD_CONCURRENCY ឯកសារ ដើម្បីកុំឱ្យ Handler រង់ចាំ"""
+        self.downloads[file_path] = asyncio.ensure_future(self._download(file_path, file_obj))
+        return self.downloads[file_path]
+
+    async def _download(self, file_path, file_obj):
+        async with self._download_slots:
+            await fetch_to_workspace(file_obj, file_path)
+
+    async def wait_downloads(self):
+        """រង់ចាំការទាញយកទាំងអស់ ហើយត្រឡប់ឯកសារដែលទាញយកមិនបាន"""
+        await asyncio.gather(*self.downloads.values(), return_exceptions=True)
+        return [path for path, task in self.downloads.items() if task.cancelled() or task.exception() is not None]
+
+    async def _run(self, file_path, message, number, download, *args):
+        if CollectionPipeline._slots is None:
+            CollectionPipeline._slots = asyncio.Semaphore(PIPELINE_WORKERS)
+        try:
+            if download is not None:
+                await download
+            async with CollectionPipeline._slots:
+                return await run_cpu_bound(self.worker, file_path, *args)
+        except Exception as e:
+            logging.warning("Pipeline %s: failed to prepare %s: %s", self.id, file_path, e)
+            try: await message.reply_text(f"⚠️ ឯកសារទី {number} មិនត្រឹមត្រូវ ហើយនឹងត្រូវរំលង។\nកំហុស: {e}")
+            except Exception: pass
+            raise
+
+    async def results(self):
+        """រង់ចាំការរៀបចំទាំងអស់ ហើយត្រឡប់ {file_path: លទ្ធផល} (ឯកសារដែលបរាជ័យមិនមាននៅក្នុងនេះទេ)"""
+        await asyncio.gather(*self.tasks.values(), return_exceptions=True)
+        return {path: task.result() for path, task in self.tasks.items() if not task.cancelled() and task.exception() is None}
+
+    def failed(self):
+        return [path for path, task in self.tasks.items() if task.done() and (task.cancelled() or task.exception() is not None)]
+
+    def discard(self):
+        """លុបឯកសារ .part បន្ទាប់ពីការរៀបចំនីមួយៗបានបញ្ចប់ (រួមទាំងការរៀបចំដែលកំពុងដំណើរការ)"""
+        for task in self.downloads.values():
+            task.cancel()
+        for path, task in self.tasks.items():
+            task.add_done_callback(lambda _, part=path + '.part': os.path.exists(part) and os.remove(part))
+
+collection_pipelines = {}
+
+def start_pipeline(context, worker):
+    discard_pipeline(context.user_data.pop('pipeline_id', None))
+    pipeline = CollectionPipeline(worker)
+    collection_pipelines[pipeline.id] = pipeline
+    context.user_data['pipeline_id'] = pipeline.id
+    return pipeline
+
+def user_pipeline(context, worker):
+    pipeline = collection_pipelines.get(context.user_data.get('pipeline_id'))
+    if pipeline is None or pipeline.worker is not worker:
+        pipeline = start_pipeline(context, worker)
+    return pipeline
+
+def take_pipeline(pipeline_id):
+    return collection_pipelines.pop(pipeline_id, None) if pipeline_id else None
+
+def discard_pipeline(pipeline_id):
+    pipeline = take_pipeline(pipeline_id)
+    if pipeline:
+        pipeline.discard()
+
+class StatusMessage:
+    """កែសារស្ថានភាពរបស់ការងារ ដោយកំណត់ចន្លោះពេលអប្បបរមារវាងការកែនីមួយៗ"""
+
+    def __init__(self, context, chat_id, msg, interval=PROGRESS_EDIT_INTERVAL):
+        self.context = context
+        self.chat_id = chat_id
+        self.msg = msg
+        self.interval = interval
+        self._last_text = None
+        self._last_edit = 0.0
+
+    async def update(self, text, force=False):
+        now = time.monotonic()
+        if text == self._last_text or (not force and now - self._last_edit < self.interval):
+            return
+        self._last_text = text
+        self._last_edit = now
+        try:
+            await self.context.bot.edit_message_text(text, chat_id=self.chat_id, message_id=self.msg.message_id)
+        except Exception:
+            pass
+
+# --- ឃ្លាំងលទ្ធផល (Result Cache) ---
+
+class ResultCache:
+    """ឃ្លាំងលទ្ធផលផ្អែកលើ SQLite ដែលរក្សាទុក file_id របស់លទ្ធផលដែលបានផ្ញើរួច
+
+    Key បង្កើតពី file_unique_id របស់ឯកសារដើម ប្រភេទការងារ និងប៉ារ៉ាម៉ែត្រ។
+    អនុគមន៍ទាំងអស់ជា blocking ដូច្នេះត្រូវហៅតាមរយៈ run_io_bound។
+    """
+
+    def __init__(self, path, ttl, max_entries):
+        self.path = path
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self._conn = None
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def make_key(file_unique_id, op, **params):
+        raw = json.dumps([file_unique_id, op, params], sort_keys=True)
+        return hashlib.sha256(raw.encode()).hexdigest()
+
+    def _connection(self):
+        if self._conn is None:
+            self._conn = sqlite3.connect(self.path, check_same_thread=False)
+            self._conn.execute("CREATE TABLE IF NOT EXISTS results (key TEXT PRIMARY KEY, value TEXT NOT NULL, created REAL NOT NULL, last_used REAL NOT NULL)")
+            self._conn.execute("CREATE INDEX IF NOT EXISTS results_last_used ON results (last_used)")
+        return self._conn
+
+    def get(self, key):
+        now = time.time()
+        with self._lock:
+            conn = self._connection()
+            row = conn.execute("SELECT value, created FROM results WHERE key = ?", (key,)).fetchone()
+            if row is None:
+                return None
+            if now - row[1] > self.ttl:
+                conn.execute("DELETE FROM results WHERE key = ?", (key,))
+                conn.commit()
+                return None
+            conn.execute("UPDATE results SET last_used = ? WHERE key = ?", (now, key))
+            conn.commit()
+            return json.loads(row[0])
+
+    def put(self, key, value):
+        now = time.time()
+        with self._lock:
+            conn = self._connection()
+            conn.execute("INSERT OR REPLACE INTO results (key, value, created, last_used) VALUES (?, ?, ?, ?)", (key, json.dumps(value), now, now))
+            conn.execute("DELETE FROM results WHERE created < ?", (now - self.ttl,))
+            conn.execute("DELETE FROM results WHERE key IN (SELECT key FROM results ORDER BY last_used DESC LIMIT -1 OFFSET ?)", (self.max_entries,))
+            conn.commit()
+
+    def delete(self, key):
+        with self._lock:
+            conn = self._connection()
+            conn.execute("DELETE FROM results WHERE key = ?", (key,))
+            conn.commit()
+
+result_cache = ResultCache(CACHE_DB_PATH, CACHE_TTL, CACHE_MAX_ENTRIES)
+
+def cached_item(message, caption=None):
+    """ទាញយក file_id និងប្រភេទឯកសារពីសារដែល Bot បានផ្ញើ"""
+    for kind in ('photo', 'audio', 'video', 'document'):
+        attachment = getattr(message, kind)
+        if attachment:
+            if kind == 'photo':
+                attachment = attachment[-1]
+            return {'kind': kind, 'file_id': attachment.file_id, 'caption': caption}
+    return None
+
+async def store_result(cache_key, items=None, text=None):
+    if not cache_key:
+        return
+    items = [item for item in (items or []) if item]
+    if not items and text is None:
+        return
+    try:
+        await run_io_bound(result_cache.put, cache_key, {'items': items, 'text': text})
+    except Exception:
+        logging.exception("Failed to store cached result")
+
+async def send_cached(context, chat_id, value):
+    bot = context.bot
+    if value.get('text') is not None:
+        await send_text_result(context, chat_id, value['text'])
+    items = value.get('items', [])
+    photos = [item for item in items if item['kind'] == 'photo']
+    if len(photos) > 1 and len(photos) == len(items):
+        for i in range(0, len(photos), MEDIA_GROUP_SIZE):
+            group = photos[i:i + MEDIA_GROUP_SIZE]
+            if len(group) == 1:
+                await send_with_retry(chat_id, lambda: bot.send_photo(chat_id=chat_id, photo=group[0]['file_id'], caption=group[0]['caption']))
+            else:
+                await send_with_retry(chat_id, lambda: bot.send_media_group(chat_id=chat_id, media=[InputMediaPhoto(item['file_id'], caption=item['caption']) for item in group]), cost=len(group))
+        return
+    senders = {'photo': bot.send_photo, 'audio': bot.send_audio, 'video': bot.send_video, 'document': bot.send_document}
+    for item in items:
+        send = senders[item['kind']]
+        await send_with_retry(chat_id, lambda: send(chat_id, item['file_id'], caption=item['caption']))
+
+async def send_text_result(context, chat_id, text):
+    if not text.strip():
+        await context.bot.send_message(chat_id=chat_id, text="មិនអាចរកឃើញអក្សរនៅក្នុងរូបភាពនេះទេ ឬរូបភាពគ្មានគុណភាពល្អ។")
+    else:
+        await context.bot.send_message(chat_id=chat_id, text=f"**លទ្ធផលដែលបានបំប្លែង៖**\n\n```\n{text}\n```", parse_mode='Markdown')
+
+async def reply_from_cache(update: Update, context: ContextTypes.DEFAULT_TYPE, cache_key) -> bool:
+    """ផ្ញើលទ្ធផលពីឃ្លាំងប្រសិនបើមាន។ ត្រឡប់ True ប្រសិនបើបានផ្ញើ"""
+    try:
+        value = await run_io_bound(result_cache.get, cache_key)
+    except Exception:
+        logging.exception("Result cache lookup failed")
+        return False
+    if value is None:
+        return False
+    msg = await update.message.reply_text("⚡ ឯកសារនេះធ្លាប់ត្រូវបានបំប្លែងរួចហើយ។ កំពុងផ្ញើលទ្ធផល...")
+    try:
+        await send_cached(context, update.effective_chat.id, value)
+    except BadRequest:
+        # file_id លែងមានសុពលភាព៖ លុបចេញពីឃ្លាំង ហើយបំប្លែងម្ដងទៀត
+        await run_io_bound(result_cache.delete, cache_key)
+        await msg.delete()
+        return False
+    await msg.delete()
+    return True
+
+# --- ស្រទាប់ផ្ញើលទ្ធផល (Delivery Layer) ---
+
+class SendRateLimiter:
+    """កំណត់ចន្លោះពេលរវាងការផ្ញើទៅកាន់ Chat តែមួយ និងចំនួនការផ្ញើសរុបក្នុងមួយវិនាទី"""
+
+    def __init__(self, chat_interval, global_per_second):
+        self.chat_interval = chat_interval
+        self.global_interval = 1.0 / global_per_second
+        self._next_chat_slot = defaultdict(float)
+        self._next_global_slot = 0.0
+
+    async def wait(self, chat_id, cost=1):
+        now = time.monotonic()
+        slot = max(now, self._next_chat_slot[chat_id], self._next_global_slot)
+        self._next_chat_slot[chat_id] = slot + self.chat_interval * cost
+        self._next_global_slot = slot + self.global_interval * cost
+        if slot > now:
+            await asyncio.sleep(slot - now)
+
+send_limiter = SendRateLimiter(CHAT_SEND_INTERVAL, GLOBAL_SENDS_PER_SECOND)
+
+async def send_with_retry(chat_id, make_request, cost=1):
+    """ផ្ញើសំណើទៅ Telegram ហើយព្យាយាមម្ដងទៀតពេលជួប 429 (RetryAfter) ឬបញ្ហាបណ្ដាញ
+
+    make_request ត្រូវតែបង្កើតសំណើថ្មីរាល់ពេលហៅ ព្រោះ InputFile មិនអាចប្រើឡើងវិញបានទេ។
+    """
+    for attempt in range(SEND_RETRIES):
+        await send_limiter.wait(chat_id, cost)
+        try:
+            return await make_request()
+        except RetryAfter as e:
+            logging.warning("Telegram flood limit for chat %s, retrying in %ss", chat_id, e.retry_after)
+            await asyncio.sleep(e.retry_after + 1)
+        except BadRequest:
+            raise
+        except (TimedOut, NetworkError):
+            if attempt == SEND_RETRIES - 1:
+                raise
+            await asyncio.sleep(2 ** attempt)
+    raise TimedOut("បានព្យាយាមផ្ញើច្រើនដងពេកហើយ")
+
+class MediaGroupSender:
+    """ប្រមូលឯកសារជាក្រុមៗ (អតិបរមា 10) ហើយផ្ញើក្រុមច្រើនក្នុងពេលតែមួយ"""
+
+    def __init__(self, context, chat_id, kind='photo', concurrency=UPLOAD_CONCURRENCY, delete_after=True):
+        self.context = context
+        self.chat_id = chat_id
+        self.kind = kind
+        self.delete_after = delete_after
+        self.sent = 0
+        self._batch = []
+        self._semaphore = asyncio.Semaphore(concurrency)
+        self._tasks = []
+        self._delivered = {}
+        self._seq = itertools.count()
+
+    @property
+    def delivered(self):
+        """ធាតុដែលបានផ្ញើរួច (សម្រាប់ឃ្លាំងលទ្ធផល) តាមលំដាប់ដែលបានបន្ថែម"""
+        return [self._delivered[key] for key in sorted(self._delivered)]
+
+    async def add(self, path, caption=None, filename=None):
+        self._batch.append((next(self._seq), path, caption, filename or os.path.basename(path)))
+        if len(self._batch) >= MEDIA_GROUP_SIZE:
+            await self._flush()
+
+    async def _flush(self):
+        if not self._batch:
+            return
+        batch, self._batch = self._batch, []
+        # រង់ចាំកន្លែងទំនេរមុននឹងបង្កើតក្រុមថ្មី ដើម្បីកុំឱ្យការបំប្លែងរត់ទៅមុខឆ្ងាយពេក
+        await self._semaphore.acquire()
+        self._tasks.append(asyncio.create_task(self._send_batch(batch)))
+
+    async def _send_batch(self, batch):
+        try:
+            contents = [await upload_file(path) for _, path, _, _ in batch]
+            bot = self.context.bot
+            if len(batch) == 1:
+                (_, path, caption, filename), content = batch[0], contents[0]
+                if self.kind == 'photo':
+                    messages = [await send_with_retry(self.chat_id, lambda: bot.send_photo(chat_id=self.chat_id, photo=content, caption=caption))]
+                else:
+                    messages = [await send_with_retry(self.chat_id, lambda: bot.send_document(chat_id=self.chat_id, document=content, filename=filename, caption=caption))]
+            else:
+                def make_group():
+                    if self.kind == 'photo':
+                        media = [InputMediaPhoto(content, caption=caption) for (_, _, caption, _), content in zip(batch, contents)]
+                    else:
+                        media = [InputMediaDocument(content, caption=caption, filename=filename) for (_, _, caption, filename), content in zip(batch, contents)]
+                    return bot.send_media_group(chat_id=self.chat_id, media=media)
+                messages = await send_with_retry(self.chat_id, make_group, cost=len(batch))
+            for (seq, _, caption, _), message in zip(batch, messages):
+                self._delivered[seq] = cached_item(message, caption)
+            self.sent += len(batch)
+        finally:
+            self._semaphore.release()
+            if self.delete_after:
+                for _, path, _, _ in batch:
+                    if os.path.exists(path): os.remove(path)
+
+    async def close(self):
+        """ផ្ញើក្រុមដែលនៅសល់ ហើយរង់ចាំការផ្ញើទាំងអស់ឱ្យបញ្ចប់"""
+        await self._flush()
+        results = await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks = []
+        for result in results:
+            if isinstance(result, BaseException):
+                raise result
+
+    async def abort(self):
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks = []
+
+_pending_choices = {}
+
+async def ask_choice(context, chat_id, text, options, default, timeout=CHOICE_TIMEOUT):
+    """សួរអ្នកប្រើប្រាស់ដោយប្រើប៊ូតុង ហើយរង់ចាំចម្លើយ (ឬត្រឡប់ default ពេលអស់ម៉ោង)"""
+    token = uuid.uuid4().hex[:8]
+    future = asyncio.get_running_loop().create_future()
+    _pending_choices[token] = future
+    keyboard = [[InlineKeyboardButton(label, callback_data=f"choice_{token}_{value}")] for value, label in options]
+    prompt = await context.bot.send_message(chat_id=chat_id, text=text, reply_markup=InlineKeyboardMarkup(keyboard))
+    started = time.monotonic()
+    try:
+        return await asyncio.wait_for(future, timeout)
+    except asyncio.TimeoutError:
+        return default
+    finally:
+        record_wait(time.monotonic() - started)
+        _pending_choices.pop(token, None)
+        try: await context.bot.delete_message(chat_id=chat_id, message_id=prompt.message_id)
+        except Exception: pass
+
+def _apply_choice(token, value):
+    future = _pending_choices.get(token)
+    if future is not None and not future.done():
+        future.set_result(value)
+
+async def resolve_choice(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
+    query = update.callback_query
+    await query.answer()
+    _, token, value = query.data.split('_', 2)
+    if token in _pending_choices:
+        _apply_choice(token, value)
+    elif job_broker is not None:
+        # សំណួរនេះមកពី Worker Process ដូច្នេះបញ្ជូនចម្លើយតាម Job Broker
+        await run_io_bound(job_broker.post_answer, token, f"choice_{value}")
+
+_pending_selections = {}
+SELECTION_PAGE_SIZE = 8
+
+def _selection_keyboard(token, state):
+    items, selected, page = state['items'], state['selected'], state['page']
+    start = page * SELECTION_PAGE_SIZE
+    keyboard = [[InlineKeyboardButton(("✅ " if i in selected else "⬜ ") + label, callback_data=f"pick_{token}_t{i}")]
+                for i, label in enumerate(items[start:start + SELECTION_PAGE_SIZE], start)]
+    nav = []
+    if page > 0: nav.append(InlineKeyboardButton("⬅️", callback_data=f"pick_{token}_p{page - 1}"))
+    if start + SELECTION_PAGE_SIZE < len(items): nav.append(InlineKeyboardButton("➡️", callback_data=f"pick_{token}_p{page + 1}"))
+    if nav: keyboard.append(nav)
+    keyboard.append([InlineKeyboardButton("☑️ ទាំងអស់", callback_data=f"pick_{token}_all"),
+                     InlineKeyboardButton(f"📤 ពន្លា ({len(selected)})", callback_data=f"pick_{token}_ok")])
+    return InlineKeyboardMarkup(keyboard)
+
+async def ask_selection(context, chat_id, text, items, timeout=ARCHIVE_SELECT_TIMEOUT):
+    """ឱ្យអ្នកប្រើប្រាស់ជ្រើសរើសធាតុច្រើនពីបញ្ជី (មានទំព័រ) ហើយត្រឡប់ Index ដែលបានជ្រើសរើស
+
+    ពេលអស់ម៉ោង ធាតុដែលបានជ្រើសរើសរួច (ឬទាំងអស់ ប្រសិនបើមិនទាន់ជ្រើសរើស) ត្រូវបានត្រឡប់។
+    """
+    token = uuid.uuid4().hex[:8]
+    state = {'items': items, 'selected': set(), 'page': 0, 'text': text,
+             'future': asyncio.get_running_loop().create_future()}
+    prompt = await context.bot.send_message(chat_id=chat_id, text=text, reply_markup=_selection_keyboard(token, state))
+    state['message'] = prompt
+    _pending_selections[token] = state
+    started = time.monotonic()
+    try:
+        await asyncio.wait_for(state['future'], timeout)
+    except asyncio.TimeoutError:
+        pass
+    finally:
+        record_wait(time.monotonic() - started)
+        _pending_selections.pop(token, None)
+        try: await context.bot.delete_message(chat_id=chat_id, message_id=prompt.message_id)
+        except Exception: pass
+    return sorted(state['selected']) or list(range(len(items)))
+
+async def _apply_selection(token, action):
+    state = _pending_selections.get(token)
+    if state is None or state['future'].done():
+        return
+    if action == 'ok':
+        state['future'].set_result(None)
+        return
+    if action == 'all':
+        state['selected'] = set() if len(state['selected']) == len(state['items']) else set(range(len(state['items'])))
+    elif action.startswith('p'):
+        state['page'] = int(action[1:])
+    else:
+        state['selected'] ^= {int(action[1:])}
+    try: await state['message'].edit_text(state['text'], reply_markup=_selection_keyboard(token, state))
+    except BadRequest: pass
+
+async def resolve_selection(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
+    query = update.callback_query
+    await query.answer()
+    _, token, action = query.data.split('_', 2)
+    if token in _pending_selections:
+        await _apply_selection(token, action)
+    elif job_broker is not None:
+        await run_io_bound(job_broker.post_answer, token, f"pick_{action}")
+
+async def deliver_broker_answers(broker):
+    """បញ្ជូនការចុចប៊ូតុងដែល Bot បានរក្សាទុកក្នុង Job Broker ទៅកាន់សំណួរដែលកំពុងរង់ចាំក្នុង Worker Process នេះ"""
+    tokens = [*_pending_choices, *_pending_selections]
+    if not tokens:
+        return
+    for token, answer in await run_io_bound(broker.take_answers, tokens):
+        kind, value = answer.split('_', 1)
+        if kind == 'choice':
+            _apply_choice(token, value)
+        else:
+            await _apply_selection(token, value)
+
+# --- ការដំណើរការ FFmpeg ដោយមិនរាំងស្ទះ (Async FFmpeg) ---
+
+class MediaJobTimeout(Exception):
+    pass
+
+def media_threads():
+    """ចំនួន Thread សម្រាប់ encoder ម្ដងមួយការងារ ដោយចែកស្នូល CPU ដែលមានតាមចំនួនការងារ media"""
+    try:
+        cores = len(os.sched_getaffinity(0))
+    except AttributeError:
+        cores = os.cpu_count() or 1
+    return max(1, cores // max(1, LANE_LIMITS['media']))
+
+async def run_ffmpeg(stream, on_progress=None, timeout=MEDIA_JOB_TIMEOUT, cpu_limit=MEDIA_CPU_LIMIT):
+    """ដំណើរការ FFmpeg ជា asyncio subprocess ហើយរាយការណ៍វឌ្ឍនភាពតាមរយៈ -progress pipe:1
+
+    on_progress ត្រូវបានហៅជាមួយទីតាំងបច្ចុប្បន្ន (វិនាទី) ក្នុងឯកសារលទ្ធផល។
+    Process ត្រូវបានសម្លាប់ពេលអស់ម៉ោង ឬពេលការងារត្រូវបានបោះបង់ (/cancel)។
+    """
+    args = stream.global_args('-nostdin', '-nostats', '-progress', 'pipe:1').overwrite_output().compile(cmd=FFMPEG_BIN)
+    proc = await asyncio.create_subprocess_exec(*args, stdout=asyncio.subprocess.PIPE, stderr=asyncio.subprocess.PIPE)
+    try:
+        resource.prlimit(proc.pid, resource.RLIMIT_CPU, (cpu_limit, cpu_limit + 5))
+    except (AttributeError, OSError, ValueError):
+        logging.warning("Could not apply CPU limit to ffmpeg process %s", proc.pid)
+    stderr_tail = bytearray()
+    frames = 0
+
+    async def read_stderr():
+        async for line in proc.stderr:
+            stderr_tail.extend(line)
+            del stderr_tail[:-4000]
+
+    async def read_progress():
+        nonlocal frames
+        async for raw in proc.stdout:
+            key, _, value = raw.decode(errors='ignore').strip().partition('=')
+            if key == 'frame' and value.isdigit():
+                frames = int(value)
+            if key == 'out_time_us' and on_progress is not None and value.isdigit():
+                await on_progress(int(value) / 1_000_000)
+
+    try:
+        await asyncio.wait_for(asyncio.gather(read_progress(), read_stderr(), proc.wait()), timeout)
+    except asyncio.TimeoutError:
+        raise MediaJobTimeout()
+    finally:
+        if proc.returncode is None:
+            proc.kill()
+            await proc.wait()
+    if proc.returncode == -signal.SIGXCPU:
+        raise MediaJobTimeout()
+    if proc.returncode != 0:
+        raise ffmpeg.Error('ffmpeg', b'', bytes(stderr_tail))
+    record_units('frames', frames)
+
 # --- អនុគមន៍ដំណើរការនៅខាងក្រោយ (Background Tasks) ---
 # (រក្សាទុកអនុគមន៍ដំណើរការនៅខាងក្រោយទាំងអស់របស់អ្នក ដោយសារពួកវាត្រឹមត្រូវ)
 
-async def pdf_to_img_task(chat_id, file_path, msg, context, fmt):
+async def pdf_to_img_task(chat_id, file_path, msg, context, fmt, cache_key=None):
+    output_dir = tempfile.mkdtemp(prefix="pages_", dir=os.path.dirname(file_path))
+    status = StatusMessage(context, chat_id, msg)
+    render = None
+    sender = None
     try:
-        images = convert_from_path(file_path, dpi=200, fmt=fmt)
-        await context.bot.edit_message_text(f"បំប្លែងបាន {len(images)} ទំព័រ។ កំពុងផ្ញើរូបភាព...", chat_id=chat_id, message_id=msg.message_id)
-        for i, image in enumerate(images):
-            out_path = f"page_{i+1}_{chat_id}.{fmt}"
-            image.save(out_path, fmt.upper())
-            await context.bot.send_photo(chat_id=chat_id, photo=open(out_path, 'rb'))
-            os.remove(out_path)
+        total = await run_io_bound(engine.pdf_page_count, file_path)
+        if not total: raise ValueError("ឯកសារ PDF នេះគ្មានទំព័រទេ")
+        record_units('pages', total)
+        as_zip = False
+        if total > ZIP_OFFER_THRESHOLD:
+            choice = await ask_choice(context, chat_id, f"PDF នេះមាន {total} ទំព័រ។ តើអ្នកចង់ទទួលរូបភាពដោយរបៀបណា?",
+                                      [('zip', "📦 ឯកសារ ZIP តែមួយ"), ('photos', "🖼️ រូបភាពជាក្រុមៗ")], default='zip')
+            as_zip = choice == 'zip'
+        zip_path = os.path.join(output_dir, "pages.zip")
+        if not as_zip:
+            sender = MediaGroupSender(context, chat_id, 'photo')
+        await status.update(f"PDF មាន {total} ទំព័រ។ កំពុងបំប្លែង និងផ្ញើរូបភាព...", force=True)
+        windows = [(first, min(first + PDF_RENDER_WINDOW - 1, total)) for first in range(1, total + 1, PDF_RENDER_WINDOW)]
+        done = 0
+        # បំប្លែងក្រុមទំព័របន្ទាប់ ខណៈពេលកំពុងផ្ញើក្រុមបច្ចុប្បន្ន
+        render = asyncio.ensure_future(run_io_bound(engine.render_pdf_window, file_path, fmt, *windows[0], output_dir))
+        for index, (first, _) in enumerate(windows):
+            out_paths = await render
+            render = None
+            if index + 1 < len(windows):
+                render = asyncio.ensure_future(run_io_bound(engine.render_pdf_window, file_path, fmt, *windows[index + 1], output_dir))
+            for page_number, out_path in enumerate(out_paths, start=first):
+                if as_zip:
+                    await run_io_bound(_append_to_zip, zip_path, out_path, f"page_{page_number}{os.path.splitext(out_path)[1]}")
+                    os.remove(out_path)
+                else:
+                    await sender.add(out_path, caption=f"ទំព័រ {page_number}")
+                done += 1
+                await status.update(f"កំពុងបំប្លែង និងផ្ញើរូបភាព... {done}/{total} ទំព័រ")
+        if as_zip:
+            await status.update("កំពុងផ្ញើឯកសារ ZIP...", force=True)
+            content = await upload_file(zip_path)
+            message = await send_with_retry(chat_id, lambda: context.bot.send_document(chat_id=chat_id, document=content, filename="Pages.zip"))
+            await store_result(cache_key, [cached_item(message)])
+        else:
+            await sender.close()
+            await store_result(cache_key, sender.delivered)
     except Exception as e:
+        record_failure(e)
         await context.bot.edit_message_text(f"មានបញ្ហាក្នុងការបំប្លែង PDF ទៅជារូបភាព។\nកំហុស: {e}", chat_id=chat_id, message_id=msg.message_id)
     finally:
+        if sender is not None:
+            await sender.abort()
+        if render is not None:
+            try: await render
+            except Exception: pass
         if os.path.exists(file_path): os.remove(file_path)
+        shutil.rmtree(output_dir, ignore_errors=True)
         if msg: 
             try: await context.bot.delete_message(chat_id=chat_id, message_id=msg.message_id)
             except Exception: pass
 
-async def merge_pdf_task(chat_id, file_paths, msg, context):
-    output_path = f"merged_{chat_id}.pdf"
+async def merge_pdf_task(chat_id, file_paths, msg, context, pipeline_id=None):
+    # ឯកសារបញ្ចូលរក្សាឈ្មោះដើម (សម្រាប់ Bookmark) ដូច្នេះលទ្ធផលត្រូវនៅក្នុងថតរងដាច់ដោយឡែក
+    output_dir = tempfile.mkdtemp(prefix="merge_", dir=os.path.dirname(file_paths[0]))
+    output_path = os.path.join(output_dir, "merged.pdf")
+    pipeline = take_pipeline(pipeline_id)
     try:
-        merger = PdfMerger()
-        for path in file_paths:
-            merger.append(path)
-        merger.write(output_path)
-        merger.close()
+        merge_paths = file_paths
+        if pipeline:
+            # PDF នីមួយៗត្រូវបានពិនិត្យរួចហើយពេលវាមកដល់ ឯកសារដែលទាញយកមិនបាន ឬខូចត្រូវបានរំលង
+            await pipeline.wait_downloads()
+            await run_io_bound(keep_job_inputs, {'file_paths': file_paths})
+            await pipeline.results()
+            skipped = set(pipeline.failed())
+            merge_paths = [path for path in file_paths if path not in skipped]
+        if len(merge_paths) < 2: raise ValueError("មិនមានឯកសារ PDF ត្រឹមត្រូវគ្រប់គ្រាន់ដើម្បីបញ្ចូលគ្នាទេ")
+        # ទំព័រត្រូវបានសរសេរម្ដងមួយៗ ជាមួយ Bookmark តាមឈ្មោះឯកសារនីមួយៗ
+        stats = await run_cpu_bound(engine.merge_pdfs, merge_paths, output_path)
+        record_units('pages', stats['pages'])
         await context.bot.edit_message_text("បញ្ចូលឯកសារបានជោគជ័យ! កំពុងផ្ញើ...", chat_id=chat_id, message_id=msg.message_id)
-        await context.bot.send_document(chat_id=chat_id, document=open(output_path, 'rb'), filename="Merged.pdf")
+        await context.bot.send_document(chat_id=chat_id, document=await upload_file(output_path), filename="Merged.pdf")
     except Exception as e:
+        record_failure(e)
         await context.bot.edit_message_text(f"មានបញ្ហាក្នុងការបញ្ចូលឯកសារ។\nកំហុស: {e}", chat_id=chat_id, message_id=msg.message_id)
     finally:
+        if pipeline: pipeline.discard()
         for path in file_paths:
             if os.path.exists(path): os.remove(path)
-        if os.path.exists(output_path): os.remove(output_path)
+        shutil.rmtree(output_dir, ignore_errors=True)
         if msg: 
             try: await context.bot.delete_message(chat_id=chat_id, message_id=msg.message_id)
             except Exception: pass
 
+# ឧទាហរណ៍កន្សោមទំព័រសម្រាប់ការបំបែក PDF
+SPLIT_RANGE_HELP = ("ឧទាហរណ៍៖\n"
+                    "• 2-5 ឬ 1,3,8 — ឯកសារតែមួយ\n"
+                    "• 1-5; 6-10; 11- — ឯកសារមួយសម្រាប់ជំពូកនីមួយៗ\n"
+                    "• every 10 — ឯកសារមួយរៀងរាល់ 10 ទំព័រ\n"
+                    "• odd / even — ទំព័រសេស / គូ\n"
+                    "• last 3 — 3 ទំព័រចុងក្រោយ")
+
 async def split_pdf_task(chat_id, file_path, page_range_str, msg, context):
-    output_path = f"split_{chat_id}.pdf"
+    output_dir = tempfile.mkdtemp(prefix="split_", dir=os.path.dirname(file_path))
+    status = StatusMessage(context, chat_id, msg)
+    sender = None
     try:
-        writer = PdfWriter()
-        reader = PdfReader(file_path)
-        pages_to_extract = set()
-        parts = page_range_str.split(',')
-        for part in parts:
-            part = part.strip()
-            if '-' in part:
-                start, end = map(int, part.split('-'))
-                for i in range(start, end + 1): pages_to_extract.add(i-1)
-            else:
-                pages_to_extract.add(int(part)-1)
-        for i in sorted(list(pages_to_extract)):
-            if 0 <= i < len(reader.pages): writer.add_page(reader.pages[i])
-        if not writer.pages: raise ValueError("ទំព័រមិនត្រឹមត្រូវ")
-        
-        writer.write(output_path)
-        await context.bot.edit_message_text("បំបែកឯកសារបានជោគជ័យ! កំពុងផ្ញើ...", chat_id=chat_id, message_id=msg.message_id)
-        await context.bot.send_document(chat_id=chat_id, document=open(output_path, 'rb'), filename="Split.pdf")
+        stats = await run_cpu_bound(engine.split_pdf, file_path, page_range_str, output_dir)
+        parts = stats['parts']
+        record_units('pages', sum(part['pages'] for part in parts))
+        if len(parts) == 1:
+            await status.update("បំបែកឯកសារបានជោគជ័យ! កំពុងផ្ញើ...", force=True)
+            await context.bot.send_document(chat_id=chat_id, document=await upload_file(parts[0]['path']), filename="Split.pdf")
+            return
+        as_zip = False
+        if len(parts) > MEDIA_GROUP_SIZE:
+            choice = await ask_choice(context, chat_id, f"ការបំបែកនេះបង្កើតឯកសារ PDF ចំនួន {len(parts)}។ តើអ្នកចង់ទទួលវាដោយរបៀបណា?",
+                                      [('zip', "📦 ឯកសារ ZIP តែមួយ"), ('docs', "📄 ឯកសារជាក្រុមៗ")], default='zip')
+            as_zip = choice == 'zip'
+        await status.update(f"បំបែកបានឯកសារ {len(parts)}! កំពុងផ្ញើ...", force=True)
+        if as_zip:
+            zip_path = os.path.join(output_dir, "split.zip")
+            for part in parts:
+                await run_io_bound(_append_to_zip, zip_path, part['path'], f"Pages_{part['label'].replace(',', '_')}.pdf")
+            content = await upload_file(zip_path)
+            await send_with_retry(chat_id, lambda: context.bot.send_document(chat_id=chat_id, document=content, filename="Split.zip"))
+        else:
+            sender = MediaGroupSender(context, chat_id, 'document')
+            for part in parts:
+                await sender.add(part['path'], caption=f"ទំព័រ {part['label']} ({part['pages']} ទំព័រ)",
+                                 filename=f"Pages_{part['label'].replace(',', '_')}.pdf")
+            await sender.close()
+    except ValueError as e:
+        record_failure(e)
+        await context.bot.edit_message_text(f"មានបញ្ហាក្នុងការបំបែកឯកសារ៖ {e}\n\n{SPLIT_RANGE_HELP}", chat_id=chat_id, message_id=msg.message_id)
+        # ទុកសារនេះ ដើម្បីឱ្យអ្នកប្រើប្រាស់ឃើញឧទាហរណ៍
+        msg = None
     except Exception as e:
-        await context.bot.edit_message_text(f"មានបញ្ហាក្នុងការបំបែកឯកសារ។\nសូមប្រាកដថាទម្រង់លេខទំព័រត្រឹមត្រូវ (ឧ. 2-5 ឬ 1,3,8)។", chat_id=chat_id, message_id=msg.message_id)
+        record_failure(e)
+        await context.bot.edit_message_text(f"មានបញ្ហាក្នុងការបំបែកឯកសារ។\nកំហុស: {e}", chat_id=chat_id, message_id=msg.message_id)
     finally:
+        if sender: await sender.abort()
         if os.path.exists(file_path): os.remove(file_path)
-        if os.path.exists(output_path): os.remove(output_path)
+        await run_io_bound(shutil.rmtree, output_dir, True)
         if msg: 
             try: await context.bot.delete_message(chat_id=chat_id, message_id=msg.message_id)
             except Exception: pass
 
-async def compress_pdf_task(chat_id, file_path, msg, context):
-    output_path = f"compressed_{chat_id}.pdf"
+def format_size(size):
+    if size < 1024 * 1024:
+        return f"{size / 1024:.0f} KB"
+    return f"{size / 1024 / 1024:.1f} MB"
+
+async def compress_pdf_task(chat_id, file_path, msg, context, level='medium', cache_key=None):
+    output_path = workspace_path(file_path, "compressed.pdf")
     try:
-        reader = PdfReader(file_path)
-        writer = PdfWriter()
-        for page in reader.pages:
-            page.compress_content_streams()
-            writer.add_page(page)
-        with open(output_path, "wb") as f: writer.write(f)
+        stats = await run_cpu_bound(engine.compress_pdf, file_path, output_path, level)
+        before, after, elapsed = stats['input_bytes'], stats['output_bytes'], stats['seconds']
+        logging.info("Compressed %s (%s): %d → %d bytes in %.1fs %s", file_path, level, before, after, elapsed, stats)
         await context.bot.edit_message_text("បន្ថយទំហំឯកសារបានជោគជ័យ! កំពុងផ្ញើ...", chat_id=chat_id, message_id=msg.message_id)
-        await context.bot.send_document(chat_id=chat_id, document=open(output_path, 'rb'), filename="Compressed.pdf")
+        send_path = output_path
+        if after >= before:
+            # ឯកសារនេះត្រូវបានបង្រួមល្អរួចហើយ៖ ផ្ញើឯកសារដើមវិញជំនួសឱ្យលទ្ធផលដែលធំជាង
+            send_path = file_path
+            caption = f"ℹ️ ឯកសារនេះត្រូវបានបង្រួមរួចហើយ មិនអាចបន្ថយទំហំបន្ថែមបានទេ ({format_size(before)})។"
+        else:
+            caption = (f"📦 {format_size(before)} → {format_size(after)} (−{(1 - after / before) * 100:.0f}%)\n"
+                       f"⏱️ {elapsed:.1f} វិនាទី • រូបភាពបានបង្រួម៖ {stats['images']}")
+        message = await context.bot.send_document(chat_id=chat_id, document=await upload_file(send_path), filename="Compressed.pdf", caption=caption)
+        await store_result(cache_key, [cached_item(message, caption)])
     except Exception as e:
+        record_failure(e)
         await context.bot.edit_message_text(f"មានបញ្ហាក្នុងការបន្ថយទំហំឯកសារ។\nកំហុស: {e}", chat_id=chat_id, message_id=msg.message_id)
     finally:
         if os.path.exists(file_path): os.remove(file_path)
@@ -149,21 +2151,25 @@ async def compress_pdf_task(chat_id, file_path, msg, context):
             try: await context.bot.delete_message(chat_id=chat_id, message_id=msg.message_id)
             except Exception: pass
 
-async def img_to_pdf_task(chat_id, file_paths, msg, context):
-    output_path = f"converted_from_img_{chat_id}.pdf"
+async def img_to_pdf_task(chat_id, file_paths, msg, context, page_size='original', downscale=False, pipeline_id=None):
+    output_path = workspace_path(file_paths[0], "converted_from_img.pdf")
+    pipeline = take_pipeline(pipeline_id)
     try:
         if not file_paths: raise ValueError("មិនមានរូបភាពដើម្បីបំប្លែងទេ")
-        image_list = []
-        for path in file_paths:
-            image_list.append(Image.open(path).convert('RGB'))
-        first_image = image_list[0]
-        other_images = image_list[1:]
-        first_image.save(output_path, "PDF", resolution=100.0, save_all=True, append_images=other_images)
+        prepared = await pipeline.results() if pipeline else {}
+        # រូបភាពដែលរៀបចំមិនបាន ត្រូវបានជូនដំណឹងរួចហើយ ហើយត្រូវបានរំលង
+        skipped = set(pipeline.failed()) if pipeline else set()
+        image_paths = [path for path in file_paths if path not in skipped]
+        if not image_paths: raise ValueError("មិនមានរូបភាពត្រឹមត្រូវដើម្បីបំប្លែងទេ")
+        await run_cpu_bound(engine.images_to_pdf, image_paths, output_path, page_size, downscale, prepared)
+        record_units('pages', len(image_paths))
         await context.bot.edit_message_text("បំប្លែងរូបភាពទៅជា PDF បានជោគជ័យ! កំពុងផ្ញើ...", chat_id=chat_id, message_id=msg.message_id)
-        await context.bot.send_document(chat_id=chat_id, document=open(output_path, 'rb'), filename="Image_to_PDF.pdf")
+        await context.bot.send_document(chat_id=chat_id, document=await upload_file(output_path), filename="Image_to_PDF.pdf")
     except Exception as e:
+        record_failure(e)
         await context.bot.edit_message_text(f"មានបញ្ហាក្នុងការបំប្លែងរូបភាពទៅជា PDF ។\nកំហុស: {e}", chat_id=chat_id, message_id=msg.message_id)
     finally:
+        if pipeline: pipeline.discard()
         for path in file_paths:
             if os.path.exists(path): os.remove(path)
         if os.path.exists(output_path): os.remove(output_path)
@@ -171,16 +2177,20 @@ async def img_to_pdf_task(chat_id, file_paths, msg, context):
             try: await context.bot.delete_message(chat_id=chat_id, message_id=msg.message_id)
             except Exception: pass
 
-async def img_to_text_task(chat_id, file_path, msg, context):
+async def img_to_text_task(chat_id, file_path, msg, context, lang='khm+eng', psm=OCR_DEFAULT_PSM, cache_key=None):
     try:
-        image = Image.open(file_path)
-        text = pytesseract.image_to_string(image, lang='khm+eng')
+        stats = await run_cpu_bound(engine.ocr_image, file_path, lang, psm)
+        text = stats.pop('text')
+        logging.info("OCR %s: %s", file_path, stats)
+        if 'raw_ocr_seconds' in stats:
+            saved = stats['raw_ocr_seconds'] - stats['preprocess_seconds'] - stats['ocr_seconds']
+            logging.info("OCR preprocessing saved %.2fs on %s", saved, file_path)
         await context.bot.edit_message_text("បំប្លែងរូបភាពទៅជាអក្សរបានជោគជ័យ! កំពុងផ្ញើ...", chat_id=chat_id, message_id=msg.message_id)
-        if not text.strip():
-            await context.bot.send_message(chat_id=chat_id, text="មិនអាចរកឃើញអក្សរនៅក្នុងរូបភាពនេះទេ ឬរូបភាពគ្មានគុណភាពល្អ។")
-        else:
-            await context.bot.send_message(chat_id=chat_id, text=f"**លទ្ធផលដែលបានបំប្លែង៖**\n\n```\n{text}\n```", parse_mode='Markdown')
+        await send_text_result(context, chat_id, text)
+        if text.strip():
+            await store_result(cache_key, text=text)
     except Exception as e:
+        record_failure(e)
         await context.bot.edit_message_text(f"មានបញ្ហាក្នុងការបំប្លែងរូបភាពទៅជាអក្សរ។\nកំហុស: {e}", chat_id=chat_id, message_id=msg.message_id)
     finally:
         if os.path.exists(file_path): os.remove(file_path)
@@ -188,19 +2198,135 @@ async def img_to_text_task(chat_id, file_path, msg, context):
             try: await context.bot.delete_message(chat_id=chat_id, message_id=msg.message_id)
             except Exception: pass
 
-async def media_conversion_task(chat_id, file_path, output_format, msg, context, media_type='audio'):
-    output_path = f"converted_{chat_id}.{output_format}"
+async def ocr_document_task(chat_id, file_paths, msg, context, output='txt', lang=OCR_LANG):
+    work_dir = tempfile.mkdtemp(prefix="ocr_", dir=os.path.dirname(file_paths[0]))
+    status = StatusMessage(context, chat_id, msg)
+    tasks = []
+    try:
+        # ប្រភពនីមួយៗ៖ PDF (ច្រើនទំព័រ) ឬរូបភាព (មួយទំព័រ)
+        sources = []
+        for path in file_paths:
+            pages = await run_io_bound(engine.pdf_page_count, path) if path.lower().endswith('.pdf') else None
+            sources.append((path, pages))
+        total = sum(pages or 1 for _, pages in sources)
+        record_units('pages', total)
+        await status.update(f"កំពុងអានអក្សរពី {total} ទំព័រ...", force=True)
+        # កំណត់ចំនួនក្រុមដែលកំពុងដំណើរការ ដើម្បីកុំឱ្យទំព័រដែលបានបំប្លែងរួចគរលើ Disk
+        slots = asyncio.Semaphore(CPU_WORKERS)
+        done = 0
+
+        async def ocr(batch_no, image_paths, dpi, rendered):
+            nonlocal done
+            try:
+                result = await run_cpu_bound(engine.ocr_batch, image_paths, lang, output, os.path.join(work_dir, f"batch{batch_no:05d}"), dpi)
+            finally:
+                slots.release()
+                if rendered:
+                    for path in image_paths:
+                        if os.path.exists(path): os.remove(path)
+            done += len(image_paths)
+            await status.update(f"កំពុងអានអក្សរ... {done}/{total} ទំព័រ")
+            return result
+
+        def submit(image_paths, dpi=None, rendered=False):
+            tasks.append(asyncio.create_task(ocr(len(tasks), image_paths, dpi, rendered)))
+
+        images = []
+        for path, pages in sources:
+            if pages is None:
+                images.append(path)
+                if len(images) == OCR_BATCH_PAGES:
+                    await slots.acquire()
+                    submit(images)
+                    images = []
+                continue
+            if images:
+                await slots.acquire()
+                submit(images)
+                images = []
+            for first in range(1, pages + 1, OCR_BATCH_PAGES):
+                await slots.acquire()
+                try:
+                    rendered = await run_io_bound(engine.render_pdf_window, path, 'png', first, min(first + OCR_BATCH_PAGES - 1, pages), work_dir, OCR_DPI, True)
+                except BaseException:
+                    slots.release()
+                    raise
+                submit(rendered, OCR_DPI, rendered=True)
+        if images:
+            await slots.acquire()
+            submit(images)
+        results = await asyncio.gather(*tasks)
+
+        if output == 'pdf':
+            output_path = os.path.join(work_dir, "OCR.pdf")
+            await status.update("កំពុងបង្កើត PDF ដែលអាចស្វែងរកបាន...", force=True)
+            # ឯកសារ batch ជាឯកសារបណ្ដោះអាសន្ន ដូច្នេះមិនបង្កើត Bookmark សម្រាប់វាទេ
+            await run_cpu_bound(engine.merge_pdfs, results, output_path, False)
+            filename = "OCR.pdf"
+        else:
+            texts = [text for batch in results for text in batch]
+            if not any(text.strip() for text in texts):
+                await context.bot.send_message(chat_id=chat_id, text="មិនអាចរកឃើញអក្សរនៅក្នុងឯកសារនេះទេ ឬរូបភាពគ្មានគុណភាពល្អ។")
+                return
+            output_path = os.path.join(work_dir, "OCR.txt")
+            await run_io_bound(_write_text, output_path, engine.ocr_text_body(texts))
+            filename = "OCR.txt"
+        content = await upload_file(output_path)
+        await send_with_retry(chat_id, lambda: context.bot.send_document(chat_id=chat_id, document=content, filename=filename))
+    except Exception as e:
+        record_failure(e)
+        await context.bot.edit_message_text(f"មានបញ្ហាក្នុងការអានអក្សរពីឯកសារ។\nកំហុស: {e}", chat_id=chat_id, message_id=msg.message_id)
+    finally:
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+        for path in file_paths:
+            if os.path.exists(path): os.remove(path)
+        shutil.rmtree(work_dir, ignore_errors=True)
+        if msg: 
+            try: await context.bot.delete_message(chat_id=chat_id, message_id=msg.message_id)
+            except Exception: pass
+
+async def media_conversion_task(chat_id, file_path, output_format, msg, context, media_type='audio', cache_key=None):
+    output_path = workspace_path(file_path, f"converted.{output_format}")
+    status = StatusMessage(context, chat_id, msg)
     try:
-        await context.bot.edit_message_text(f"កំពុងបំប្លែងទៅជា {output_format.upper()}... ការងារនេះអាចត្រូវការពេលវេលាយូរបន្តិចសម្រាប់ឯកសារធំៗ។", chat_id=chat_id, message_id=msg.message_id)
-        ffmpeg.input(file_path).output(output_path).run(overwrite_output=True)
+        label = output_format.upper()
+        await status.update(f"កំពុងបំប្លែងទៅជា {label}... ការងារនេះអាចត្រូវការពេលវេលាយូរបន្តិចសម្រាប់ឯកសារធំៗ។", force=True)
+        probe = await run_io_bound(engine.probe_media, file_path)
+        duration = engine.media_duration(probe)
+        output_kwargs, plan = engine.build_media_plan(probe, output_format, media_type, os.path.getsize(file_path),
+                                                      TELEGRAM_UPLOAD_LIMIT, media_threads())
+        logging.info("Media plan for %s → %s: %s", file_path, output_format, ", ".join(plan) or "ffmpeg defaults")
+        if plan and all(": copy" in step for step in plan):
+            await status.update(f"⚡ កំពុងប្ដូរទៅជា {label} ដោយមិនចាំបាច់បំប្លែងឡើងវិញ...", force=True)
+        started = time.monotonic()
+
+        async def on_progress(position):
+            if not duration or position <= 0:
+                return
+            percent = min(position / duration, 1.0)
+            remaining = (time.monotonic() - started) * (1 - percent) / percent
+            await status.update(f"កំពុងបំប្លែងទៅជា {label}... {int(percent * 100)}%\nនៅសល់ប្រហែល {format_wait(remaining)}")
+
+        await run_ffmpeg(ffmpeg.input(file_path).output(output_path, **output_kwargs), on_progress)
         await context.bot.edit_message_text("បំប្លែងបានជោគជ័យ! កំពុងផ្ញើ...", chat_id=chat_id, message_id=msg.message_id)
+        message = None
         if media_type == 'audio':
-            await context.bot.send_audio(chat_id=chat_id, audio=open(output_path, 'rb'))
+            message = await context.bot.send_audio(chat_id=chat_id, audio=await upload_file(output_path))
         elif media_type == 'video':
-            await context.bot.send_video(chat_id=chat_id, video=open(output_path, 'rb'))
+            message = await context.bot.send_video(chat_id=chat_id, video=await upload_file(output_path))
+        if message is not None:
+            await store_result(cache_key, [cached_item(message)])
+    except MediaJobTimeout as e:
+        record_failure(e)
+        await context.bot.send_message(chat_id=chat_id, text="⏱️ ការបំប្លែងនេះចំណាយពេលយូរពេក ហើយត្រូវបានបញ្ឈប់។ សូមសាកល្បងជាមួយឯកសារតូចជាងនេះ។")
     except ffmpeg.Error as e:
-        await context.bot.edit_message_text(f"មានបញ្ហាក្នុងការបំប្លែងឯកសារ។ FFmpeg error:\n`{e.stderr.decode()}`", chat_id=chat_id, message_id=msg.message_id, parse_mode='Markdown')
+        record_failure(e)
+        error_text = e.stderr.decode(errors='ignore').replace('`', "'")[-3000:]
+        await context.bot.edit_message_text(f"មានបញ្ហាក្នុងការបំប្លែងឯកសារ។ FFmpeg error:\n`{error_text}`", chat_id=chat_id, message_id=msg.message_id, parse_mode='Markdown')
     except Exception as e:
+        record_failure(e)
         await context.bot.edit_message_text(f"មានបញ្ហាដែលមិនបានរំពឹងទុក។\nកំហុស: {e}", chat_id=chat_id, message_id=msg.message_id)
     finally:
         if os.path.exists(file_path): os.remove(file_path)
@@ -209,58 +2335,108 @@ async def media_conversion_task(chat_id, file_path, output_format, msg, context,
             try: await context.bot.delete_message(chat_id=chat_id, message_id=msg.message_id)
             except Exception: pass
 
-async def create_zip_task(chat_id, file_paths, msg, context):
-    output_path = f"archive_{chat_id}.zip"
+async def create_zip_task(chat_id, file_paths, msg, context, archive_format='zip', level='normal', pipeline_id=None):
+    label, _, extension = ARCHIVE_FORMATS[archive_format]
+    # ឯកសារបញ្ចូលរក្សាឈ្មោះដើម ដូច្នេះ Archive ត្រូវនៅក្នុងថតរងដាច់ដោយឡែក ដើម្បីកុំឱ្យជាន់ ឬបង្រួមខ្លួនឯង
+    output_dir = tempfile.mkdtemp(prefix="archive_", dir=os.path.dirname(file_paths[0]))
+    output_path = os.path.join(output_dir, f"archive{extension}")
+    pipeline = take_pipeline(pipeline_id)
     try:
-        await context.bot.edit_message_text("កំពុងបង្កើតឯកសារ ZIP...", chat_id=chat_id, message_id=msg.message_id)
-        with zipfile.ZipFile(output_path, 'w') as zipf:
-            for file_path in file_paths:
-                zipf.write(file_path, os.path.basename(file_path))
-        await context.bot.edit_message_text("បង្កើតឯកសារ ZIP បានជោគជ័យ! កំពុងផ្ញើ...", chat_id=chat_id, message_id=msg.message_id)
-        await context.bot.send_document(chat_id=chat_id, document=open(output_path, 'rb'), filename="archive.zip")
+        await context.bot.edit_message_text(f"កំពុងបង្កើតឯកសារ {label}...", chat_id=chat_id, message_id=msg.message_id)
+        started = time.monotonic()
+        prepared = await pipeline.results() if pipeline else {}
+        # ឯកសារដែលរៀបចំមិនបាន ត្រូវបានជូនដំណឹងរួចហើយ ហើយត្រូវបានរំលង
+        skipped = set(pipeline.failed()) if pipeline else set()
+        archive_paths = [path for path in file_paths if path not in skipped]
+        if not archive_paths: raise ValueError("មិនមានឯកសារត្រឹមត្រូវដើម្បីបង្រួមទេ")
+        # Entry ដែលមិនទាន់បានរៀបចំ (ឬរៀបចំតាមជម្រើសផ្សេង) ត្រូវបានបង្រួមស្របគ្នាក្នុង Process Pool
+        missing = [path for path in archive_paths if not engine.archive_entry_ready(prepared.get(path), path, archive_format, level)]
+        entries = await asyncio.gather(*(run_cpu_bound(engine.archive_entry, path, archive_format, level) for path in missing))
+        prepared.update(zip(missing, entries))
+        record_units('files', len(archive_paths))
+        stats = await run_io_bound(engine.create_archive, archive_paths, output_path, archive_format, level, prepared)
+        original_size, archive_size = stats['input_bytes'], stats['output_bytes']
+        elapsed = time.monotonic() - started
+        ratio = archive_size / original_size * 100 if original_size else 100
+        await context.bot.edit_message_text(f"បង្កើតឯកសារ {label} បានជោគជ័យ! កំពុងផ្ញើ...", chat_id=chat_id, message_id=msg.message_id)
+        await context.bot.send_document(chat_id=chat_id, document=await upload_file(output_path), filename=f"archive{extension}",
+                                        caption=f"📦 {format_size(original_size)} → {format_size(archive_size)} ({ratio:.0f}%) ក្នុងរយៈពេល {elapsed:.1f} វិនាទី")
     except Exception as e:
-        await context.bot.edit_message_text(f"មានបញ្ហាក្នុងការបង្កើតឯកសារ ZIP។\nកំហុស: {e}", chat_id=chat_id, message_id=msg.message_id)
+        record_failure(e)
+        await context.bot.edit_message_text(f"មានបញ្ហាក្នុងការបង្កើតឯកសារ {label}។\nកំហុស: {e}", chat_id=chat_id, message_id=msg.message_id)
     finally:
+        if pipeline: pipeline.discard()
         for path in file_paths:
+            if os.path.exists(path + '.part'): os.remove(path + '.part')
             if os.path.exists(path): os.remove(path)
-        if os.path.exists(output_path): os.remove(output_path)
+        shutil.rmtree(output_dir, ignore_errors=True)
         if msg: 
             try: await context.bot.delete_message(chat_id=chat_id, message_id=msg.message_id)
             except Exception: pass
 
 async def extract_archive_task(chat_id, file_path, msg, context):
-    extract_dir = f"extracted_{chat_id}"
+    # Archive រក្សាឈ្មោះដើម ដូច្នេះថតពន្លាត្រូវមានឈ្មោះដែលមិនអាចជាន់ជាមួយឯកសារដែលបាន Upload
+    extract_dir = tempfile.mkdtemp(prefix="extracted_", dir=os.path.dirname(file_path))
+    archive = None
     try:
-        await context.bot.edit_message_text("កំពុងពន្លាឯកសារ...", chat_id=chat_id, message_id=msg.message_id)
-        os.makedirs(extract_dir, exist_ok=True)
-        if file_path.endswith('.zip'):
-            with zipfile.ZipFile(file_path, 'r') as zip_ref:
-                zip_ref.extractall(extract_dir)
-        elif file_path.endswith('.tar.gz') or file_path.endswith('.tgz'):
-            with tarfile.open(file_path, 'r:gz') as tar_ref:
-                tar_ref.extractall(extract_dir)
-        elif file_path.endswith('.tar'):
-            with tarfile.open(file_path, 'r:') as tar_ref:
-                tar_ref.extractall(extract_dir)
-        else:
-            raise ValueError("មិនគាំទ្រទ្រង់ទ្រាយឯកសារនេះទេ។ សូមផ្ញើតែ ZIP ឬ TAR/TAR.GZ")
-        extracted_files = os.listdir(extract_dir)
-        if not extracted_files: raise ValueError("ឯកសារ Archive គឺទទេ។")
-        await context.bot.edit_message_text(f"ពន្លាបាន {len(extracted_files)} ឯកសារ។ កំពុងផ្ញើ...", chat_id=chat_id, message_id=msg.message_id)
-        for filename in extracted_files:
-            full_path = os.path.join(extract_dir, filename)
-            if os.path.isfile(full_path):
-                 await context.bot.send_document(chat_id=chat_id, document=open(full_path, 'rb'))
+        await context.bot.edit_message_text("កំពុងអានបញ្ជីឯកសារក្នុង Archive...", chat_id=chat_id, message_id=msg.message_id)
+        archive = await run_io_bound(engine.SafeArchive, file_path, TELEGRAM_UPLOAD_LIMIT)
+        entries = archive.entries
+        if not entries: raise ValueError("ឯកសារ Archive គឺទទេ។")
+        skipped = f"\n(បានរំលង {archive.skipped} ធាតុដែលមិនមែនជាឯកសារធម្មតា ឬមិនមានសុវត្ថិភាព)" if archive.skipped else ""
+        selected = [0]
+        if len(entries) > 1:
+            await context.bot.edit_message_text(f"Archive មាន {len(entries)} ឯកសារ ({format_size(archive.total_size)})។ កំពុងរង់ចាំការជ្រើសរើស...{skipped}", chat_id=chat_id, message_id=msg.message_id)
+            labels = [f"{entry['name'][-40:]} ({format_size(entry['size'])})" for entry in entries]
+            selected = await ask_selection(context, chat_id, "សូមជ្រើសរើសឯកសារដែលអ្នកចង់ពន្លា៖", labels)
+        await context.bot.edit_message_text(f"កំពុងពន្លា និងផ្ញើ {len(selected)} ឯកសារ...{skipped}", chat_id=chat_id, message_id=msg.message_id)
+        # Entry នីមួយៗត្រូវបានពន្លាម្ដងមួយ ហើយលុបចោលភ្លាមៗក្រោយពេលផ្ញើ
+        sender = MediaGroupSender(context, chat_id, 'document')
+        for number, index in enumerate(selected):
+            entry = entries[index]
+            output_path = await run_io_bound(archive.extract, index, os.path.join(extract_dir, f"entry_{number:05d}"))
+            caption = entry['name'] if '/' in entry['name'] else None
+            await sender.add(output_path, caption=caption, filename=os.path.basename(entry['name']))
+        await sender.close()
+        record_units('files', len(selected))
         await context.bot.delete_message(chat_id=chat_id, message_id=msg.message_id)
     except Exception as e:
+        record_failure(e)
         await context.bot.edit_message_text(f"មានបញ្ហាក្នុងការពន្លាឯកសារ។\nកំហុស: {e}", chat_id=chat_id, message_id=msg.message_id)
     finally:
+        if archive is not None: archive.close()
         if os.path.exists(file_path): os.remove(file_path)
-        if os.path.isdir(extract_dir): shutil.rmtree(extract_dir)
+        shutil.rmtree(extract_dir, ignore_errors=True)
         if msg: 
             try: await context.bot.delete_message(chat_id=chat_id, message_id=msg.message_id)
             except Exception: pass
 
+# ផែនទីពីឈ្មោះការងារទៅកាន់អនុគមន៍ និងផ្លូវការងាររបស់វា
+JOB_TASKS = {
+    'pdf_to_img': pdf_to_img_task,
+    'merge_pdf': merge_pdf_task,
+    'split_pdf': split_pdf_task,
+    'compress_pdf': compress_pdf_task,
+    'img_to_pdf': img_to_pdf_task,
+    'img_to_text': img_to_text_task,
+    'ocr_document': ocr_document_task,
+    'media': media_conversion_task,
+    'create_zip': create_zip_task,
+    'extract_archive': extract_archive_task,
+}
+JOB_LANES = {
+    'pdf_to_img': 'document',
+    'merge_pdf': 'document',
+    'split_pdf': 'fast',
+    'compress_pdf': 'document',
+    'img_to_pdf': 'document',
+    'img_to_text': 'fast',
+    'ocr_document': 'document',
+    'media': 'media',
+    'create_zip': 'document',
+    'extract_archive': 'document',
+}
+
 # --- អនុគមន៍សម្រាប់គ្រប់គ្រងលំហូរការងារ (រក្សាទុកទាំងអស់ដូចដើម) ---
 
 async def start(update: Update, context: ContextTypes.DEFAULT_TYPE) -> int:
@@ -271,6 +2447,7 @@ async def start(update: Update, context: ContextTypes.DEFAULT_TYPE) -> int:
         [InlineKeyboardButton("📦 បន្ថយទំហំ PDF", callback_data='compress_pdf')],
         [InlineKeyboardButton("🖼️ រូបភាព ទៅជា PDF", callback_data='img_to_pdf')],
         [InlineKeyboardButton("📖 រូបភាព ទៅជា អក្សរ", callback_data='img_to_text')],
+        [InlineKeyboardButton("📚 អានអក្សរពី PDF/រូបភាពច្រើន", callback_data='ocr_document')],
         [InlineKeyboardButton("🎵 បំប្លែងឯកសារសម្លេង", callback_data='audio_converter')],
         [InlineKeyboardButton("🎬 បំប្លែងឯកសារវីដេអូ", callback_data='video_converter')],
         [InlineKeyboardButton("🗜️ គ្រប់គ្រងឯកសារ Archive", callback_data='archive_manager')],
@@ -295,6 +2472,7 @@ async def help_command(update: Update, context: ContextTypes.DEFAULT_TYPE) -> No
 🖼️ **មុខងាររូបភាព:**
 - `/img_to_pdf` បំប្លែងរូបភាពទៅជា PDF
 - `/img_to_text` ដកស្រង់អក្សរពីរូបភាព
+- `/ocr_document` ដកស្រង់អក្សរពី PDF ស្កេន ឬរូបភាពច្រើន
 
 🎵 **មុខងារសម្លេង:**
 - `/audio_converter` បំប្លែង Format សម្លេង
@@ -328,17 +2506,20 @@ async def start_conversion_with_format(update: Update, context: ContextTypes.DEF
     await query.edit_message_text(f"✅ បានជ្រើសរើស {context.user_data['format'].upper()}។\n\nឥឡូវ សូមផ្ញើឯកសារ PDF មួយមកឱ្យខ្ញុំ។ (ទំហំមិនលើស {int(MAX_FILE_SIZE / 1024 / 1024)}MB)")
     return WAITING_PDF_TO_IMG_FILE
 
+@instrument_handler('pdf_to_img')
 async def receive_pdf_for_img(update: Update, context: ContextTypes.DEFAULT_TYPE) -> int:
     doc = update.message.document
     if doc.file_size > MAX_FILE_SIZE:
         await update.message.reply_text(f"❌ កំហុស៖ ឯកសារមានទំហំធំពេក។ សូមផ្ញើឯកសារដែលមានទំហំមិនលើស {int(MAX_FILE_SIZE / 1024 / 1024)}MB។")
         return WAITING_PDF_TO_IMG_FILE
-    file = await doc.get_file()
-    file_path = f"temp_{file.file_id}.pdf"
-    await file.download_to_drive(file_path)
     fmt = context.user_data.get('format', 'jpeg')
+    cache_key = ResultCache.make_key(doc.file_unique_id, 'pdf_to_img', fmt=fmt, dpi=PDF_RENDER_DPI)
+    if await reply_from_cache(update, context, cache_key):
+        return ConversationHandler.END
+    file_path = await download_to_workspace(update, context, doc, f"{doc.file_unique_id}.pdf")
+    if file_path is None: return WAITING_PDF_TO_IMG_FILE
     msg = await update.message.reply_text("✅ ទទួលបានឯកសារ! កំពុងបំប្លែង...")
-    asyncio.create_task(pdf_to_img_task(update.effective_chat.id, file_path, msg, context, fmt))
+    await enqueue_job(update, context, msg, 'pdf_to_img', file_path=file_path, fmt=fmt, cache_key=cache_key)
     return ConversationHandler.END
 
 async def start_merge(update: Update, context: ContextTypes.DEFAULT_TYPE) -> int:
@@ -347,16 +2528,20 @@ async def start_merge(update: Update, context: ContextTypes.DEFAULT_TYPE) -> int
     await query.edit_message_text(f"✅ សូមផ្ញើឯកសារ PDF ម្ដងមួយៗ។ (ទំហំឯកសារនីមួយៗមិនលើស {int(MAX_FILE_SIZE / 1024 / 1024)}MB)\nនៅពេលរួចរាល់ សូមវាយ /done ។")
     return WAITING_FOR_MERGE
 
+@instrument_handler('merge_pdf')
 async def receive_pdf_for_merge(update, context):
     doc = update.message.document
     if doc.file_size > MAX_FILE_SIZE:
         await update.message.reply_text(f"❌ កំហុស៖ ឯកសារនេះទំហំធំពេក។ សូមផ្ញើឯកសារដែលមានទំហំមិនលើស {int(MAX_FILE_SIZE / 1024 / 1024)}MB។")
         return WAITING_FOR_MERGE
-    file = await doc.get_file()
-    file_path = f"temp_{file.file_id}.pdf"
-    await file.download_to_drive(file_path)
+    # ឈ្មោះឯកសារដើមត្រូវបានរក្សាទុក ព្រោះវាក្លាយជា Bookmark ក្នុង PDF លទ្ធផល
+    file_path = await reserve_workspace_file(update, context, doc, doc.file_name or f"{doc.file_unique_id}.pdf")
+    if file_path is None: return WAITING_FOR_MERGE
     if 'merge_files' not in context.user_data: context.user_data['merge_files'] = []
     context.user_data['merge_files'].append(file_path)
+    # ការទាញយកដំណើរការនៅផ្ទៃខាងក្រោយ ដូច្នេះឯកសារបន្ទាប់អាចចាប់ផ្ដើមទាញយកភ្លាម
+    pipeline = user_pipeline(context, engine.inspect_pdf)
+    pipeline.submit(file_path, update.message, download=pipeline.download(file_path, doc))
     count = len(context.user_data['merge_files'])
     await update.message.reply_text(f"បានទទួលឯកសារទី {count}។\nផ្ញើបន្ថែម ឬវាយ /done ។")
     return WAITING_FOR_MERGE
@@ -366,7 +2551,8 @@ async def done_merging(update, context):
         await update.message.reply_text("សូមផ្ញើឯកសារ PDF យ៉ាងហោចណាស់ ២។")
         return WAITING_FOR_MERGE
     msg = await update.message.reply_text("យល់ព្រម! កំពុងបញ្ចូលឯកសារ...")
-    asyncio.create_task(merge_pdf_task(update.effective_chat.id, context.user_data['merge_files'], msg, context))
+    # ការទាញយកដែលនៅសល់ត្រូវបានរង់ចាំក្នុងការងារ (ឬមុនពេលបញ្ចូលទៅ Broker) មិនមែននៅក្នុង Handler នេះទេ
+    await enqueue_job(update, context, msg, 'merge_pdf', file_paths=context.user_data['merge_files'], pipeline_id=context.user_data.get('pipeline_id'))
     context.user_data.clear()
     return ConversationHandler.END
 
@@ -375,60 +2561,100 @@ async def start_split(update: Update, context: ContextTypes.DEFAULT_TYPE) -> int
     await query.edit_message_text(f"✅ សូមផ្ញើឯកសារ PDF មួយដែលអ្នកចង់បំបែក។ (ទំហំមិនលើស {int(MAX_FILE_SIZE / 1024 / 1024)}MB)")
     return WAITING_FOR_SPLIT_FILE
 
+@instrument_handler('split_pdf')
 async def receive_pdf_for_split(update, context):
     doc = update.message.document
     if doc.file_size > MAX_FILE_SIZE:
         await update.message.reply_text(f"❌ កំហុស៖ ឯកសារមានទំហំធំពេក។ សូមផ្ញើឯកសារដែលមានទំហំមិនលើស {int(MAX_FILE_SIZE / 1024 / 1024)}MB។")
         return WAITING_FOR_SPLIT_FILE
-    file = await doc.get_file()
-    file_path = f"temp_{file.file_id}.pdf"
-    await file.download_to_drive(file_path)
+    file_path = await download_to_workspace(update, context, doc, f"{doc.file_unique_id}.pdf")
+    if file_path is None: return WAITING_FOR_SPLIT_FILE
     context.user_data['split_file_path'] = file_path
-    await update.message.reply_text("✅ ទទួលបានឯកសារ។\n\nឥឡូវ សូមវាយបញ្ចូលលេខទំព័រ (ឧ. '2-5' ឬ '1,3,8')។")
+    await update.message.reply_text(f"✅ ទទួលបានឯកសារ។\n\nឥឡូវ សូមវាយបញ្ចូលលេខទំព័រ។ កន្សោមដែលបំបែកដោយ ';' បង្កើតឯកសារច្រើន។\n{SPLIT_RANGE_HELP}")
     return WAITING_FOR_SPLIT_RANGE
 
+@instrument_handler('split_pdf')
 async def receive_split_range(update, context):
     page_range = update.message.text
+    try:
+        engine.parse_page_ranges(page_range)
+    except ValueError as e:
+        await update.message.reply_text(f"❌ {e}\n\n{SPLIT_RANGE_HELP}")
+        return WAITING_FOR_SPLIT_RANGE
     file_path = context.user_data.get('split_file_path')
     msg = await update.message.reply_text("យល់ព្រម! កំពុងបំបែកឯកសារ...")
-    asyncio.create_task(split_pdf_task(update.effective_chat.id, file_path, page_range, msg, context))
+    await enqueue_job(update, context, msg, 'split_pdf', file_path=file_path, page_range_str=page_range)
     context.user_data.clear()
     return ConversationHandler.END
 
+def compression_level_keyboard():
+    keyboard = [[InlineKeyboardButton(settings['label'], callback_data=f"clevel_{level}")] for level, settings in COMPRESSION_LEVELS.items()]
+    keyboard.append([InlineKeyboardButton("⬅️ ត្រឡប់ក្រោយ", callback_data='main_menu')])
+    return InlineKeyboardMarkup(keyboard)
+
 async def start_compress(update: Update, context: ContextTypes.DEFAULT_TYPE) -> int:
     query = update.callback_query; await query.answer()
-    await query.edit_message_text(f"✅ សូមផ្ញើឯកសារ PDF មួយដែលអ្នកចង់បន្ថយទំហំ។ (ទំហំមិនលើស {int(MAX_FILE_SIZE / 1024 / 1024)}MB)")
+    await query.edit_message_text(text="សូមជ្រើសរើសកម្រិតនៃការបន្ថយទំហំ៖", reply_markup=compression_level_keyboard())
+    return SELECT_ACTION
+
+async def select_compression_level(update: Update, context: ContextTypes.DEFAULT_TYPE) -> int:
+    query = update.callback_query; await query.answer()
+    context.user_data['compress_level'] = query.data.split('_')[1]
+    await query.edit_message_text(f"✅ បានជ្រើសរើស {COMPRESSION_LEVELS[context.user_data['compress_level']]['label']}។\n\nឥឡូវ សូមផ្ញើឯកសារ PDF មួយដែលអ្នកចង់បន្ថយទំហំ។ (ទំហំមិនលើស {int(MAX_FILE_SIZE / 1024 / 1024)}MB)")
     return WAITING_FOR_COMPRESS
 
+@instrument_handler('compress_pdf')
 async def receive_pdf_for_compress(update: Update, context: ContextTypes.DEFAULT_TYPE) -> int:
     doc = update.message.document
     if doc.file_size > MAX_FILE_SIZE:
         await update.message.reply_text(f"❌ កំហុស៖ ឯកសារមានទំហំធំពេក។ សូមផ្ញើឯកសារដែលមានទំហំមិនលើស {int(MAX_FILE_SIZE / 1024 / 1024)}MB។")
         return WAITING_FOR_COMPRESS
-    file = await doc.get_file()
-    file_path = f"temp_{file.file_id}.pdf"
-    await file.download_to_drive(file_path)
+    level = context.user_data.get('compress_level', 'medium')
+    cache_key = ResultCache.make_key(doc.file_unique_id, 'compress_pdf', level=level)
+    if await reply_from_cache(update, context, cache_key):
+        return ConversationHandler.END
+    file_path = await download_to_workspace(update, context, doc, f"{doc.file_unique_id}.pdf")
+    if file_path is None: return WAITING_FOR_COMPRESS
     msg = await update.message.reply_text("✅ ទទួលបានឯកសារ! កំពុងបន្ថយទំហំ...")
-    asyncio.create_task(compress_pdf_task(update.effective_chat.id, file_path, msg, context))
+    await enqueue_job(update, context, msg, 'compress_pdf', file_path=file_path, level=level, cache_key=cache_key)
     return ConversationHandler.END
 
+# ជម្រើសទំហំទំព័រសម្រាប់រូបភាពទៅជា PDF៖ (ស្លាក, ទំហំទំព័រ, បន្ថយទំហំរូបភាព)
+IMG_TO_PDF_OPTIONS = {
+    'original': ("📐 ទំហំដើម", 'original', False),
+    'a4': ("📄 A4", 'a4', False),
+    'a4small': ("🗜️ A4 + បន្ថយទំហំ", 'a4', True),
+}
+
+def img_to_pdf_keyboard():
+    return InlineKeyboardMarkup([[InlineKeyboardButton(label, callback_data=f"imgpdf_{key}") for key, (label, _, _) in IMG_TO_PDF_OPTIONS.items()]])
+
 async def start_img_to_pdf(update: Update, context: ContextTypes.DEFAULT_TYPE) -> int:
     query = update.callback_query; await query.answer()
     context.user_data['img_to_pdf_files'] = []
-    await query.edit_message_text("✅ សូមផ្ញើរូបភាពម្ដងមួយៗ។\nនៅពេលរួចរាល់ សូមវាយ /done ។")
+    await query.edit_message_text("✅ សូមផ្ញើរូបភាពម្ដងមួយៗ។\nនៅពេលរួចរាល់ សូមវាយ /done ។\n(ជាជម្រើស៖ ជ្រើសរើសទំហំទំព័រខាងក្រោម)", reply_markup=img_to_pdf_keyboard())
+    return WAITING_FOR_IMG_TO_PDF
+
+async def select_img_to_pdf_option(update: Update, context: ContextTypes.DEFAULT_TYPE) -> int:
+    query = update.callback_query; await query.answer()
+    key = query.data.split('_', 1)[1]
+    context.user_data['img_to_pdf_option'] = key
+    await query.edit_message_text(f"✅ បានជ្រើសរើស {IMG_TO_PDF_OPTIONS[key][0]}។\n\nសូមផ្ញើរូបភាពម្ដងមួយៗ។ នៅពេលរួចរាល់ សូមវាយ /done ។")
     return WAITING_FOR_IMG_TO_PDF
 
+@instrument_handler('img_to_pdf')
 async def receive_img_for_pdf(update: Update, context: ContextTypes.DEFAULT_TYPE) -> int:
     file_obj = update.message.photo[-1] if update.message.photo else update.message.document
     if not file_obj:
          await update.message.reply_text("សូមផ្ញើរូបភាពជា File ឬ Photo។")
          return WAITING_FOR_IMG_TO_PDF
          
-    file = await file_obj.get_file()
-    file_path = f"temp_{file.file_id}.jpg"
-    await file.download_to_drive(file_path)
+    file_path = await download_to_workspace(update, context, file_obj, f"{file_obj.file_unique_id}.jpg")
+    if file_path is None: return WAITING_FOR_IMG_TO_PDF
     if 'img_to_pdf_files' not in context.user_data: context.user_data['img_to_pdf_files'] = []
     context.user_data['img_to_pdf_files'].append(file_path)
+    _, _, downscale = IMG_TO_PDF_OPTIONS[context.user_data.get('img_to_pdf_option', 'original')]
+    user_pipeline(context, engine.prepare_pdf_fragment).submit(file_path, update.message, IMG_TO_PDF_MAX_SIDE if downscale else 0)
     count = len(context.user_data['img_to_pdf_files'])
     await update.message.reply_text(f"បានទទួលរូបភាពទី {count}។\nផ្ញើបន្ថែម ឬវាយ /done ។")
     return WAITING_FOR_IMG_TO_PDF
@@ -437,16 +2663,38 @@ async def done_img_to_pdf(update: Update, context: ContextTypes.DEFAULT_TYPE) ->
     if 'img_to_pdf_files' not in context.user_data or len(context.user_data['img_to_pdf_files']) < 1:
         await update.message.reply_text("សូមផ្ញើរូបភាពយ៉ាងហោចណាស់មួយ។")
         return WAITING_FOR_IMG_TO_PDF
+    _, page_size, downscale = IMG_TO_PDF_OPTIONS[context.user_data.get('img_to_pdf_option', 'original')]
     msg = await update.message.reply_text("យល់ព្រម! កំពុងបំប្លែងរូបភាពទៅជា PDF...")
-    asyncio.create_task(img_to_pdf_task(update.effective_chat.id, context.user_data['img_to_pdf_files'], msg, context))
+    await enqueue_job(update, context, msg, 'img_to_pdf', file_paths=context.user_data['img_to_pdf_files'], page_size=page_size, downscale=downscale, pipeline_id=context.user_data.get('pipeline_id'))
     context.user_data.clear()
     return ConversationHandler.END
 
+# របៀបបែងចែកទំព័ររបស់ tesseract (Page Segmentation Mode)
+OCR_PSM_OPTIONS = {
+    3: "🤖 ស្វ័យប្រវត្តិ",
+    6: "📄 ប្លុកអក្សរតែមួយ",
+    4: "🧾 វិក្កយបត្រ/តារាង",
+    7: "➖ បន្ទាត់តែមួយ",
+    11: "✳️ អក្សររាយប៉ាយ",
+}
+
+def psm_keyboard():
+    buttons = [InlineKeyboardButton(label, callback_data=f"psm_{psm}") for psm, label in OCR_PSM_OPTIONS.items()]
+    return InlineKeyboardMarkup([buttons[i:i + 2] for i in range(0, len(buttons), 2)])
+
 async def start_img_to_text(update: Update, context: ContextTypes.DEFAULT_TYPE) -> int:
     query = update.callback_query; await query.answer()
-    await query.edit_message_text("✅ សូមផ្ញើរូបភាពមួយមកឱ្យខ្ញុំ ដើម្បីបំប្លែងទៅជាអក្សរ។\nដើម្បីបោះបង់ សូមវាយ /cancel")
+    await query.edit_message_text("✅ សូមផ្ញើរូបភាពមួយមកឱ្យខ្ញុំ ដើម្បីបំប្លែងទៅជាអក្សរ។\n(ជាជម្រើស៖ ជ្រើសរើសប្រភេទប្លង់អក្សរខាងក្រោមជាមុនសិន)\nដើម្បីបោះបង់ សូមវាយ /cancel", reply_markup=psm_keyboard())
+    return WAITING_FOR_IMG_TO_TEXT_FILE
+
+async def select_ocr_psm(update: Update, context: ContextTypes.DEFAULT_TYPE) -> int:
+    query = update.callback_query; await query.answer()
+    psm = int(query.data.split('_')[1])
+    context.user_data['ocr_psm'] = psm
+    await query.edit_message_text(f"✅ បានជ្រើសរើស {OCR_PSM_OPTIONS.get(psm, psm)}។\n\nឥឡូវ សូមផ្ញើរូបភាពមួយមកឱ្យខ្ញុំ។")
     return WAITING_FOR_IMG_TO_TEXT_FILE
 
+@instrument_handler('img_to_text')
 async def receive_img_for_text(update: Update, context: ContextTypes.DEFAULT_TYPE) -> int:
     file_obj = update.message.photo[-1] if update.message.photo else update.message.document
     if not file_obj:
@@ -455,11 +2703,62 @@ async def receive_img_for_text(update: Update, context: ContextTypes.DEFAULT_TYP
     if file_obj.file_size > MAX_FILE_SIZE:
         await update.message.reply_text(f"❌ កំហុស៖ រូបភាពមានទំហំធំពេក (មិនលើស {int(MAX_FILE_SIZE / 1024 / 1024)}MB)។")
         return WAITING_FOR_IMG_TO_TEXT_FILE
-    file = await file_obj.get_file()
-    file_path = f"temp_{file.file_id}.jpg"
-    await file.download_to_drive(file_path)
+    lang = 'khm+eng'
+    psm = context.user_data.get('ocr_psm', OCR_DEFAULT_PSM)
+    cache_key = ResultCache.make_key(file_obj.file_unique_id, 'img_to_text', lang=lang, psm=psm, preprocess=OCR_PREPROCESS)
+    if await reply_from_cache(update, context, cache_key):
+        return ConversationHandler.END
+    file_path = await download_to_workspace(update, context, file_obj, f"{file_obj.file_unique_id}.jpg")
+    if file_path is None: return WAITING_FOR_IMG_TO_TEXT_FILE
     msg = await update.message.reply_text("✅ ទទួលបានរូបភាព! កំពុងបំប្លែងទៅជាអក្សរ...")
-    asyncio.create_task(img_to_text_task(update.effective_chat.id, file_path, msg, context))
+    await enqueue_job(update, context, msg, 'img_to_text', file_path=file_path, lang=lang, psm=psm, cache_key=cache_key)
+    return ConversationHandler.END
+
+def ocr_output_keyboard():
+    return InlineKeyboardMarkup([
+        [InlineKeyboardButton("📝 ឯកសារអក្សរ (.txt)", callback_data='ocrout_txt')],
+        [InlineKeyboardButton("📄 PDF ដែលអាចស្វែងរកបាន", callback_data='ocrout_pdf')],
+        [InlineKeyboardButton("⬅️ ត្រឡប់ក្រោយ", callback_data='main_menu')]
+    ])
+
+async def start_ocr_document(update: Update, context: ContextTypes.DEFAULT_TYPE) -> int:
+    query = update.callback_query; await query.answer()
+    await query.edit_message_text(text="សូមជ្រើសរើសទម្រង់លទ្ធផល៖", reply_markup=ocr_output_keyboard())
+    return SELECT_ACTION
+
+async def select_ocr_output(update: Update, context: ContextTypes.DEFAULT_TYPE) -> int:
+    query = update.callback_query; await query.answer()
+    context.user_data['ocr_output'] = query.data.split('_')[1]
+    context.user_data['ocr_files'] = []
+    await query.edit_message_text(f"✅ សូមផ្ញើ PDF ស្កេន ឬរូបភាពម្ដងមួយៗ។ (ទំហំឯកសារនីមួយៗមិនលើស {int(MAX_FILE_SIZE / 1024 / 1024)}MB)\nនៅពេលរួចរាល់ សូមវាយ /done ។")
+    return WAITING_FOR_OCR_FILES
+
+@instrument_handler('ocr_document')
+async def receive_file_for_ocr(update: Update, context: ContextTypes.DEFAULT_TYPE) -> int:
+    file_obj = update.message.photo[-1] if update.message.photo else update.message.document
+    if not file_obj:
+        await update.message.reply_text("សូមផ្ញើ PDF ឬរូបភាព។")
+        return WAITING_FOR_OCR_FILES
+    if file_obj.file_size > MAX_FILE_SIZE:
+        await update.message.reply_text(f"❌ កំហុស៖ ឯកសារនេះទំហំធំពេក។ សូមផ្ញើឯកសារដែលមានទំហំមិនលើស {int(MAX_FILE_SIZE / 1024 / 1024)}MB។")
+        return WAITING_FOR_OCR_FILES
+    is_pdf = getattr(file_obj, 'mime_type', None) == 'application/pdf'
+    file_path = await download_to_workspace(update, context, file_obj, f"{file_obj.file_unique_id}.pdf" if is_pdf else f"{file_obj.file_unique_id}.jpg")
+    if file_path is None: return WAITING_FOR_OCR_FILES
+    if 'ocr_files' not in context.user_data: context.user_data['ocr_files'] = []
+    context.user_data['ocr_files'].append(file_path)
+    count = len(context.user_data['ocr_files'])
+    await update.message.reply_text(f"បានទទួលឯកសារទី {count}។\nផ្ញើបន្ថែម ឬវាយ /done ។")
+    return WAITING_FOR_OCR_FILES
+
+async def done_ocr(update: Update, context: ContextTypes.DEFAULT_TYPE) -> int:
+    if not context.user_data.get('ocr_files'):
+        await update.message.reply_text("សូមផ្ញើ PDF ឬរូបភាពយ៉ាងហោចណាស់មួយ។")
+        return WAITING_FOR_OCR_FILES
+    msg = await update.message.reply_text("យល់ព្រម! កំពុងអានអក្សរ...")
+    await enqueue_job(update, context, msg, 'ocr_document', file_paths=context.user_data['ocr_files'],
+                      output=context.user_data.get('ocr_output', 'txt'), lang=OCR_LANG)
+    context.user_data.clear()
     return ConversationHandler.END
 
 def create_format_buttons(formats, prefix, columns=3):
@@ -486,6 +2785,7 @@ async def select_audio_output(update: Update, context: ContextTypes.DEFAULT_TYPE
     await query.edit_message_text(f"✅ បានជ្រើសរើស {context.user_data['output_format'].upper()}។\n\nឥឡូវ សូមផ្ញើឯកសារសម្លេងមកឱ្យខ្ញុំ។ (ទំហំមិនលើស {int(MAX_FILE_SIZE / 1024 / 1024)}MB)")
     return WAITING_FOR_AUDIO_FILE
 
+@instrument_handler('media')
 async def receive_audio_for_conversion(update: Update, context: ContextTypes.DEFAULT_TYPE) -> int:
     file_obj = update.message.audio or update.message.document
     if not file_obj:
@@ -494,12 +2794,14 @@ async def receive_audio_for_conversion(update: Update, context: ContextTypes.DEF
     if file_obj.file_size > MAX_FILE_SIZE:
         await update.message.reply_text(f"❌ កំហុស៖ ឯកសារមានទំហំធំពេក។ សូមផ្ញើឯកសារដែលមានទំហំមិនលើស {int(MAX_FILE_SIZE / 1024 / 1024)}MB។")
         return WAITING_FOR_AUDIO_FILE
-    file = await file_obj.get_file()
-    file_path = f"temp_{file.file_id}"
-    await file.download_to_drive(file_path)
     output_format = context.user_data.get('output_format', 'mp3')
+    cache_key = ResultCache.make_key(file_obj.file_unique_id, 'media', output_format=output_format, media_type='audio')
+    if await reply_from_cache(update, context, cache_key):
+        return ConversationHandler.END
+    file_path = await download_to_workspace(update, context, file_obj, file_obj.file_unique_id)
+    if file_path is None: return WAITING_FOR_AUDIO_FILE
     msg = await update.message.reply_text("✅ ទទួលបានឯកសារ! កំពុងបំប្លែង...")
-    asyncio.create_task(media_conversion_task(update.effective_chat.id, file_path, output_format, msg, context, media_type='audio'))
+    await enqueue_job(update, context, msg, 'media', file_path=file_path, output_format=output_format, media_type='audio', cache_key=cache_key)
     return ConversationHandler.END
 
 async def start_video_converter(update: Update, context: ContextTypes.DEFAULT_TYPE) -> int:
@@ -519,6 +2821,7 @@ async def select_video_output(update: Update, context: ContextTypes.DEFAULT_TYPE
     await query.edit_message_text(f"✅ បានជ្រើសរើស {context.user_data['output_format'].upper()}។\n\nឥឡូវ សូមផ្ញើវីដេអូមកឱ្យខ្ញុំ។ (ទំហំមិនលើស {int(MAX_FILE_SIZE / 1024 / 1024)}MB)")
     return WAITING_FOR_VIDEO_FILE
 
+@instrument_handler('media')
 async def receive_video_for_conversion(update: Update, context: ContextTypes.DEFAULT_TYPE) -> int:
     file_obj = update.message.video or update.message.document
     if not file_obj:
@@ -527,12 +2830,14 @@ async def receive_video_for_conversion(update: Update, context: ContextTypes.DEF
     if file_obj.file_size > MAX_FILE_SIZE:
         await update.message.reply_text(f"❌ កំហុស៖ ឯកសារមានទំហំធំពេក។ សូមផ្ញើឯកសារដែលមានទំហំមិនលើស {int(MAX_FILE_SIZE / 1024 / 1024)}MB។")
         return WAITING_FOR_VIDEO_FILE
-    file = await file_obj.get_file()
-    file_path = f"temp_{file.file_id}"
-    await file.download_to_drive(file_path)
     output_format = context.user_data.get('output_format', 'mp4')
+    cache_key = ResultCache.make_key(file_obj.file_unique_id, 'media', output_format=output_format, media_type='video')
+    if await reply_from_cache(update, context, cache_key):
+        return ConversationHandler.END
+    file_path = await download_to_workspace(update, context, file_obj, file_obj.file_unique_id)
+    if file_path is None: return WAITING_FOR_VIDEO_FILE
     msg = await update.message.reply_text(f"✅ ទទួលបានវីដេអូ! កំពុងបំប្លែង...")
-    asyncio.create_task(media_conversion_task(update.effective_chat.id, file_path, output_format, msg, context, media_type='video'))
+    await enqueue_job(update, context, msg, 'media', file_path=file_path, output_format=output_format, media_type='video', cache_key=cache_key)
     return ConversationHandler.END
 
 async def start_archive_manager(update: Update, context: ContextTypes.DEFAULT_TYPE) -> int:
@@ -545,22 +2850,37 @@ async def start_archive_manager(update: Update, context: ContextTypes.DEFAULT_TY
     await query.edit_message_text(text="សូមជ្រើសរើសសកម្មភាពសម្រាប់ Archive៖", reply_markup=InlineKeyboardMarkup(keyboard))
     return SELECT_ACTION
 
+def archive_options_keyboard(context):
+    fmt = context.user_data.get('archive_format', 'zip')
+    level = context.user_data.get('archive_level', 'normal')
+    formats = [InlineKeyboardButton(("✅ " if key == fmt else "") + label, callback_data=f"zipfmt_{key}") for key, (label, _, _) in ARCHIVE_FORMATS.items()]
+    levels = [InlineKeyboardButton(("✅ " if key == level else "") + label, callback_data=f"ziplvl_{key}") for key, (label, _) in ARCHIVE_LEVELS.items()]
+    return InlineKeyboardMarkup([formats[:3], formats[3:], levels])
+
 async def start_create_zip(update: Update, context: ContextTypes.DEFAULT_TYPE) -> int:
     query = update.callback_query; await query.answer()
     context.user_data['zip_files'] = []
-    await query.edit_message_text(f"✅ សូមផ្ញើឯកសារម្ដងមួយៗដើម្បីបញ្ចូលទៅក្នុង ZIP។ (ទំហំឯកសារនីមួយៗមិនលើស {int(MAX_FILE_SIZE / 1024 / 1024)}MB)\nពេលរួចរាល់ សូមវាយ /done ។")
+    await query.edit_message_text(f"✅ សូមផ្ញើឯកសារម្ដងមួយៗដើម្បីបញ្ចូលទៅក្នុង ZIP។ (ទំហំឯកសារនីមួយៗមិនលើស {int(MAX_FILE_SIZE / 1024 / 1024)}MB)\nពេលរួចរាល់ សូមវាយ /done ។\n(ជាជម្រើស៖ ជ្រើសរើសទ្រង់ទ្រាយ និងកម្រិតបង្រួមខាងក្រោម)", reply_markup=archive_options_keyboard(context))
+    return WAITING_FOR_FILES_TO_ZIP
+
+async def select_archive_option(update: Update, context: ContextTypes.DEFAULT_TYPE) -> int:
+    query = update.callback_query; await query.answer()
+    kind, key = query.data.split('_', 1)
+    context.user_data['archive_format' if kind == 'zipfmt' else 'archive_level'] = key
+    await query.edit_message_text(f"✅ ទ្រង់ទ្រាយ៖ {ARCHIVE_FORMATS[context.user_data.get('archive_format', 'zip')][0]} | កម្រិត៖ {ARCHIVE_LEVELS[context.user_data.get('archive_level', 'normal')][0]}\n\nសូមផ្ញើឯកសារម្ដងមួយៗ។ ពេលរួចរាល់ សូមវាយ /done ។", reply_markup=archive_options_keyboard(context))
     return WAITING_FOR_FILES_TO_ZIP
 
+@instrument_handler('create_zip')
 async def receive_file_for_zip(update: Update, context: ContextTypes.DEFAULT_TYPE):
     doc = update.message.document
     if doc.file_size > MAX_FILE_SIZE:
         await update.message.reply_text(f"❌ កំហុស៖ ឯកសារនេះទំហំធំពេក។ សូមផ្ញើឯកសារដែលមានទំហំមិនលើស {int(MAX_FILE_SIZE / 1024 / 1024)}MB។")
         return WAITING_FOR_FILES_TO_ZIP
-    file = await doc.get_file()
-    file_path = f"temp_{file.file_unique_id}_{doc.file_name}"
-    await file.download_to_drive(file_path)
+    file_path = await download_to_workspace(update, context, doc, doc.file_name)
+    if file_path is None: return WAITING_FOR_FILES_TO_ZIP
     if 'zip_files' not in context.user_data: context.user_data['zip_files'] = []
     context.user_data['zip_files'].append(file_path)
+    user_pipeline(context, engine.archive_entry).submit(file_path, update.message, context.user_data.get('archive_format', 'zip'), context.user_data.get('archive_level', 'normal'))
     count = len(context.user_data['zip_files'])
     await update.message.reply_text(f"បានទទួលឯកសារទី {count}។\nផ្ញើបន្ថែម ឬវាយ /done ។")
     return WAITING_FOR_FILES_TO_ZIP
@@ -569,35 +2889,44 @@ async def done_zipping(update: Update, context: ContextTypes.DEFAULT_TYPE):
     if 'zip_files' not in context.user_data or not context.user_data['zip_files']:
         await update.message.reply_text("សូមផ្ញើឯកសារយ៉ាងហោចណាស់មួយ។")
         return WAITING_FOR_FILES_TO_ZIP
-    msg = await update.message.reply_text("យល់ព្រម! កំពុងបង្កើតឯកសារ ZIP...")
-    asyncio.create_task(create_zip_task(update.effective_chat.id, context.user_data['zip_files'], msg, context))
+    msg = await update.message.reply_text("យល់ព្រម! កំពុងបង្កើតឯកសារ Archive...")
+    await enqueue_job(update, context, msg, 'create_zip', file_paths=context.user_data['zip_files'], archive_format=context.user_data.get('archive_format', 'zip'),
+                      level=context.user_data.get('archive_level', 'normal'), pipeline_id=context.user_data.get('pipeline_id'))
     context.user_data.clear()
     return ConversationHandler.END
 
 async def start_extract_archive(update: Update, context: ContextTypes.DEFAULT_TYPE) -> int:
     query = update.callback_query; await query.answer()
-    await query.edit_message_text(f"✅ សូមផ្ញើឯកសារ Archive (ZIP ឬ TAR.GZ) ដែលអ្នកចង់ពន្លា។ (ទំហំមិនលើស {int(MAX_FILE_SIZE / 1024 / 1024)}MB)")
+    await query.edit_message_text(f"✅ សូមផ្ញើឯកសារ Archive (ZIP, TAR, TAR.GZ, TAR.BZ2 ឬ TAR.XZ) ដែលអ្នកចង់ពន្លា។ (ទំហំមិនលើស {int(MAX_FILE_SIZE / 1024 / 1024)}MB)")
     return WAITING_FOR_ARCHIVE_TO_EXTRACT
 
+@instrument_handler('extract_archive')
 async def receive_archive_to_extract(update: Update, context: ContextTypes.DEFAULT_TYPE):
     doc = update.message.document
     if doc.file_size > MAX_FILE_SIZE:
         await update.message.reply_text(f"❌ កំហុស៖ ឯកសារមានទំហំធំពេក។ សូមផ្ញើឯកសារដែលមានទំហំមិនលើស {int(MAX_FILE_SIZE / 1024 / 1024)}MB។")
         return WAITING_FOR_ARCHIVE_TO_EXTRACT
-    file = await doc.get_file()
-    file_path = f"temp_{file.file_unique_id}_{doc.file_name}"
-    await file.download_to_drive(file_path)
+    file_path = await download_to_workspace(update, context, doc, doc.file_name)
+    if file_path is None: return WAITING_FOR_ARCHIVE_TO_EXTRACT
     msg = await update.message.reply_text("✅ ទទួលបានឯកសារ! កំពុងពន្លា...")
-    asyncio.create_task(extract_archive_task(update.effective_chat.id, file_path, msg, context))
+    await enqueue_job(update, context, msg, 'extract_archive', file_path=file_path)
     return ConversationHandler.END
 
 async def cancel(update: Update, context: ContextTypes.DEFAULT_TYPE) -> int:
+    discard_pipeline(context.user_data.get('pipeline_id'))
+    workspaces.release(context.user_data.get('workspace'))
     context.user_data.clear()
+    cancelled_jobs = job_scheduler.cancel_chat(update.effective_chat.id)
+    if job_broker is not None:
+        cancelled_jobs += await cancel_broker_jobs(context, update.effective_chat.id)
+    text = "ប្រតិបត្តិការត្រូវបានបោះបង់។"
+    if cancelled_jobs:
+        text += f"\nបានបញ្ឈប់ការងារចំនួន {cancelled_jobs}។"
     if update.callback_query:
         await update.callback_query.answer()
-        await update.callback_query.edit_message_text("ប្រតិបត្តិការត្រូវបានបោះបង់។")
+        await update.callback_query.edit_message_text(text)
     else:
-        await update.message.reply_text("ប្រតិបត្តិការត្រូវបានបោះបង់។")
+        await update.message.reply_text(text)
     return ConversationHandler.END
 
 # --- អនុគមន៍ថ្មីសម្រាប់ទទួល Commands ដោយផ្ទាល់ ---
@@ -624,20 +2953,25 @@ async def start_split_command(update: Update, context: ContextTypes.DEFAULT_TYPE
 
 async def start_compress_command(update: Update, context: ContextTypes.DEFAULT_TYPE) -> int:
     """ ចាប់ផ្តើម Compress PDF តាមរយៈ Command """
-    await update.message.reply_text(f"✅ សូមផ្ញើឯកសារ PDF មួយដែលអ្នកចង់បន្ថយទំហំ។ (ទំហំមិនលើស {int(MAX_FILE_SIZE / 1024 / 1024)}MB)")
-    return WAITING_FOR_COMPRESS
+    await update.message.reply_text("សូមជ្រើសរើសកម្រិតនៃការបន្ថយទំហំ៖", reply_markup=compression_level_keyboard())
+    return SELECT_ACTION
 
 async def start_img_to_pdf_command(update: Update, context: ContextTypes.DEFAULT_TYPE) -> int:
     """ ចាប់ផ្តើម Image to PDF តាមរយៈ Command """
     context.user_data['img_to_pdf_files'] = []
-    await update.message.reply_text("✅ សូមផ្ញើរូបភាពម្ដងមួយៗ។\nនៅពេលរួចរាល់ សូមវាយ /done ។")
+    await update.message.reply_text("✅ សូមផ្ញើរូបភាពម្ដងមួយៗ។\nនៅពេលរួចរាល់ សូមវាយ /done ។\n(ជាជម្រើស៖ ជ្រើសរើសទំហំទំព័រខាងក្រោម)", reply_markup=img_to_pdf_keyboard())
     return WAITING_FOR_IMG_TO_PDF
 
 async def start_img_to_text_command(update: Update, context: ContextTypes.DEFAULT_TYPE) -> int:
     """ ចាប់ផ្តើម Image to Text តាមរយៈ Command """
-    await update.message.reply_text("✅ សូមផ្ញើរូបភាពមួយមកឱ្យខ្ញុំ ដើម្បីបំប្លែងទៅជាអក្សរ។\nដើម្បីបោះបង់ សូមវាយ /cancel")
+    await update.message.reply_text("✅ សូមផ្ញើរូបភាពមួយមកឱ្យខ្ញុំ ដើម្បីបំប្លែងទៅជាអក្សរ។\n(ជាជម្រើស៖ ជ្រើសរើសប្រភេទប្លង់អក្សរខាងក្រោមជាមុនសិន)\nដើម្បីបោះបង់ សូមវាយ /cancel", reply_markup=psm_keyboard())
     return WAITING_FOR_IMG_TO_TEXT_FILE
 
+async def start_ocr_document_command(update: Update, context: ContextTypes.DEFAULT_TYPE) -> int:
+    """ ចាប់ផ្តើម OCR ឯកសារច្រើនទំព័រ តាមរយៈ Command """
+    await update.message.reply_text("សូមជ្រើសរើសទម្រង់លទ្ធផល៖", reply_markup=ocr_output_keyboard())
+    return SELECT_ACTION
+
 async def start_audio_converter_command(update: Update, context: ContextTypes.DEFAULT_TYPE) -> int:
     """ ចាប់ផ្តើម Audio Converter តាមរយៈ Command """
     if not is_ffmpeg_installed():
@@ -669,6 +3003,41 @@ async def start_archive_manager_command(update: Update, context: ContextTypes.DE
     return SELECT_ACTION
 
 # --- Main Application Runner (កែប្រែសម្រាប់ Render Webhook) ---
+async def run_webhook_server(application, url_path, webhook_url, secret_token, allowed_updates=None, drop_pending_updates=None):
+    """ដំណើរការ Bot ដោយ Webhook លើ PORT រួមជាមួយ /metrics
+
+    ជំនួស Application.run_webhook ព្រោះ Render បញ្ជូនតែ PORT មួយប៉ុណ្ណោះ ហើយ Webhook Server របស់ PTB
+    មិនអាចបន្ថែមផ្លូវផ្សេងបានទេ។ លំដាប់ចាប់ផ្ដើម/បិទ និង Secret Token ដូចគ្នានឹង run_webhook។
+    """
+    stop = asyncio.Event()
+    loop = asyncio.get_running_loop()
+    for sig in (signal.SIGINT, signal.SIGTERM, signal.SIGABRT):
+        loop.add_signal_handler(sig, stop.set)
+    routes = [(rf"/{url_path}/?", WebhookHandler, {'bot_application': application, 'secret_token': secret_token})]
+    if METRICS_TOKEN:
+        routes.append((r"/metrics", MetricsHandler))
+    server = None
+    try:
+        await application.initialize()
+        if application.post_init:
+            await application.post_init(application)
+        server = HttpApp(routes).listen(PORT, address="0.0.0.0")
+        await application.bot.set_webhook(url=webhook_url, allowed_updates=allowed_updates,
+                                          drop_pending_updates=drop_pending_updates, secret_token=secret_token)
+        await application.start()
+        await stop.wait()
+    finally:
+        # ដូច run_webhook៖ បិទការទទួល Update មុន បន្ទាប់មក stop → post_stop → shutdown → post_shutdown
+        if server is not None:
+            server.stop()
+        if application.running:
+            await application.stop()
+        if application.post_stop:
+            await application.post_stop(application)
+        await application.shutdown()
+        if application.post_shutdown:
+            await application.post_shutdown(application)
+
 def main() -> None:
     # ពិនិត្យ Environment Variables
     if not BOT_TOKEN:
@@ -680,7 +3049,7 @@ def main() -> None:
         # មិនអាចដំណើរការ Webhook ដោយគ្មាន URL ពេញលេញបានទេ។
         sys.exit(1)
 
-    application = Application.builder().token(BOT_TOKEN).read_timeout(30).build()
+    application = application_builder().persistence(SqlitePersistence(STATE_DB_PATH)).concurrent_updates(PerChatUpdateProcessor(CONCURRENT_UPDATES)).post_init(start_background_services).post_shutdown(stop_background_services).build()
     
     # --- Conversation Handler (រក្សាទុកដូចដើម) ---
     conv_handler = ConversationHandler(
@@ -692,6 +3061,7 @@ def main() -> None:
             CommandHandler("compress_pdf", start_compress_command),
             CommandHandler("img_to_pdf", start_img_to_pdf_command),
             CommandHandler("img_to_text", start_img_to_text_command),
+            CommandHandler("ocr_document", start_ocr_document_command),
             CommandHandler("audio_converter", start_audio_converter_command),
             CommandHandler("video_converter", start_video_converter_command),
             CommandHandler("archive_manager", start_archive_manager_command),
@@ -703,8 +3073,11 @@ def main() -> None:
                 CallbackQueryHandler(start_merge, pattern='^merge_pdf$'),
                 CallbackQueryHandler(start_split, pattern='^split_pdf$'),
                 CallbackQueryHandler(start_compress, pattern='^compress_pdf$'),
+                CallbackQueryHandler(select_compression_level, pattern='^clevel_'),
                 CallbackQueryHandler(start_img_to_pdf, pattern='^img_to_pdf$'),
                 CallbackQueryHandler(start_img_to_text, pattern='^img_to_text$'),
+                CallbackQueryHandler(start_ocr_document, pattern='^ocr_document$'),
+                CallbackQueryHandler(select_ocr_output, pattern='^ocrout_'),
                 CallbackQueryHandler(start_audio_converter, pattern='^audio_converter$'),
                 CallbackQueryHandler(select_audio_output, pattern='^audio_'),
                 CallbackQueryHandler(start_video_converter, pattern='^video_converter$'),
@@ -719,32 +3092,39 @@ def main() -> None:
             WAITING_FOR_SPLIT_FILE: [MessageHandler(filters.Document.PDF, receive_pdf_for_split)],
             WAITING_FOR_SPLIT_RANGE: [MessageHandler(filters.TEXT & ~filters.COMMAND, receive_split_range)],
             WAITING_FOR_COMPRESS: [MessageHandler(filters.Document.PDF, receive_pdf_for_compress)],
-            WAITING_FOR_IMG_TO_PDF: [MessageHandler(filters.PHOTO | filters.Document.IMAGE, receive_img_for_pdf), CommandHandler('done', done_img_to_pdf)],
-            WAITING_FOR_IMG_TO_TEXT_FILE: [MessageHandler(filters.PHOTO | filters.Document.IMAGE, receive_img_for_text)],
+            WAITING_FOR_IMG_TO_PDF: [MessageHandler(filters.PHOTO | filters.Document.IMAGE, receive_img_for_pdf), CommandHandler('done', done_img_to_pdf), CallbackQueryHandler(select_img_to_pdf_option, pattern='^imgpdf_')],
+            WAITING_FOR_IMG_TO_TEXT_FILE: [MessageHandler(filters.PHOTO | filters.Document.IMAGE, receive_img_for_text), CallbackQueryHandler(select_ocr_psm, pattern='^psm_')],
+            WAITING_FOR_OCR_FILES: [MessageHandler(filters.PHOTO | filters.Document.IMAGE | filters.Document.PDF, receive_file_for_ocr), CommandHandler('done', done_ocr)],
             WAITING_FOR_AUDIO_FILE: [MessageHandler(filters.AUDIO | filters.Document.ALL, receive_audio_for_conversion)],
             WAITING_FOR_VIDEO_FILE: [MessageHandler(filters.VIDEO | filters.Document.ALL, receive_video_for_conversion)],
-            WAITING_FOR_FILES_TO_ZIP: [MessageHandler(filters.Document.ALL, receive_file_for_zip), CommandHandler('done', done_zipping)],
+            WAITING_FOR_FILES_TO_ZIP: [MessageHandler(filters.Document.ALL, receive_file_for_zip), CommandHandler('done', done_zipping), CallbackQueryHandler(select_archive_option, pattern='^zip(fmt|lvl)_')],
             WAITING_FOR_ARCHIVE_TO_EXTRACT: [MessageHandler(filters.Document.ALL, receive_archive_to_extract)],
         },
         fallbacks=[CommandHandler("cancel", cancel)],
-        allow_reentry=True
+        allow_reentry=True,
+        # រក្សាទុកស្ថានភាព Conversation ដើម្បីឱ្យអ្នកប្រើប្រាស់បន្តពីកន្លែងដែលបានឈប់ បន្ទាប់ពី Bot ចាប់ផ្ដើមឡើងវិញ
+        name="main_conversation",
+        persistent=True
     )
     
     application.add_handler(conv_handler)
+    application.add_handler(CallbackQueryHandler(resolve_choice, pattern='^choice_'))
+    application.add_handler(CallbackQueryHandler(resolve_selection, pattern='^pick_'))
+    # /cancel នៅខាងក្រៅ Conversation សម្រាប់បញ្ឈប់ការងារដែលកំពុងដំណើរការ
+    application.add_handler(CommandHandler("cancel", cancel))
     application.add_handler(CommandHandler("help", help_command))
     
     # --- ការដំណើរការ Webhook សម្រាប់ Render ---
     FULL_WEBHOOK_URL = WEBHOOK_URL + '/' + BOT_TOKEN
     
     print(f">>> Bot កំពុងដំណើរការដោយ Webhook នៅលើ Host: 0.0.0.0, Port: {PORT}, URL_PATH: /{BOT_TOKEN}")
+    if METRICS_TOKEN:
+        print(f">>> Metrics: http://0.0.0.0:{PORT}/metrics (Authorization: Bearer $METRICS_TOKEN)")
     print(f"!!! ត្រូវប្រាកដថាបានកំណត់ Webhook ទៅកាន់ Telegram: {FULL_WEBHOOK_URL}")
+    if job_broker is not None:
+        print(f">>> ការងារត្រូវបានបញ្ជូនទៅ Worker (worker.py) តាមរយៈ {BROKER_DB_PATH}")
     
-    application.run_webhook(
-        listen="0.0.0.0",
-        port=PORT,
-        url_path=BOT_TOKEN,
-        webhook_url=FULL_WEBHOOK_URL
-    )
+    asyncio.run(run_webhook_server(application, BOT_TOKEN, FULL_WEBHOOK_URL, WEBHOOK_SECRET, drop_pending_updates=WEBHOOK_DROP_PENDING))
 
 if __name__ == "__main__":
     main()
\ No newline at end of file
@@ -0,0 +1,44 @@
+# -*- coding: utf-8 -*-
+# Worker Process សម្រាប់ដំណើរការការងារដាច់ដោយឡែកពី Bot (JOB_BROKER=sqlite)
+#
+# Bot (main.py) គ្រាន់តែទទួលឯកសារ ហើយបញ្ចូលការងារទៅក្នុង BROKER_DB_PATH។ Worker នីមួយៗយកការងារតាមផ្លូវការងាររបស់វា
+# ដំណើរការ ហើយរាយការណ៍វឌ្ឍនភាព និងផ្ញើលទ្ធផលតាម Bot API ដោយផ្ទាល់។ ឧទាហរណ៍ Pool ដាច់ដោយឡែកសម្រាប់ Media និង PDF/OCR៖
+#   python worker.py --lanes media --concurrency 1
+#   python worker.py --lanes document,fast --concurrency 4 --metrics-port 9092
+#
+# Bot និង Worker ត្រូវប្រើ BOT_TOKEN, BROKER_DB_PATH និង WORKSPACE_ROOT ដូចគ្នា។
+# GLOBAL_SENDS_PER_SECOND ត្រូវបានអនុវត្តក្នុង Process នីមួយៗ ដូច្នេះសូមចែកវាតាមចំនួន Worker។
+import argparse
+import asyncio
+import os
+import sys
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Worker សម្រាប់ការងាររបស់ Doc Converter Bot")
+    parser.add_argument('--lanes', default=os.environ.get("WORKER_LANES", "fast,document,media"),
+                        help="ផ្លូវការងារដែលត្រូវដំណើរការ បំបែកដោយក្បៀស (fast, document, media)")
+    parser.add_argument('--concurrency', type=int, default=int(os.environ.get("WORKER_CONCURRENCY", "2")),
+                        help="ចំនួនការងារអតិបរមាក្នុងពេលតែមួយ")
+    parser.add_argument('--metrics-port', type=int, default=int(os.environ.get("WORKER_METRICS_PORT", "0")),
+                        help="Port សម្រាប់ Metrics របស់ Worker នេះ (0 = បិទ)")
+    return parser, parser.parse_args(argv)
+
+def main(argv=None):
+    parser, args = parse_args(argv)
+    # ការកំណត់ត្រូវបានអានពេល import main ដូច្នេះត្រូវកំណត់វាមុន
+    os.environ["METRICS_PORT"] = str(args.metrics_port)
+    import main as bot
+
+    lanes = [lane.strip() for lane in args.lanes.split(',') if lane.strip()]
+    unknown = sorted(set(lanes) - set(bot.LANE_PRIORITY))
+    if not lanes or unknown:
+        parser.error(f"ផ្លូវការងារមិនត្រឹមត្រូវ៖ {', '.join(unknown) or args.lanes}")
+    if args.concurrency < 1:
+        parser.error("--concurrency ត្រូវតែធំជាង 0")
+    if not bot.BOT_TOKEN:
+        print("!!! កំហុស៖ BOT_TOKEN មិនត្រូវបានកំណត់។")
+        sys.exit(1)
+    asyncio.run(bot.run_worker(lanes, args.concurrency))
+
+if __name__ == "__main__":
+    main()